@@ -34,10 +34,12 @@ app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
 db.init_app(app)
 
 # Import models after db initialization to avoid circular imports
-from models.vehicle import Vehicle
+from models.vehicle import Vehicle, normalise_registration
 from models.customer import Customer
 from models.reminder import Reminder
 from models.job_sheet import JobSheet
+from models.outbox import OutboxMessage
+from models.reminder_template import ReminderTemplate
 from models.service import Service
 from models.part import Part
 from models.part_usage import PartUsage
@@ -141,6 +143,89 @@ with app.app_context():
             db.session.rollback()
             # Don't raise here as the app can still function without this column
 
+    # Check if we need to add dvla_checked_at, the last DVLA lookup attempt, to vehicles
+    try:
+        db.session.execute(db.text("SELECT dvla_checked_at FROM vehicles LIMIT 1"))
+    except Exception as e:
+        db.session.rollback()
+        logger.info("Adding dvla_checked_at column to vehicles table...")
+        try:
+            db.session.execute(db.text("ALTER TABLE vehicles ADD COLUMN dvla_checked_at DATETIME"))
+            db.session.execute(db.text("UPDATE vehicles SET dvla_checked_at = dvla_verified_at"))
+            db.session.commit()
+            logger.info("Successfully added dvla_checked_at column to vehicles table")
+        except Exception as migration_error:
+            logger.error(f"Error adding dvla_checked_at column: {migration_error}")
+            db.session.rollback()
+
+    # Check if we need to add per-channel delivery status columns to reminders
+    try:
+        db.session.execute(db.text("SELECT email_status, sms_status FROM reminders LIMIT 1"))
+    except Exception as e:
+        db.session.rollback()
+        logger.info("Adding delivery status columns to reminders table...")
+        try:
+            db.session.execute(db.text("ALTER TABLE reminders ADD COLUMN email_status VARCHAR(20)"))
+            db.session.execute(db.text("ALTER TABLE reminders ADD COLUMN sms_status VARCHAR(20)"))
+            db.session.commit()
+            logger.info("Successfully added delivery status columns to reminders table")
+        except Exception as migration_error:
+            logger.error(f"Error adding delivery status columns: {migration_error}")
+            db.session.rollback()
+
+    # Widen reminder_templates.channel from VARCHAR(10) so it holds 'email_digest' and 'sms_digest'
+    # (SQLite does not enforce VARCHAR lengths, so only PostgreSQL needs it)
+    if db.engine.dialect.name == 'postgresql':
+        try:
+            db.session.execute(db.text("ALTER TABLE reminder_templates ALTER COLUMN channel TYPE VARCHAR(20)"))
+            db.session.commit()
+        except Exception as migration_error:
+            logger.error(f"Error widening reminder_templates.channel: {migration_error}")
+            db.session.rollback()
+
+    # Check if we need to add the is_mot flag to job_sheets
+    try:
+        db.session.execute(db.text("SELECT is_mot FROM job_sheets LIMIT 1"))
+        logger.info("Job sheets table schema is up to date")
+    except Exception as e:
+        logger.info("Adding is_mot column to job_sheets table...")
+        try:
+            db.session.execute(db.text("ALTER TABLE job_sheets ADD COLUMN is_mot BOOLEAN NOT NULL DEFAULT FALSE"))
+            # Backfill with the same rule as JobSheet.mot_flag()
+            db.session.execute(db.text("""
+                UPDATE job_sheets
+                SET is_mot = (COALESCE(sub_mot_gross, 0) > 0 OR UPPER(COALESCE(job_description, '')) LIKE '%MOT%')
+            """))
+            db.session.commit()
+            logger.info("Successfully added is_mot column to job_sheets table")
+        except Exception as migration_error:
+            logger.error(f"Error adding is_mot column: {migration_error}")
+            db.session.rollback()
+
+    # Check if we need to add the normalised registration used to match vehicles and job sheets
+    for table, source_column in (('vehicles', 'registration'), ('job_sheets', 'vehicle_reg')):
+        try:
+            db.session.execute(db.text(f"SELECT normalised_reg FROM {table} LIMIT 1"))
+        except Exception as e:
+            db.session.rollback()
+            logger.info(f"Adding normalised_reg column to {table} table...")
+            try:
+                db.session.execute(db.text(f"ALTER TABLE {table} ADD COLUMN normalised_reg VARCHAR(20)"))
+                # Backfill in Python with the same normalise_registration() the models use on write
+                rows = db.session.execute(db.text(
+                    f"SELECT id, {source_column} FROM {table} WHERE {source_column} IS NOT NULL"
+                )).all()
+                if rows:
+                    db.session.execute(
+                        db.text(f"UPDATE {table} SET normalised_reg = :normalised_reg WHERE id = :id"),
+                        [{'id': row_id, 'normalised_reg': normalise_registration(reg)} for row_id, reg in rows]
+                    )
+                db.session.commit()
+                logger.info(f"Successfully added normalised_reg column to {table} table")
+            except Exception as migration_error:
+                logger.error(f"Error adding normalised_reg column to {table}: {migration_error}")
+                db.session.rollback()
+
     # Create new tables for service history and parts management
     try:
         # Check if services table exists
@@ -262,12 +347,51 @@ with app.app_context():
         db.session.execute(db.text("CREATE INDEX IF NOT EXISTS idx_services_date ON services(service_date)"))
         db.session.execute(db.text("CREATE INDEX IF NOT EXISTS idx_parts_number ON parts(part_number)"))
         db.session.execute(db.text("CREATE INDEX IF NOT EXISTS idx_part_usage_service ON part_usage(service_id)"))
+        # Keyset pagination of job sheets walks (date_created, id); supersedes the date-only index
+        db.session.execute(db.text("DROP INDEX IF EXISTS idx_job_sheets_date_created"))
+        db.session.execute(db.text("CREATE INDEX IF NOT EXISTS idx_job_sheets_date_id ON job_sheets(date_created, id)"))
+        db.session.execute(db.text("CREATE INDEX IF NOT EXISTS idx_job_sheets_mot_date ON job_sheets(is_mot, date_created)"))
+        db.session.execute(db.text("CREATE INDEX IF NOT EXISTS idx_vehicles_normalised_reg ON vehicles(normalised_reg)"))
+        # Reminder reconciliation looks up each vehicle's active reminders
+        db.session.execute(db.text("CREATE INDEX IF NOT EXISTS idx_reminders_vehicle_status ON reminders(vehicle_id, status)"))
+        # The reminder scheduler loads scheduled reminders in due order
+        db.session.execute(db.text("CREATE INDEX IF NOT EXISTS idx_reminders_status_date ON reminders(status, reminder_date)"))
+        db.session.execute(db.text("CREATE INDEX IF NOT EXISTS idx_job_sheets_normalised_reg ON job_sheets(normalised_reg)"))
+        # The outbox worker claims due messages by status and retry time
+        db.session.execute(db.text("CREATE INDEX IF NOT EXISTS idx_outbox_status_next_attempt ON outbox_messages(status, next_attempt_at)"))
         db.session.commit()
         logger.info("Successfully created search indexes")
     except Exception as migration_error:
         logger.error(f"Error creating indexes: {migration_error}")
         db.session.rollback()
 
+    # At most one scheduled reminder per vehicle, so creating one can be INSERT ... ON CONFLICT DO NOTHING.
+    # Older duplicates are archived first; once the index exists there are none.
+    try:
+        db.session.execute(db.text("""
+            UPDATE reminders SET status = 'archived', archived_at = CURRENT_TIMESTAMP
+            WHERE status = 'scheduled' AND id NOT IN (
+                SELECT MAX(id) FROM reminders WHERE status = 'scheduled' GROUP BY vehicle_id
+            )
+        """))
+        db.session.execute(db.text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_reminders_one_scheduled ON reminders(vehicle_id) WHERE status = 'scheduled'"
+        ))
+        db.session.commit()
+    except Exception as migration_error:
+        logger.error(f"Error creating scheduled reminder index: {migration_error}")
+        db.session.rollback()
+
+    # Create the full-text indexes over job sheet and service text (SQLite only)
+    try:
+        from services.full_text_search import ensure_full_text_indexes
+        for fts_table in ensure_full_text_indexes():
+            logger.info(f"Created and built full-text index {fts_table}")
+        db.session.commit()
+    except Exception as migration_error:
+        logger.error(f"Error creating full-text indexes: {migration_error}")
+        db.session.rollback()
+
     logger.info("Database initialization completed")
 
 # Serve the main dashboard
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Benchmark SMS dispatch against the fake gateway: one request per message
+sent serially, concurrently, and in bulk requests
+
+Usage: python benchmark_sms_dispatch.py [messages] [latency_seconds]
+"""
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_sms_gateway import FakeSMSGateway
+from services.sms_dispatch import SMSGateway, dispatch_sms
+
+
+def run(label, fake, messages, bulk_size, workers):
+    gateway = SMSGateway(fake.url, 'benchmark', 'Garage', bulk_size=bulk_size, pool_size=workers,
+                         rate_per_second=0)
+    fake.messages.clear()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            start = time.perf_counter()
+            outcomes = dispatch_sms(gateway, messages, executor)
+            elapsed = time.perf_counter() - start
+    finally:
+        gateway.close()
+    assert all(error is None for error in outcomes.values()) and len(fake.messages) == len(messages)
+    print(f"{label:<32} {elapsed:7.2f}s  {gateway.requests_made:6,} requests  "
+          f"{len(messages) / elapsed:8,.0f} msg/s")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    messages = [
+        {'reference': i, 'to': f"07{700000000 + i}", 'message': f"MOT Reminder: vehicle {i} MOT expires soon."}
+        for i in range(count)
+    ]
+
+    fake = FakeSMSGateway(latency=latency).start()
+    print(f"Sending {count:,} SMS to a fake gateway with {latency * 1000:.0f}ms latency per request")
+    try:
+        run("one per request, serial", fake, messages, bulk_size=0, workers=1)
+        run("one per request, 8 workers", fake, messages, bulk_size=0, workers=8)
+        run("bulk of 100, 8 workers", fake, messages, bulk_size=100, workers=8)
+    finally:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
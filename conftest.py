@@ -0,0 +1,16 @@
+"""
+pytest configuration: the tests write reminders, outbox messages and
+vehicles, and some act on every row they find, so they run against a
+throwaway SQLite database (or TEST_DATABASE_URL), never the garage's own
+"""
+
+import os
+import tempfile
+
+TEST_DATABASE = os.path.join(tempfile.gettempdir(), f'mot_reminder_test_{os.getpid()}.db')
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', f'sqlite:///{TEST_DATABASE}')
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if os.path.exists(TEST_DATABASE):
+        os.remove(TEST_DATABASE)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Fake SMS Gateway
+
+A local HTTP server speaking the gateway protocol that services/sms_dispatch.py
+uses, for tests, benchmarks and local development. It records the messages
+it accepts and can add latency, reject numbers and throttle.
+
+Usage: python fake_sms_gateway.py [--port 8025] [--latency 0.05]
+       then set SMS_API_URL=http://127.0.0.1:8025 (and SMS_BULK_SIZE to try bulk)
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeSMSGateway:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        self.latency = latency
+        self.rejected_numbers = set()
+        self.throttle_requests = 0  # Answer this many of the next requests with HTTP 429
+        self.messages = []
+        self.requests = 0
+        self.peak_concurrency = 0
+        self._active = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _accept(self, message):
+        if message.get('to') in self.rejected_numbers:
+            return {'reference': message.get('reference'), 'status': 'rejected', 'error': 'Invalid number'}
+        with self._lock:
+            self.messages.append(message)
+        return {'reference': message.get('reference'), 'status': 'accepted'}
+
+    def _handler(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                with gateway._lock:
+                    gateway.requests += 1
+                    gateway._active += 1
+                    gateway.peak_concurrency = max(gateway.peak_concurrency, gateway._active)
+                    throttled = gateway.throttle_requests > 0
+                    if throttled:
+                        gateway.throttle_requests -= 1
+                try:
+                    if gateway.latency:
+                        time.sleep(gateway.latency)
+                    if throttled:
+                        self._reply(429, {'error': 'Too many requests'})
+                    elif self.path == '/messages':
+                        result = gateway._accept(body)
+                        if result['status'] == 'accepted':
+                            self._reply(200, result)
+                        else:
+                            self._reply(400, result)
+                    elif self.path == '/messages/bulk':
+                        self._reply(200, {'results': [gateway._accept(message) for message in body.get('messages', [])]})
+                    else:
+                        self._reply(404, {'error': 'Not found'})
+                finally:
+                    with gateway._lock:
+                        gateway._active -= 1
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a fake SMS gateway')
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    args = parser.parse_args()
+
+    gateway = FakeSMSGateway(port=args.port, latency=args.latency)
+    print(f"Fake SMS gateway listening on {gateway.url}")
+    try:
+        gateway.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gateway.server.server_close()
+        print(f"Accepted {len(gateway.messages)} messages in {gateway.requests} requests")
+
+
+if __name__ == '__main__':
+    main()
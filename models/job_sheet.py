@@ -1,6 +1,9 @@
 from database import db
 from datetime import datetime, timezone, date
 from decimal import Decimal
+from sqlalchemy.orm import validates
+
+from models.vehicle import normalise_registration
 
 class JobSheet(db.Model):
     __tablename__ = 'job_sheets'
@@ -24,6 +27,7 @@ class JobSheet(db.Model):
     # Vehicle Information
     vehicle_id_external = db.Column(db.String(100))  # ID Vehicle (external system)
     vehicle_reg = db.Column(db.String(20))  # Vehicle Reg
+    normalised_reg = db.Column(db.String(20))  # normalise_registration(vehicle_reg), joins to vehicles.normalised_reg
     make = db.Column(db.String(50))  # Make
     model = db.Column(db.String(50))  # Model
     vin = db.Column(db.String(50))  # VIN
@@ -50,6 +54,7 @@ class JobSheet(db.Model):
     
     # Job Information
     job_description = db.Column(db.Text)  # Job Description
+    is_mot = db.Column(db.Boolean, nullable=False, default=False)  # Set at import from mot_flag(), indexed for analytics
     
     # System fields
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
@@ -63,6 +68,11 @@ class JobSheet(db.Model):
     linked_customer = db.relationship('Customer', backref='job_sheets')
     linked_vehicle = db.relationship('Vehicle', backref='job_sheets')
 
+    @validates('vehicle_reg')
+    def _set_normalised_reg(self, key, vehicle_reg):
+        self.normalised_reg = normalise_registration(vehicle_reg)
+        return vehicle_reg
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -94,6 +104,7 @@ class JobSheet(db.Model):
             'vat': float(self.vat) if self.vat else 0,
             'grand_total': float(self.grand_total) if self.grand_total else 0,
             'job_description': self.job_description,
+            'is_mot': bool(self.is_mot),
             'linked_customer_id': self.linked_customer_id,
             'linked_vehicle_id': self.linked_vehicle_id,
             'created_at': self.created_at.isoformat(),
@@ -111,7 +122,12 @@ class JobSheet(db.Model):
             'is_paid': self.date_paid is not None
         }
 
+    @staticmethod
+    def mot_flag(sub_mot_gross, job_description):
+        """Whether a job includes MOT work: an MOT charge, or 'MOT' in its description"""
+        return bool((sub_mot_gross and float(sub_mot_gross) > 0) or
+                    (job_description and 'MOT' in job_description.upper()))
+
     def is_mot_job(self):
         """Check if this job sheet includes MOT work"""
-        return (self.sub_mot_gross and float(self.sub_mot_gross) > 0) or \
-               (self.job_description and 'MOT' in self.job_description.upper())
+        return self.mot_flag(self.sub_mot_gross, self.job_description)
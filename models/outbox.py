@@ -0,0 +1,49 @@
+from database import db
+from datetime import datetime, timezone
+
+class OutboxMessage(db.Model):
+    """A reminder message waiting to be (or already) delivered by the outbox worker"""
+    __tablename__ = 'outbox_messages'
+
+    id = db.Column(db.Integer, primary_key=True)
+    reminder_id = db.Column(db.Integer, db.ForeignKey('reminders.id'))  # None for digests, see digest_reminders
+    channel = db.Column(db.String(10), nullable=False, default='email')  # email, sms
+    recipient = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255))
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    next_attempt_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    claimed_at = db.Column(db.DateTime)  # When a worker took the message for sending
+    sent_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    # Relationships
+    digest_reminders = db.relationship('OutboxMessageReminder', lazy=True, cascade="all, delete-orphan")
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'reminder_id': self.reminder_id,
+            'is_digest': self.reminder_id is None,
+            'channel': self.channel,
+            'recipient': self.recipient,
+            'subject': self.subject,
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+
+
+class OutboxMessageReminder(db.Model):
+    """A reminder covered by a digest message"""
+    __tablename__ = 'outbox_message_reminders'
+
+    message_id = db.Column(db.Integer, db.ForeignKey('outbox_messages.id'), primary_key=True)
+    reminder_id = db.Column(db.Integer, db.ForeignKey('reminders.id'), primary_key=True, index=True)
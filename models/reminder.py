@@ -7,10 +7,12 @@ class Reminder(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id'), nullable=False)
     reminder_date = db.Column(db.Date, nullable=False)
-    status = db.Column(db.String(20), default='scheduled')  # scheduled, sent, failed, archived
+    status = db.Column(db.String(20), default='scheduled')  # scheduled, queued, sent, failed, archived
     sent_at = db.Column(db.DateTime)
     archived_at = db.Column(db.DateTime)
     review_batch_id = db.Column(db.String(50))  # To group reminders by upload batch
+    email_status = db.Column(db.String(20))  # queued, sent, failed; None if no email was due
+    sms_status = db.Column(db.String(20))  # queued, sent, failed; None if no SMS was due
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
@@ -23,6 +25,8 @@ class Reminder(db.Model):
             'sent_at': self.sent_at.isoformat() if self.sent_at else None,
             'archived_at': self.archived_at.isoformat() if self.archived_at else None,
             'review_batch_id': self.review_batch_id,
+            'email_status': self.email_status,
+            'sms_status': self.sms_status,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
@@ -0,0 +1,23 @@
+from database import db
+from datetime import datetime, timezone
+
+class ReminderTemplate(db.Model):
+    """The saved email or SMS reminder template; without one the built-in default is used"""
+    __tablename__ = 'reminder_templates'
+
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(20), nullable=False, unique=True)  # email, sms, email_digest, sms_digest
+    subject = db.Column(db.String(255))  # Email only
+    body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'channel': self.channel,
+            'subject': self.subject,
+            'template': self.body,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
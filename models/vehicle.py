@@ -1,11 +1,28 @@
+import re
+
 from database import db
 from datetime import datetime, date, timezone
+from sqlalchemy.orm import validates
+
+_NOT_REGISTRATION_CHARACTERS = re.compile(r'[^A-Z0-9]')
+
+
+def normalise_registration(registration):
+    """
+    Canonical registration used for lookups and joins: upper case with
+    spaces and punctuation removed ('ab12 cde' -> 'AB12CDE'); None if blank.
+    """
+    if not registration:
+        return None
+    return _NOT_REGISTRATION_CHARACTERS.sub('', str(registration).upper()) or None
+
 
 class Vehicle(db.Model):
     __tablename__ = 'vehicles'
 
     id = db.Column(db.Integer, primary_key=True)
     registration = db.Column(db.String(20), nullable=False, unique=True)
+    normalised_reg = db.Column(db.String(20))  # normalise_registration(registration), set on write
     make = db.Column(db.String(50))
     model = db.Column(db.String(50))
     color = db.Column(db.String(30))
@@ -15,11 +32,25 @@ class Vehicle(db.Model):
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     dvla_verified_at = db.Column(db.DateTime, nullable=True)  # Track when last verified with DVLA
+    dvla_checked_at = db.Column(db.DateTime, nullable=True)  # Last DVLA lookup, whether or not it found an MOT expiry
 
     # Relationships
     reminders = db.relationship('Reminder', backref='vehicle', lazy=True, cascade="all, delete-orphan")
     services = db.relationship('Service', back_populates='vehicle', lazy=True, cascade="all, delete-orphan", order_by="desc(Service.service_date)")
 
+    @validates('registration')
+    def _set_normalised_reg(self, key, registration):
+        self.normalised_reg = normalise_registration(registration)
+        return registration
+
+    @classmethod
+    def find_by_registration(cls, registration):
+        """The vehicle with this registration, however it is spaced or cased"""
+        normalised = normalise_registration(registration)
+        if normalised is None:
+            return None
+        return cls.query.filter_by(normalised_reg=normalised).order_by(cls.id).first()
+
     def days_until_mot_expiry(self):
         """Calculate days until MOT expiry (negative if expired)"""
         if not self.mot_expiry:
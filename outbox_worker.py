@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Outbox Worker
+
+Delivers queued reminder messages from the outbox table, keeping one SMTP
+session open while there is mail to send. Configure SMTP with SMTP_SERVER,
+SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD, SENDER_EMAIL and SMTP_USE_TLS, and
+the SMS gateway with SMS_API_URL, SMS_API_KEY, SMS_SENDER_ID, SMS_BULK_SIZE
+and SMS_RATE_LIMIT; without SMTP_SERVER or SMS_API_URL those messages are
+only logged.
+
+Usage: python outbox_worker.py [--once] [--interval 30] [--batch-size 200]
+"""
+
+import argparse
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Deliver queued reminder messages')
+    parser.add_argument('--once', action='store_true', help='drain the outbox once and exit')
+    parser.add_argument('--interval', type=float, default=30, help='seconds between polls of an empty outbox')
+    parser.add_argument('--batch-size', type=int, default=200, help='messages claimed per batch')
+    args = parser.parse_args()
+
+    from app import app
+    from services.reminder_delivery import drain_outbox, email_transport
+    from services.sms_dispatch import drain_sms_outbox, sms_gateway
+
+    transport = email_transport()
+    gateway = sms_gateway()
+    try:
+        with app.app_context():
+            while True:
+                for channel, results in (
+                    ('Email', drain_outbox(transport, batch_size=args.batch_size)),
+                    ('SMS', drain_sms_outbox(gateway, batch_size=args.batch_size))
+                ):
+                    print(f"{channel}: sent {results['sent']}, retrying {results['retrying']}, "
+                          f"failed {results['failed']}" + (f" ({results['error']})" if results['error'] else ""))
+                if args.once:
+                    break
+                # Don't hold the SMTP connection open while idle
+                transport.close()
+                time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        transport.close()
+        gateway.close()
+
+
+if __name__ == '__main__':
+    main()
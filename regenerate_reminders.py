@@ -1,62 +1,46 @@
 #!/usr/bin/env python3
 """
 Regenerate reminders for all vehicles with proper dates
+
+Applies the reminder rule to the whole fleet from stored MOT dates: due
+vehicles without an active reminder get one, and active reminders of
+vehicles not due within the window are removed.
+
+Usage: python regenerate_reminders.py [--dry-run] [--window-days 30] [--date YYYY-MM-DD]
 """
 
-import sqlite3
-from datetime import datetime, date, timedelta
-
-# Connect to database
-conn = sqlite3.connect('instance/mot_reminder.db')
-cursor = conn.cursor()
-
-today = date.today()
-print(f"Today's date: {today}")
-
-# Get all vehicles with MOT expiry dates
-cursor.execute("""
-    SELECT id, registration, make, model, mot_expiry, customer_id 
-    FROM vehicles 
-    WHERE mot_expiry IS NOT NULL
-    ORDER BY mot_expiry
-""")
-
-vehicles = cursor.fetchall()
-print(f"Found {len(vehicles)} vehicles with MOT expiry dates")
-
-reminders_created = 0
-
-for vehicle_id, registration, make, model, mot_expiry_str, customer_id in vehicles:
-    try:
-        # Parse MOT expiry date
-        mot_expiry = datetime.strptime(mot_expiry_str, '%Y-%m-%d').date()
-        days_until_expiry = (mot_expiry - today).days
-        
-        # Determine if reminder is needed (within 30 days or overdue)
-        if days_until_expiry <= 30:
-            # Create reminder
-            cursor.execute("""
-                INSERT INTO reminders (vehicle_id, reminder_date, status, created_at, updated_at)
-                VALUES (?, ?, 'scheduled', ?, ?)
-            """, (vehicle_id, today.isoformat(), datetime.now(), datetime.now()))
-            
-            reminders_created += 1
-            
-            if days_until_expiry < 0:
-                status = f"{abs(days_until_expiry)} days OVERDUE"
-            elif days_until_expiry == 0:
-                status = "Due TODAY"
-            else:
-                status = f"Due in {days_until_expiry} days"
-                
-            print(f"Created reminder for {registration} ({make} {model or ''}): {status}")
+import argparse
+from datetime import datetime
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Regenerate MOT reminders from stored MOT dates')
+    parser.add_argument('--dry-run', action='store_true', help='only list the reminders that would change')
+    parser.add_argument('--window-days', type=int, default=30, help='days before MOT expiry a reminder is due')
+    parser.add_argument('--date', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+                        help="date to reconcile as of (default today)")
+    args = parser.parse_args()
+
+    from app import app
+    from database import db
+    from services.reminder_reconciliation import reconcile_reminders
+
+    with app.app_context():
+        results = reconcile_reminders(today=args.date, window_days=args.window_days, dry_run=args.dry_run)
+        if args.dry_run:
+            for vehicle in results['to_create']:
+                print(f"Would create reminder for {vehicle['registration']}: MOT expires {vehicle['mot_expiry']}")
+            for reminder in results['to_remove']:
+                print(f"Would remove {reminder['status']} reminder for {reminder['registration']}: "
+                      f"MOT expires {reminder['mot_expiry']}")
         else:
-            print(f"Skipped {registration}: Due in {days_until_expiry} days (not urgent)")
-            
-    except Exception as e:
-        print(f"Error processing vehicle {registration}: {e}")
+            db.session.commit()
+
+    verb = 'Would create' if args.dry_run else 'Created'
+    print(f"\nCompleted! {verb} {results['reminders_created']} reminders and "
+          f"{'would remove' if args.dry_run else 'removed'} {results['invalid_reminders_removed']} "
+          f"(as of {results['today']}, {results['window_days']} day window).")
 
-conn.commit()
-conn.close()
 
-print(f"\nCompleted! Created {reminders_created} reminders for vehicles needing attention.")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Reminder Scheduler Worker
+
+Sends reminders as they fall due: at the send hour on each reminder date
+it queues the due reminders and delivers them through the outbox, with
+the same email and SMS settings as outbox_worker.py. REMINDER_DIGEST
+sends each customer one digest message instead.
+
+Run one of these alongside the app, however the app is served. Reminders
+added or changed through the app are picked up at the next reload of the
+schedule, every --resync-minutes.
+
+Usage: python reminder_scheduler_worker.py [--send-hour 9] [--resync-minutes 5]
+"""
+
+import argparse
+import os
+import time
+from datetime import timedelta
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send reminders as they fall due')
+    parser.add_argument('--send-hour', type=int, default=int(os.environ.get('REMINDER_SEND_HOUR', 9)),
+                        help='hour of the reminder date to send at (default REMINDER_SEND_HOUR or 9)')
+    parser.add_argument('--resync-minutes', type=float, default=5,
+                        help='minutes between reloads of the schedule from the database')
+    args = parser.parse_args()
+
+    from app import app
+    from services.reminder_scheduler import start_scheduler
+
+    scheduler = start_scheduler(app, send_hour=args.send_hour,
+                                resync_interval=timedelta(minutes=args.resync_minutes))
+    print(f"Reminder scheduler running: {len(scheduler)} scheduled reminders, sending at {args.send_hour:02d}:00")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -355,7 +355,7 @@ def process_data_row(row):
     
     # Create vehicle if registration is provided
     if vehicle_data['registration'] and customer:
-        vehicle = Vehicle.query.filter_by(registration=vehicle_data['registration']).first()
+        vehicle = Vehicle.find_by_registration(vehicle_data['registration'])
         
         if not vehicle:
             vehicle = Vehicle(
@@ -565,7 +565,7 @@ def import_sample_data():
             customer = Customer.query.filter_by(email=customer_email).first()
             
             if customer:
-                existing_vehicle = Vehicle.query.filter_by(registration=vehicle_data['registration']).first()
+                existing_vehicle = Vehicle.find_by_registration(vehicle_data['registration'])
                 if not existing_vehicle:
                     vehicle_data['mot_expiry'] = parse_date(vehicle_data['mot_expiry'])
                     vehicle_data['customer_id'] = customer.id
@@ -115,7 +115,7 @@ def create_vehicle():
             }), 400
         
         # Check if vehicle already exists
-        existing = Vehicle.query.filter_by(registration=data['registration']).first()
+        existing = Vehicle.find_by_registration(data['registration'])
         if existing:
             return jsonify({
                 'success': False,
@@ -229,7 +229,7 @@ def dvla_lookup(registration):
         
         if dvla_data:
             # Update vehicle if it exists
-            vehicle = Vehicle.query.filter_by(registration=clean_reg).first()
+            vehicle = Vehicle.find_by_registration(clean_reg)
             if vehicle:
                 vehicle.make = dvla_data.get('make', vehicle.make)
                 vehicle.model = dvla_data.get('model', vehicle.model)
@@ -1,15 +1,36 @@
 import logging
+import os
 from datetime import datetime, timedelta, date, timezone
 from flask import Blueprint, jsonify, request
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 from models.reminder import Reminder
 from models.vehicle import Vehicle
 from models.customer import Customer
 from database import db
+from services.reminder_delivery import (
+    DEFAULT_DIGEST_WINDOW_DAYS, drain_outbox, due_reminders_query, email_transport, outbox_status_counts,
+    queue_due_reminders
+)
+from services.reminder_planning import (
+    DEFAULT_MAX_VERIFICATION_AGE_HOURS, DEFAULT_MAX_WORKERS, DEFAULT_VERIFY_WINDOW_DAYS, plan_reminders,
+    vehicles_with_active_reminders, verify_mot_expiries
+)
+from services.reminder_generation import chunked, regenerate_reminders_for_vehicles
+from services.reminder_reconciliation import DEFAULT_WINDOW_DAYS, delete_reminders, reconcile_reminders
+from services.reminder_templates import TemplateError, get_template, save_template
+from services.sms_dispatch import drain_sms_outbox, sms_gateway
 
 logger = logging.getLogger(__name__)
 
 reminder_bp = Blueprint('reminder', __name__)
 
+# Upper bound on concurrent DVLA lookups a request can ask for
+MAX_WORKERS_LIMIT = 32
+
+BULK_ACTIONS = ('send', 'archive', 'delete')
+
 # Get all reminders
 @reminder_bp.route('/', methods=['GET'])
 def get_reminders():
@@ -21,9 +42,9 @@ def get_reminders():
 def get_due_reminders():
     # Get reminders that are due (scheduled and reminder_date <= today)
     today = datetime.now().date()
-    due_reminders = Reminder.query.filter(
-        Reminder.status == 'scheduled',
-        Reminder.reminder_date <= today
+    due_reminders = due_reminders_query(today).options(
+        # Services feed the vehicle's service history summary
+        joinedload(Reminder.vehicle).selectinload(Vehicle.services)
     ).all()
 
     result = []
@@ -31,14 +52,12 @@ def get_due_reminders():
         reminder_dict = reminder.to_dict()
 
         # Add vehicle and customer info
-        vehicle = Vehicle.query.get(reminder.vehicle_id)
+        vehicle = reminder.vehicle
         if vehicle:
             reminder_dict['vehicle'] = vehicle.to_dict()
 
-            if vehicle.customer_id:
-                customer = Customer.query.get(vehicle.customer_id)
-                if customer:
-                    reminder_dict['customer'] = customer.to_dict()
+            if vehicle.customer:
+                reminder_dict['customer'] = vehicle.customer.to_dict()
 
         result.append(reminder_dict)
 
@@ -81,7 +100,11 @@ def create_reminder():
     )
 
     db.session.add(reminder)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Vehicle already has a scheduled reminder'}), 409
 
     return jsonify(reminder.to_dict()), 201
 
@@ -112,7 +135,11 @@ def update_reminder(id):
         if data['status'] == 'sent':
             reminder.sent_at = datetime.now(timezone.utc)
 
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Vehicle already has a scheduled reminder'}), 409
 
     return jsonify(reminder.to_dict())
 
@@ -161,15 +188,23 @@ def delete_reminder(id):
 # Schedule reminders for vehicles with upcoming MOT expiry using DVLA verification
 @reminder_bp.route('/schedule', methods=['POST'])
 def schedule_reminders():
-    """Schedule reminders using real-time DVLA verification"""
-    # Get all vehicles (we'll verify MOT dates with DVLA)
-    vehicles = Vehicle.query.filter(Vehicle.customer_id.isnot(None)).all()
+    """
+    Schedule reminders, planning from stored MOT data where it is safe and
+    re-verifying with DVLA (concurrently) only vehicles near the threshold.
+    Optional JSON: mode ('plan' or 'verify_all'), verify_window_days,
+    max_verification_age_hours, max_workers.
+    """
+    data = request.get_json(silent=True) or {}
+    mode = data.get('mode', 'plan')
+    if mode not in ('plan', 'verify_all'):
+        return jsonify({'error': "mode must be 'plan' or 'verify_all'"}), 400
 
-    today = datetime.now().date()
-    reminders_created = 0
-    dvla_verified = 0
-    dvla_errors = 0
-    invalid_reminders_removed = 0
+    try:
+        verify_window_days = int(data.get('verify_window_days', DEFAULT_VERIFY_WINDOW_DAYS))
+        max_verification_age_hours = int(data.get('max_verification_age_hours', DEFAULT_MAX_VERIFICATION_AGE_HOURS))
+        max_workers = int(data.get('max_workers', DEFAULT_MAX_WORKERS))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'verify_window_days, max_verification_age_hours and max_workers must be integers'}), 400
 
     # Import DVLA service
     try:
@@ -178,150 +213,108 @@ def schedule_reminders():
     except Exception as e:
         return jsonify({'error': f'DVLA service unavailable: {str(e)}'}), 500
 
-    for vehicle in vehicles:
-        try:
-            # Get real-time DVLA data for this vehicle
-            dvla_data = dvla_service.get_vehicle_details(vehicle.registration)
-
-            if dvla_data and dvla_data.get('motExpiryDate'):
-                dvla_verified += 1
-
-                # Parse DVLA MOT expiry date
-                dvla_mot_expiry = datetime.strptime(dvla_data['motExpiryDate'], '%Y-%m-%d').date()
-
-                # Update vehicle with DVLA data if different
-                if vehicle.mot_expiry != dvla_mot_expiry:
-                    print(f"Updating {vehicle.registration}: {vehicle.mot_expiry} -> {dvla_mot_expiry}")
-                    vehicle.mot_expiry = dvla_mot_expiry
-                    vehicle.dvla_verified_at = datetime.now(timezone.utc)
-
-                # Calculate days until MOT expiry using DVLA data
-                days_until_expiry = (dvla_mot_expiry - today).days
-
-                # Remove any existing invalid reminders for this vehicle
-                invalid_reminders = Reminder.query.filter(
-                    Reminder.vehicle_id == vehicle.id,
-                    Reminder.status.in_(['scheduled', 'sent'])
-                ).all()
-
-                for invalid_reminder in invalid_reminders:
-                    # Check if this reminder is still valid based on DVLA data
-                    if days_until_expiry > 30:  # MOT is not due within 30 days
-                        db.session.delete(invalid_reminder)
-                        invalid_reminders_removed += 1
-                        print(f"Removed invalid reminder for {vehicle.registration} (MOT valid for {days_until_expiry} days)")
-
-                # Only create reminders for vehicles that actually need them (within 30 days or overdue)
-                if days_until_expiry <= 30:
-                    # Check if valid reminder already exists
-                    existing_reminder = Reminder.query.filter(
-                        Reminder.vehicle_id == vehicle.id,
-                        Reminder.status.in_(['scheduled', 'sent'])
-                    ).first()
-
-                    if not existing_reminder:
-                        # Create reminder with DVLA-verified data
-                        reminder = Reminder(
-                            vehicle_id=vehicle.id,
-                            reminder_date=today,
-                            status='scheduled'
-                        )
-
-                        db.session.add(reminder)
-                        reminders_created += 1
-
-                        print(f"Created DVLA-verified reminder for {vehicle.registration}: MOT expires {dvla_mot_expiry} ({days_until_expiry} days)")
-                else:
-                    print(f"Skipped {vehicle.registration}: MOT valid for {days_until_expiry} days")
-            else:
-                dvla_errors += 1
-                print(f"No DVLA data available for {vehicle.registration}")
-
-        except Exception as e:
-            dvla_errors += 1
-            print(f"Error processing {vehicle.registration}: {e}")
-
-    db.session.commit()
+    results = plan_reminders(
+        dvla_service.get_vehicle_details,
+        verify_window_days=verify_window_days,
+        max_verification_age_hours=max_verification_age_hours,
+        max_workers=min(max(max_workers, 1), MAX_WORKERS_LIMIT),
+        verify_all=mode == 'verify_all'
+    )
 
     return jsonify({
-        'message': f'Scheduled {reminders_created} DVLA-verified reminders',
-        'reminders_created': reminders_created,
-        'invalid_reminders_removed': invalid_reminders_removed,
-        'dvla_verified': dvla_verified,
-        'dvla_errors': dvla_errors,
-        'total_vehicles': len(vehicles)
+        'message': f"Scheduled {results['reminders_created']} reminders",
+        'mode': mode,
+        **results
     })
 
 # Process reminders (send emails/SMS)
 @reminder_bp.route('/process', methods=['POST'])
 def process_reminders():
-    # Get all scheduled reminders due today or earlier
-    today = datetime.now().date()
-    due_reminders = Reminder.query.filter(
-        Reminder.status == 'scheduled',
-        Reminder.reminder_date <= today
-    ).all()
-
-    processed_count = 0
-
-    for reminder in due_reminders:
-        # Get vehicle and customer info
-        vehicle = Vehicle.query.get(reminder.vehicle_id)
-        if not vehicle or not vehicle.customer_id:
-            reminder.status = 'failed'
-            continue
+    """
+    Queue all scheduled reminders due today or earlier. Optional JSON:
+    digest (default REMINDER_DIGEST) sends each customer one message for
+    all their vehicles, including those due within digest_window_days.
+
+    Nothing is sent here: the queued emails and SMS stay pending in the
+    outbox until outbox_worker.py (or the reminder scheduler, or a POST to
+    /api/reminders/outbox/drain) delivers them, so run the worker alongside
+    the app.
+    """
+    data = request.get_json(silent=True) or {}
+    digest = data.get('digest', os.environ.get('REMINDER_DIGEST', 'false').lower() in ('1', 'true', 'yes'))
+    try:
+        digest_window_days = int(data.get('digest_window_days', DEFAULT_DIGEST_WINDOW_DAYS))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'digest_window_days must be an integer'}), 400
+    if digest_window_days < 0:
+        return jsonify({'error': 'digest_window_days must not be negative'}), 400
 
-        customer = Customer.query.get(vehicle.customer_id)
-        if not customer:
-            reminder.status = 'failed'
-            continue
+    today = datetime.now().date()
+    results = queue_due_reminders(today, digest=bool(digest), digest_window_days=digest_window_days)
+    db.session.commit()
 
-        # In a real implementation, this would send emails or SMS
-        # For local development, we'll just mark them as sent
+    return jsonify({
+        'message': f"Queued {results['reminders_queued']} reminders for delivery by the outbox worker",
+        'reminders_processed': results['reminders_queued'],
+        'reminders_failed': results['reminders_failed'],
+        'emails_queued': results['emails_queued'],
+        'sms_queued': results['sms_queued'],
+        'digests_queued': results['digests_queued']
+    })
 
-        reminder.status = 'sent'
-        reminder.sent_at = datetime.now(timezone.utc)
-        processed_count += 1
+# Outbox status
+@reminder_bp.route('/outbox', methods=['GET'])
+def outbox_status():
+    """Number of outbox messages in each status"""
+    return jsonify({'counts': outbox_status_counts()})
+
+# Deliver pending outbox messages now
+@reminder_bp.route('/outbox/drain', methods=['POST'])
+def drain_reminder_outbox():
+    """Send pending outbox emails and SMS (outbox_worker.py does this continuously)"""
+    transport = email_transport()
+    try:
+        email_results = drain_outbox(transport)
+    finally:
+        transport.close()
+    gateway = sms_gateway()
+    try:
+        sms_results = drain_sms_outbox(gateway)
+    finally:
+        gateway.close()
+    return jsonify({'email': email_results, 'sms': sms_results}), 503 if email_results['error'] else 200
 
-    db.session.commit()
+def _template_endpoint(channel):
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            row = save_template(channel, data.get('template'), data.get('subject'))
+        except TemplateError as e:
+            return jsonify({'error': str(e)}), 400
+        label = ('Email' if channel.startswith('email') else 'SMS') + (' digest' if channel.endswith('_digest') else '')
+        return jsonify({'message': f"{label} template saved", **row.to_dict()})
 
+    template = get_template(channel)
     return jsonify({
-        'message': f'Processed {processed_count} reminders',
-        'reminders_processed': processed_count
+        'template': template.body.source,
+        'subject': template.subject.source if template.subject else None,
+        'is_default': not template.saved
     })
 
 # Email template endpoints
 @reminder_bp.route('/templates/email', methods=['GET', 'POST'])
 def email_template():
-    if request.method == 'POST':
-        data = request.json
-        # In a real implementation, this would save the template to the database
-        return jsonify({'message': 'Email template saved'})
-    else:
-        # Return default template
-        default_template = """
-        Dear {customer_name},
-
-        This is a reminder that the MOT for your {vehicle_make} {vehicle_model} (Registration: {vehicle_registration}) is due to expire on {mot_expiry_date}.
-
-        Please contact us to schedule an appointment.
-
-        Thank you,
-        Your Garage
-        """
-        return jsonify({'template': default_template})
+    return _template_endpoint('email')
 
 # SMS template endpoints
 @reminder_bp.route('/templates/sms', methods=['GET', 'POST'])
 def sms_template():
-    if request.method == 'POST':
-        data = request.json
-        # In a real implementation, this would save the template to the database
-        return jsonify({'message': 'SMS template saved'})
-    else:
-        # Return default template
-        default_template = """MOT Reminder: Your {vehicle_make} {vehicle_model} (Reg: {vehicle_registration}) MOT expires on {mot_expiry_date}. Please contact us to book."""
-        return jsonify({'template': default_template})
+    return _template_endpoint('sms')
+
+# Digest template endpoints ({customer_name}, {vehicle_count} and {vehicle_list})
+@reminder_bp.route('/templates/<any(email_digest, sms_digest):channel>', methods=['GET', 'POST'])
+def digest_template(channel):
+    return _template_endpoint(channel)
 
 # New enhanced reminder management endpoints
 @reminder_bp.route('/review/<batch_id>', methods=['GET'])
@@ -372,41 +365,14 @@ def generate_reminders_batch():
     if not vehicle_ids:
         return jsonify({'error': 'No vehicles selected'}), 400
 
-    # Archive previous reminders for these vehicles
-    previous_reminders = Reminder.query.filter(
-        Reminder.vehicle_id.in_(vehicle_ids),
-        Reminder.status.in_(['scheduled', 'sent'])
-    ).all()
-
-    for reminder in previous_reminders:
-        reminder.status = 'archived'
-        reminder.archived_at = datetime.now(timezone.utc)
-
-    # Create new reminders
-    created_reminders = []
-    for vehicle_id in vehicle_ids:
-        vehicle = Vehicle.query.get(vehicle_id)
-        if vehicle and vehicle.mot_expiry:
-            # Calculate reminder date (30 days before expiry, or today if already past)
-            reminder_date = vehicle.mot_expiry - timedelta(days=30)
-            if reminder_date < date.today():
-                reminder_date = date.today()
-
-            reminder = Reminder(
-                vehicle_id=vehicle_id,
-                reminder_date=reminder_date,
-                review_batch_id=batch_id,
-                status='scheduled'
-            )
-            db.session.add(reminder)
-            created_reminders.append(reminder)
-
+    # Archive previous reminders for these vehicles and create new ones
+    archived_count, created_count = regenerate_reminders_for_vehicles(vehicle_ids, batch_id=batch_id)
     db.session.commit()
 
     return jsonify({
-        'message': f'Created {len(created_reminders)} reminders',
-        'archived_count': len(previous_reminders),
-        'created_count': len(created_reminders),
+        'message': f'Created {created_count} reminders',
+        'archived_count': archived_count,
+        'created_count': created_count,
         'batch_id': batch_id
     })
 
@@ -420,22 +386,24 @@ def bulk_reminder_action():
     if not reminder_ids or not action:
         return jsonify({'error': 'Missing reminder IDs or action'}), 400
 
-    reminders = Reminder.query.filter(Reminder.id.in_(reminder_ids)).all()
-    processed_count = 0
+    if action not in BULK_ACTIONS:
+        return jsonify({'error': f"Unknown action {action}; use one of {', '.join(BULK_ACTIONS)}"}), 400
 
-    for reminder in reminders:
+    # One statement per chunk of ids rather than loading each reminder
+    now = datetime.now(timezone.utc)
+    processed_count = 0
+    for id_chunk in chunked(sorted(set(reminder_ids))):
+        if action == 'delete':
+            # Their outbox messages go too, so a queued reminder is not sent after it is deleted
+            processed_count += delete_reminders(Reminder.id.in_(id_chunk))
+            continue
         if action == 'send':
-            reminder.status = 'sent'
-            reminder.sent_at = datetime.now(timezone.utc)
-            processed_count += 1
-        elif action == 'archive':
-            reminder.status = 'archived'
-            reminder.archived_at = datetime.now(timezone.utc)
-            processed_count += 1
-        elif action == 'delete':
-            db.session.delete(reminder)
-            processed_count += 1
-
+            statement = update(Reminder).values(status='sent', sent_at=now, updated_at=now)
+        else:
+            statement = update(Reminder).values(status='archived', archived_at=now, updated_at=now)
+        processed_count += db.session.execute(
+            statement.where(Reminder.id.in_(id_chunk)).execution_options(synchronize_session=False)
+        ).rowcount
     db.session.commit()
 
     return jsonify({
@@ -466,88 +434,50 @@ def clear_all_reminders():
 
 @reminder_bp.route('/cleanup-invalid', methods=['POST'])
 def cleanup_invalid_reminders():
-    """Remove invalid reminders and regenerate with DVLA verification"""
+    """Re-verify vehicles with active reminders with DVLA, then reconcile reminders"""
     try:
         from services.dvla_api_service import DVLAApiService
         dvla_service = DVLAApiService()
     except Exception as e:
         return jsonify({'error': f'DVLA service unavailable: {str(e)}'}), 500
 
-    today = date.today()
-    invalid_reminders_removed = 0
-    vehicles_updated = 0
-    new_reminders_created = 0
-    dvla_errors = 0
-
-    # Get all active reminders
-    active_reminders = Reminder.query.filter(
-        Reminder.status.in_(['scheduled', 'sent'])
-    ).all()
-
-    for reminder in active_reminders:
-        vehicle = Vehicle.query.get(reminder.vehicle_id)
-        if not vehicle:
-            continue
-
-        try:
-            # Get DVLA data
-            dvla_data = dvla_service.get_vehicle_details(vehicle.registration)
-
-            if dvla_data and dvla_data.get('motExpiryDate'):
-                dvla_mot_expiry = datetime.strptime(dvla_data['motExpiryDate'], '%Y-%m-%d').date()
-
-                # Update vehicle MOT date if different
-                if vehicle.mot_expiry != dvla_mot_expiry:
-                    vehicle.mot_expiry = dvla_mot_expiry
-                    vehicle.dvla_verified_at = datetime.now()
-                    vehicles_updated += 1
-
-                # Calculate days until expiry based on DVLA data
-                days_until_expiry = (dvla_mot_expiry - today).days
-
-                # Remove reminder if MOT is not due within 30 days
-                if days_until_expiry > 30:
-                    db.session.delete(reminder)
-                    invalid_reminders_removed += 1
-            else:
-                dvla_errors += 1
-
-        except Exception as e:
-            dvla_errors += 1
-            print(f"Error processing {vehicle.registration}: {e}")
-
-    # Create new reminders for vehicles that need them
-    vehicles_needing_reminders = Vehicle.query.filter(
-        Vehicle.customer_id.isnot(None),
-        Vehicle.mot_expiry.isnot(None)
-    ).all()
-
-    for vehicle in vehicles_needing_reminders:
-        if vehicle.mot_expiry:
-            days_until_expiry = (vehicle.mot_expiry - today).days
-
-            if days_until_expiry <= 30:
-                # Check if reminder already exists
-                existing_reminder = Reminder.query.filter(
-                    Reminder.vehicle_id == vehicle.id,
-                    Reminder.status.in_(['scheduled', 'sent'])
-                ).first()
-
-                if not existing_reminder:
-                    reminder = Reminder(
-                        vehicle_id=vehicle.id,
-                        reminder_date=today,
-                        status='scheduled'
-                    )
-                    db.session.add(reminder)
-                    new_reminders_created += 1
-
+    verification = verify_mot_expiries(vehicles_with_active_reminders(), dvla_service.get_vehicle_details)
+    reconciled = reconcile_reminders()
     db.session.commit()
 
     return jsonify({
         'message': 'Invalid reminders cleanup completed',
-        'invalid_reminders_removed': invalid_reminders_removed,
-        'vehicles_updated': vehicles_updated,
-        'new_reminders_created': new_reminders_created,
-        'dvla_errors': dvla_errors
+        'invalid_reminders_removed': reconciled['invalid_reminders_removed'],
+        'vehicles_updated': verification['mot_dates_updated'],
+        'new_reminders_created': reconciled['reminders_created'],
+        'dvla_errors': verification['dvla_errors']
     })
+
+@reminder_bp.route('/reconcile', methods=['POST'])
+def reconcile():
+    """
+    Apply the reminder rule to the whole fleet from stored MOT data.
+    Optional JSON: window_days, date (YYYY-MM-DD, default today),
+    reminder_date (default date) and dry_run to only list the changes.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        window_days = int(data.get('window_days', DEFAULT_WINDOW_DAYS))
+        today = datetime.strptime(data['date'], '%Y-%m-%d').date() if data.get('date') else None
+        reminder_date = (
+            datetime.strptime(data['reminder_date'], '%Y-%m-%d').date() if data.get('reminder_date') else None
+        )
+    except (TypeError, ValueError):
+        return jsonify({'error': 'window_days must be an integer and dates YYYY-MM-DD'}), 400
+
+    dry_run = bool(data.get('dry_run', False))
+    try:
+        results = reconcile_reminders(today=today, window_days=window_days,
+                                      reminder_date=reminder_date, dry_run=dry_run)
+        if not dry_run:
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to reconcile reminders: {str(e)}'}), 500
+
+    return jsonify(results)
@@ -1,10 +1,12 @@
 import logging
+from datetime import datetime
 from flask import Blueprint, jsonify, request
 from models.customer import Customer
 from models.vehicle import Vehicle
 from models.service import Service
 from models.part import Part
 from database import db
+from services.full_text_search import SEARCHES, full_text_available, search_work_history
 
 logger = logging.getLogger(__name__)
 
@@ -221,6 +223,46 @@ def search_services():
         logger.error(f"Error searching services: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@search_bp.route('/work-history', methods=['GET'])
+def search_work_history_text():
+    """Ranked full-text search over job sheet descriptions and service descriptions/advisories"""
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'Search query is required'}), 400
+
+        if not full_text_available():
+            return jsonify({'error': 'Full-text search is not available on this database'}), 501
+
+        source = request.args.get('source', 'all')
+        if source != 'all' and source not in SEARCHES:
+            return jsonify({'error': f"source must be 'all' or one of: {', '.join(SEARCHES)}"}), 400
+
+        date_from = request.args.get('date_from')
+        if date_from:
+            try:
+                date_from = datetime.strptime(date_from, '%Y-%m-%d').date()
+            except ValueError:
+                return jsonify({'error': 'date_from must be YYYY-MM-DD'}), 400
+
+        limit = max(1, min(request.args.get('limit', type=int, default=50), 500))
+        results = search_work_history(
+            query,
+            sources=None if source == 'all' else [source],
+            limit=limit,
+            date_from=date_from
+        )
+
+        return jsonify({
+            'query': query,
+            'results': results,
+            'total_results': len(results)
+        })
+
+    except Exception as e:
+        logger.error(f"Error searching work history: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @search_bp.route('/parts', methods=['GET'])
 def search_parts():
     """Search parts specifically"""
@@ -3,9 +3,13 @@ import re
 from datetime import datetime
 from flask import Blueprint, jsonify, request, current_app
 from database import db
+from sqlalchemy import distinct, func
 from models.vehicle import Vehicle
 from services.dvla_api_service import DVLAApiService
 from services.ocr_service import OCRService
+from services.customer_resolver import CustomerResolver
+from services.customer_parser import parse_customer_data
+import csv
 import os
 import uuid
 from werkzeug.utils import secure_filename
@@ -22,6 +26,12 @@ if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
 
+# Rows imported per chunk before reminders are generated and committed
+CSV_IMPORT_CHUNK_SIZE = 200
+
+# Errors returned in the response of a streamed upload (the full count is always reported)
+MAX_REPORTED_ERRORS = 100
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -55,7 +65,7 @@ def create_vehicle():
             return jsonify({'error': 'Invalid registration format'}), 400
 
         # Check if vehicle already exists
-        existing_vehicle = Vehicle.query.filter_by(registration=registration).first()
+        existing_vehicle = Vehicle.find_by_registration(registration)
         if existing_vehicle:
             return jsonify({'error': 'Vehicle with this registration already exists'}), 409
 
@@ -221,167 +231,151 @@ def verify_registration():
 @vehicle_bp.route('/csv/upload', methods=['POST'])
 def upload_csv():
     """Enhanced CSV upload with DVLA cross-checking"""
-    import uuid
-    from datetime import datetime
-
     data = request.json
     csv_data = data.get('csv_data', [])
 
     if not csv_data:
         return jsonify({'error': 'No CSV data provided'}), 400
 
-    # Create a unique batch ID for this upload session
-    batch_id = f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{str(uuid.uuid4())[:8]}"
-
-    results = {
-        'processed': 0,
-        'errors': [],
-        'vehicles_created': [],
-        'customers_created': [],
-        'dvla_lookups': [],
-        'batch_id': batch_id,
-        'redirect_to_review': True
-    }
-
-    for row_index, row_data in enumerate(csv_data):
-        try:
-            result = process_csv_row_with_dvla(row_data, row_index + 1)
-
-            if result['success']:
-                results['processed'] += 1
-                results['vehicles_created'].append(result['vehicle'])
-
-                if result.get('customer_created'):
-                    results['customers_created'].append(result['customer'])
+    results = import_vehicle_rows(csv_data, new_upload_batch_id())
+    return jsonify(results)
 
-                results['dvla_lookups'].append({
-                    'registration': result['registration'],
-                    'dvla_found': result['dvla_found'],
-                    'dvla_data': result.get('dvla_data'),
-                    'csv_data': result.get('csv_data')
-                })
-            else:
-                results['errors'].append(f"Row {row_index + 1}: {result['error']}")
+@vehicle_bp.route('/csv/upload-file', methods=['POST'])
+def upload_csv_file():
+    """Streaming CSV upload: the raw file is parsed server-side in bounded chunks"""
+    from services.import_readers import MissingColumnsError, iter_csv_rows
 
-        except Exception as e:
-            results['errors'].append(f"Row {row_index + 1}: {str(e)}")
-
-    # After processing all vehicles, automatically create reminders for vehicles that need them
-    from models.reminder import Reminder
-    from datetime import date, timedelta
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file provided'}), 400
 
-    created_reminders = 0
-    for vehicle_data in results['vehicles_created']:
-        # vehicles_created contains vehicle dictionaries directly
-        if not isinstance(vehicle_data, dict) or 'id' not in vehicle_data:
-            continue  # Skip invalid entries
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'No file selected'}), 400
 
-        vehicle_id = vehicle_data['id']
+    if not file.filename.lower().endswith('.csv'):
+        return jsonify({'error': 'Please upload a CSV file'}), 400
 
-        # Check if vehicle has MOT expiry and needs a reminder
-        if vehicle_data.get('mot_expiry'):
-            try:
-                mot_expiry = datetime.strptime(vehicle_data['mot_expiry'], '%Y-%m-%d').date()
-                days_until_expiry = (mot_expiry - date.today()).days
-
-                # Create reminder if MOT expires within 60 days or has expired
-                if days_until_expiry <= 60:
-                    # Check if reminder already exists
-                    existing_reminder = Reminder.query.filter_by(
-                        vehicle_id=vehicle_id,
-                        status='scheduled'
-                    ).first()
-
-                    if not existing_reminder:
-                        # Calculate reminder date (30 days before expiry, or today if already past)
-                        reminder_date = mot_expiry - timedelta(days=30)
-                        if reminder_date < date.today():
-                            reminder_date = date.today()
-
-                        reminder = Reminder(
-                            vehicle_id=vehicle_id,
-                            reminder_date=reminder_date,
-                            review_batch_id=batch_id,
-                            status='scheduled'
-                        )
-                        db.session.add(reminder)
-                        created_reminders += 1
-            except Exception as e:
-                print(f"Error creating reminder for vehicle {vehicle_id}: {e}")
+    chunk_size = request.form.get('chunk_size', CSV_IMPORT_CHUNK_SIZE, type=int)
+    rows = (
+        row for row in iter_csv_rows(file.stream, normalise_headers=True, skip_comments=True,
+                                     required_columns=('registration',))
+        if row.get('registration')
+    )
 
-    if created_reminders > 0:
-        try:
-            db.session.commit()
-            results['reminders_created'] = created_reminders
-        except Exception as e:
-            print(f"Error committing reminders: {e}")
-            db.session.rollback()
-            results['reminders_created'] = 0
-    else:
-        results['reminders_created'] = 0
+    try:
+        results = import_vehicle_rows(
+            rows, new_upload_batch_id(), chunk_size=max(chunk_size, 1), collect_details=False
+        )
+    except MissingColumnsError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'missing_columns': e.columns}), 400
+    except (csv.Error, UnicodeError) as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to read CSV file: {str(e)}'}), 400
 
     return jsonify(results)
 
-def parse_customer_data(customer_string):
-    """Parse customer data from the specific format: 'Name t: phone m: mobile e: email'"""
-    if not customer_string or customer_string.strip() == '-':
-        return None
+def new_upload_batch_id():
+    """Create a unique batch ID for an upload session"""
+    return f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{str(uuid.uuid4())[:8]}"
 
-    customer_info = {
-        'name': '',
-        'phone': '',
-        'email': ''
-    }
+def import_vehicle_rows(rows, batch_id, chunk_size=CSV_IMPORT_CHUNK_SIZE, collect_details=True):
+    """
+    Import vehicle rows chunk by chunk, creating reminders after each chunk.
 
-    try:
-        # Split by common patterns
-        parts = customer_string.strip()
-
-        # Extract name (everything before 't:' or first contact info)
-        if ' t:' in parts:
-            name_part = parts.split(' t:')[0].strip()
-        elif ' m:' in parts:
-            name_part = parts.split(' m:')[0].strip()
-        elif ' e:' in parts:
-            name_part = parts.split(' e:')[0].strip()
-        else:
-            name_part = parts
+    With collect_details=False only counters and the first MAX_REPORTED_ERRORS
+    errors are kept, so memory stays flat however many rows are streamed in.
+    """
+    from services.import_readers import iter_chunks
+    from services.reminder_generation import generate_reminders_for_vehicles
 
-        customer_info['name'] = name_part
+    results = {
+        'processed': 0,
+        'errors': [],
+        'error_count': 0,
+        'vehicles_created_count': 0,
+        'vehicles_updated_count': 0,
+        'customers_created_count': 0,
+        'dvla_found_count': 0,
+        'reminders_created': 0,
+        'batch_id': batch_id,
+        'redirect_to_review': True
+    }
+    if collect_details:
+        results.update({
+            'vehicles_created': [],
+            'customers_created': [],
+            'dvla_lookups': []
+        })
 
-        # Extract phone numbers (look for patterns like 'm: 07...' or 't: 8203...')
-        import re
+    # Index existing customers once so rows are matched without a table scan each
+    customer_resolver = CustomerResolver.from_database()
+    row_number = 0
 
-        # Mobile phone pattern (m: followed by number)
-        mobile_match = re.search(r'm:\s*([0-9\s]+)', parts)
-        if mobile_match:
-            customer_info['phone'] = mobile_match.group(1).strip()
+    for chunk in iter_chunks(rows, chunk_size):
+        chunk_vehicle_ids = []
 
-        # If no mobile, try landline (t: followed by number)
-        if not customer_info['phone']:
-            landline_match = re.search(r't:\s*([0-9\s]+)', parts)
-            if landline_match:
-                customer_info['phone'] = landline_match.group(1).strip()
+        for row_data in chunk:
+            row_number += 1
+            try:
+                result = process_csv_row_with_dvla(row_data, row_number, customer_resolver)
+
+                if result['success']:
+                    results['processed'] += 1
+                    chunk_vehicle_ids.append(result['vehicle']['id'])
+
+                    if result.get('action') == 'updated':
+                        results['vehicles_updated_count'] += 1
+                    else:
+                        results['vehicles_created_count'] += 1
+                    if result.get('customer_created'):
+                        results['customers_created_count'] += 1
+                    if result['dvla_found']:
+                        results['dvla_found_count'] += 1
+
+                    if collect_details:
+                        results['vehicles_created'].append(result['vehicle'])
+
+                        if result.get('customer_created'):
+                            results['customers_created'].append(result['customer'])
+
+                        results['dvla_lookups'].append({
+                            'registration': result['registration'],
+                            'dvla_found': result['dvla_found'],
+                            'dvla_data': result.get('dvla_data'),
+                            'csv_data': result.get('csv_data')
+                        })
+                else:
+                    record_import_error(results, f"Row {row_number}: {result['error']}", collect_details)
 
-        # Extract email (e: followed by email)
-        email_match = re.search(r'e:\s*([^\s]+@[^\s]+)', parts)
-        if email_match:
-            customer_info['email'] = email_match.group(1).strip()
+            except Exception as e:
+                db.session.rollback()
+                customer_resolver.rollback()
+                record_import_error(results, f"Row {row_number}: {str(e)}", collect_details)
 
-        # Clean up phone number (remove extra spaces)
-        if customer_info['phone']:
-            customer_info['phone'] = re.sub(r'\s+', '', customer_info['phone'])
+        # Create reminders for the vehicles in this chunk that need them
+        try:
+            results['reminders_created'] += generate_reminders_for_vehicles(chunk_vehicle_ids, batch_id=batch_id)
+            db.session.commit()
+        except Exception as e:
+            print(f"Error creating reminders: {e}")
+            db.session.rollback()
 
-        return customer_info
+    return results
 
-    except Exception as e:
-        print(f"Error parsing customer data '{customer_string}': {e}")
-        return {'name': customer_string.strip(), 'phone': '', 'email': ''}
+def record_import_error(results, message, keep_all=True):
+    """Count an import error, keeping only the first few unless keep_all is set"""
+    results['error_count'] += 1
+    if keep_all or len(results['errors']) < MAX_REPORTED_ERRORS:
+        results['errors'].append(message)
 
-def process_csv_row_with_dvla(row_data, row_number):
+def process_csv_row_with_dvla(row_data, row_number, customer_resolver=None):
     """Process a single CSV row with DVLA lookup and cross-checking"""
     from datetime import datetime
 
+    if customer_resolver is None:
+        customer_resolver = CustomerResolver.from_database()
+
     registration = row_data.get('registration', '').strip()
 
     if not registration:
@@ -454,10 +448,13 @@ def process_csv_row_with_dvla(row_data, row_number):
         if parsed_customer and parsed_customer['name']:
             from models.customer import Customer
 
-            # Check if customer exists (search by name)
-            existing_customer = Customer.query.filter(
-                Customer.name.ilike(f"%{parsed_customer['name'].strip()}%")
-            ).first()
+            # Check if customer exists (exact match on email, phone or name)
+            existing_customer_id = customer_resolver.resolve(
+                name=parsed_customer['name'],
+                phone=parsed_customer['phone'],
+                email=parsed_customer['email']
+            )
+            existing_customer = db.session.get(Customer, existing_customer_id) if existing_customer_id else None
 
             if existing_customer:
                 customer_id = existing_customer.id
@@ -468,6 +465,7 @@ def process_csv_row_with_dvla(row_data, row_number):
                     existing_customer.phone = parsed_customer['phone']
                 if parsed_customer['email'] and not existing_customer.email:
                     existing_customer.email = parsed_customer['email']
+                customer_resolver.add_customer(existing_customer)
             else:
                 # Create new customer
                 new_customer = Customer(
@@ -480,11 +478,12 @@ def process_csv_row_with_dvla(row_data, row_number):
                 customer_id = new_customer.id
                 customer_created = True
                 customer_data = new_customer.to_dict()
+                customer_resolver.add_customer(new_customer)
 
     vehicle_data['customer_id'] = customer_id
 
     # Step 4: Check if vehicle already exists
-    existing_vehicle = Vehicle.query.filter_by(registration=registration).first()
+    existing_vehicle = Vehicle.find_by_registration(registration)
     if existing_vehicle:
         # Update existing vehicle with new data (DVLA data takes precedence)
         try:
@@ -499,6 +498,7 @@ def process_csv_row_with_dvla(row_data, row_number):
                 existing_vehicle.customer_id = vehicle_data.get('customer_id')
 
             db.session.commit()
+            customer_resolver.commit()
 
             return {
                 'success': True,
@@ -513,6 +513,7 @@ def process_csv_row_with_dvla(row_data, row_number):
             }
         except Exception as e:
             db.session.rollback()
+            customer_resolver.rollback()
             return {
                 'success': False,
                 'error': f'Failed to update existing vehicle {registration}: {str(e)}'
@@ -532,6 +533,7 @@ def process_csv_row_with_dvla(row_data, row_number):
 
         db.session.add(vehicle)
         db.session.commit()
+        customer_resolver.commit()
 
         return {
             'success': True,
@@ -546,6 +548,7 @@ def process_csv_row_with_dvla(row_data, row_number):
         }
     except Exception as e:
         db.session.rollback()
+        customer_resolver.rollback()
         return {
             'success': False,
             'error': f'Failed to create vehicle {registration}: {str(e)}'
@@ -616,15 +619,10 @@ def get_vehicle_count():
         elif verification_type == 'job_sheets':
             # Count unique registrations from job sheets not in vehicles table
             from models.job_sheet import JobSheet
-            unique_regs = db.session.query(JobSheet.vehicle_reg).filter(
-                JobSheet.vehicle_reg.isnot(None),
-                JobSheet.vehicle_reg != ''
-            ).distinct().all()
-
-            count = 0
-            for (reg,) in unique_regs:
-                if reg and not Vehicle.query.filter_by(registration=reg.upper()).first():
-                    count += 1
+            count = db.session.query(func.count(distinct(JobSheet.normalised_reg))).filter(
+                JobSheet.normalised_reg.isnot(None),
+                ~db.session.query(Vehicle.id).filter(Vehicle.normalised_reg == JobSheet.normalised_reg).exists()
+            ).scalar()
         else:
             count = 0
 
@@ -189,7 +189,7 @@ class BatchDVLAService:
                     continue
                     
                 # Check if vehicle already exists
-                existing = Vehicle.query.filter_by(registration=reg.upper()).first()
+                existing = Vehicle.find_by_registration(reg)
                 if not existing:
                     # Create placeholder vehicle for processing
                     vehicle = Vehicle(registration=reg.upper())
@@ -320,7 +320,7 @@ class BatchDVLAService:
         from models.customer import Customer
 
         # Find job sheets for this vehicle
-        job_sheets = JobSheet.query.filter_by(vehicle_reg=vehicle.registration.upper()).all()
+        job_sheets = JobSheet.query.filter_by(normalised_reg=vehicle.normalised_reg).all()
 
         if not job_sheets:
             return False
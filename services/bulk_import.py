@@ -0,0 +1,299 @@
+"""
+Bulk Import Orchestrator for MOT Reminder System
+
+Runs multi-file uploads from /api/job-sheets/upload-bulk as background jobs:
+- Every file is parsed and normalised concurrently in a process pool
+  (parsing is the CPU-heavy part of an import)
+- Writes are applied in dependency order, stage by stage:
+  customers -> vehicles -> job sheets -> other files
+- Per-file progress is kept under a job ID for the upload page to poll
+"""
+
+import io
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from services.import_readers import iter_frames, iter_upload_rows
+from services.job_sheet_ingest import (
+    DEFAULT_CHUNK_SIZE, JobSheetIngestor, normalise_job_sheet_frame, validate_job_sheet_frame
+)
+from services.job_sheet_schema import JobSheetSchema
+
+# Stages run in this order so job sheets can link to customers and vehicles
+STAGES = ['customers', 'vehicles', 'job_sheets', 'other']
+
+# Upper bound on parser processes per upload
+MAX_PARSE_WORKERS = 4
+
+# Finished jobs kept for status polling
+MAX_FINISHED_JOBS = 50
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    PARSING = "parsing"
+    WRITING = "writing"
+    COMPLETED = "completed"
+    ERROR = "error"
+
+
+@dataclass
+class FileProgress:
+    filename: str
+    stage: str
+    status: str = "queued"  # queued -> parsing -> parsed -> writing -> completed / error
+    rows: int = 0
+    processed: int = 0
+    created: int = 0
+    updated: int = 0
+    customers_created: int = 0
+    vehicles_created: int = 0
+    errors: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    field_mapping: Optional[Dict[str, str]] = None  # Job sheet field -> source header
+
+
+def classify_upload(filename):
+    """Import stage for a file, from its name (as upload-bulk always has)"""
+    filename = filename.lower()
+    if 'customer' in filename:
+        return 'customers'
+    if 'vehicle' in filename or 'mot_due' in filename:
+        return 'vehicles'
+    if any(keyword in filename for keyword in ['document', 'job', 'line_item', 'reminder']):
+        return 'job_sheets'
+    return 'other'
+
+
+def parse_upload(filename, stage, data):
+    """
+    Parse one file in a worker process. Job sheet files (and unrecognised
+    files, which are imported as job sheets) are streamed in chunks and come
+    back normalised and ready to write; customer and vehicle files are only
+    counted, as before.
+    """
+    rows = iter_upload_rows(filename, io.BytesIO(data))
+    parsed = {'rows': 0, 'frame': None, 'errors': []}
+
+    if stage not in ('job_sheets', 'other'):
+        parsed['rows'] = sum(1 for _ in rows)
+        return parsed
+
+    schema = None
+    normalised_chunks = []
+    for frame in iter_frames(rows, DEFAULT_CHUNK_SIZE):
+        if schema is None:
+            schema = JobSheetSchema(list(frame.columns))
+            parsed['mapping'] = schema.describe()
+        parsed['rows'] += len(frame)
+        normalised_chunks.append(normalise_job_sheet_frame(frame, schema))
+
+    if normalised_chunks:
+        normalised, errors = validate_job_sheet_frame(pd.concat(normalised_chunks))
+        parsed.update(frame=normalised, errors=errors)
+
+    return parsed
+
+
+class BulkImportJob:
+    """One multi-file upload: parse in parallel, then write stage by stage"""
+
+    def __init__(self, uploads, dvla_lookup: Optional[Callable] = None,
+                 link_data: Optional[Callable] = None, max_workers: int = MAX_PARSE_WORKERS):
+        """
+        Args:
+            uploads: list of (filename, bytes) pairs
+            dvla_lookup: called with the registrations written, after all stages
+            link_data: called with no arguments at the end of the import
+        """
+        self.job_id = uuid.uuid4().hex
+        self.uploads = list(uploads)
+        self.dvla_lookup = dvla_lookup
+        self.link_data = link_data
+        self.max_workers = max_workers
+
+        self._lock = threading.Lock()
+        self._status = JobStatus.QUEUED
+        self._started_at: Optional[datetime] = None
+        self._finished_at: Optional[datetime] = None
+        self._files = [FileProgress(filename=name, stage=classify_upload(name)) for name, _ in self.uploads]
+        self._dvla_lookups = None
+        self._linking_results = None
+        self._errors: List[str] = []
+
+    @property
+    def finished(self) -> bool:
+        with self._lock:
+            return self._status in (JobStatus.COMPLETED, JobStatus.ERROR)
+
+    def get_status(self) -> Dict:
+        """Progress snapshot, with the upload-bulk summary counters"""
+        with self._lock:
+            files = [asdict(progress) for progress in self._files]
+            totals = {stage: 0 for stage in STAGES}
+            for progress in self._files:
+                totals[progress.stage] += progress.processed
+
+            return {
+                'job_id': self.job_id,
+                'status': self._status.value,
+                'started_at': self._started_at.isoformat() if self._started_at else None,
+                'finished_at': self._finished_at.isoformat() if self._finished_at else None,
+                'total_files': len(self._files),
+                'processed_files': sum(1 for p in self._files if p.status == 'completed'),
+                'customers_processed': totals['customers'],
+                'vehicles_processed': totals['vehicles'],
+                'job_sheets_processed': totals['job_sheets'] + totals['other'],
+                'dvla_lookups': self._dvla_lookups,
+                'linking_results': self._linking_results,
+                'errors': list(self._errors),
+                'file_results': files
+            }
+
+    def _update_file(self, index, **changes):
+        with self._lock:
+            for key, value in changes.items():
+                setattr(self._files[index], key, value)
+
+    def _set_status(self, status):
+        with self._lock:
+            self._status = status
+
+    def run(self):
+        """Run the whole import in the calling thread (needs an app context)"""
+        with self._lock:
+            self._status = JobStatus.PARSING
+            self._started_at = datetime.now()
+
+        try:
+            parsed = self._parse_all()
+
+            self._set_status(JobStatus.WRITING)
+            registrations = self._write_stages(parsed)
+
+            if self.dvla_lookup and registrations:
+                try:
+                    dvla_results = self.dvla_lookup(registrations)
+                    with self._lock:
+                        self._dvla_lookups = dvla_results
+                except Exception as e:
+                    with self._lock:
+                        self._errors.append(f"DVLA lookup error: {str(e)}")
+
+            if self.link_data:
+                try:
+                    link_results = self.link_data()
+                    with self._lock:
+                        self._linking_results = link_results
+                except Exception as e:
+                    with self._lock:
+                        self._errors.append(f"Data linking error: {str(e)}")
+
+            self._set_status(JobStatus.COMPLETED)
+        except Exception as e:
+            with self._lock:
+                self._errors.append(f"Bulk import failed: {str(e)}")
+                self._status = JobStatus.ERROR
+        finally:
+            with self._lock:
+                self._finished_at = datetime.now()
+                # The parsed bytes are no longer needed once the job is done
+                self.uploads = []
+
+    def _parse_all(self):
+        """Parse every file concurrently; returns parse results by file index"""
+        parsed = {}
+        workers = max(1, min(self.max_workers, len(self.uploads), os.cpu_count() or 1))
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for index, (filename, data) in enumerate(self.uploads):
+                self._update_file(index, status='parsing')
+                futures[pool.submit(parse_upload, filename, self._files[index].stage, data)] = index
+
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    result = future.result()
+                    parsed[index] = result
+                    self._update_file(index, status='parsed', rows=result['rows'], errors=result['errors'],
+                                      field_mapping=result.get('mapping'))
+                except Exception as e:
+                    self._update_file(index, status='error', error=str(e))
+                    print(f"Error parsing {self._files[index].filename}: {e}")
+
+        return parsed
+
+    def _write_stages(self, parsed):
+        """Apply parsed files stage by stage; returns the registrations written"""
+        ingestor = JobSheetIngestor()
+
+        for stage in STAGES:
+            for index, progress in enumerate(self._files):
+                if progress.stage != stage or index not in parsed:
+                    continue
+
+                result = parsed.pop(index)
+                self._update_file(index, status='writing')
+                try:
+                    if result['frame'] is None:
+                        # Customer and vehicle files are counted only
+                        self._update_file(index, status='completed', processed=result['rows'])
+                        continue
+
+                    before = dict(ingestor.results)
+                    errors_before = len(ingestor.results['errors'])
+                    ingestor.write_frame(result['frame'])
+                    after = ingestor.results
+
+                    counts = {
+                        key: after[key] - before[key]
+                        for key in ('processed', 'created', 'updated', 'customers_created', 'vehicles_created')
+                    }
+                    self._update_file(
+                        index, status='completed',
+                        errors=progress.errors + after['errors'][errors_before:],
+                        **counts
+                    )
+                except Exception as e:
+                    self._update_file(index, status='error', error=str(e))
+                    print(f"Error writing {progress.filename}: {e}")
+
+        return ingestor.registrations
+
+
+# Jobs started by this process, by job ID
+_jobs: Dict[str, BulkImportJob] = {}
+_jobs_lock = threading.Lock()
+
+
+def start_bulk_import(app, uploads, dvla_lookup=None, link_data=None):
+    """Register a job and run it in a background thread inside the app context"""
+    job = BulkImportJob(uploads, dvla_lookup=dvla_lookup, link_data=link_data)
+    with _jobs_lock:
+        finished = [job_id for job_id, existing in _jobs.items() if existing.finished]
+        # Dicts keep insertion order, so the oldest finished jobs go first
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS + 1)]:
+            del _jobs[job_id]
+        _jobs[job.job_id] = job
+
+    def run_job():
+        with app.app_context():
+            job.run()
+
+    threading.Thread(target=run_job, daemon=True).start()
+    return job
+
+
+def get_bulk_import(job_id):
+    """The job with this ID, or None"""
+    with _jobs_lock:
+        return _jobs.get(job_id)
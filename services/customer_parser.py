@@ -0,0 +1,66 @@
+"""
+Customer String Parser for MOT Reminder System
+
+Parses the customer column of MOT-due exports, which packs contact details
+into one string: 'Name t: landline m: mobile e: email'.
+"""
+
+import re
+
+MOBILE_PATTERN = re.compile(r'm:\s*([0-9\s]+)')
+LANDLINE_PATTERN = re.compile(r't:\s*([0-9\s]+)')
+EMAIL_PATTERN = re.compile(r'e:\s*([^\s]+@[^\s]+)')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# Markers that end the name part, in order of precedence
+NAME_DELIMITERS = (' t:', ' m:', ' e:')
+
+
+def parse_customer_data(customer_string):
+    """Parse customer data from the specific format: 'Name t: phone m: mobile e: email'"""
+    if not customer_string or customer_string.strip() == '-':
+        return None
+
+    customer_info = {
+        'name': '',
+        'phone': '',
+        'email': ''
+    }
+
+    try:
+        parts = customer_string.strip()
+
+        # Extract name (everything before 't:' or first contact info)
+        name_part = parts
+        for delimiter in NAME_DELIMITERS:
+            if delimiter in parts:
+                name_part = parts.split(delimiter)[0].strip()
+                break
+
+        customer_info['name'] = name_part
+
+        # Mobile phone pattern (m: followed by number)
+        mobile_match = MOBILE_PATTERN.search(parts)
+        if mobile_match:
+            customer_info['phone'] = mobile_match.group(1).strip()
+
+        # If no mobile, try landline (t: followed by number)
+        if not customer_info['phone']:
+            landline_match = LANDLINE_PATTERN.search(parts)
+            if landline_match:
+                customer_info['phone'] = landline_match.group(1).strip()
+
+        # Extract email (e: followed by email)
+        email_match = EMAIL_PATTERN.search(parts)
+        if email_match:
+            customer_info['email'] = email_match.group(1).strip()
+
+        # Clean up phone number (remove extra spaces)
+        if customer_info['phone']:
+            customer_info['phone'] = WHITESPACE_PATTERN.sub('', customer_info['phone'])
+
+        return customer_info
+
+    except Exception as e:
+        print(f"Error parsing customer data '{customer_string}': {e}")
+        return {'name': customer_string.strip(), 'phone': '', 'email': ''}
@@ -0,0 +1,114 @@
+"""
+Customer Resolver for MOT Reminder System
+
+Builds an in-memory index of existing customers once per import so each
+row can be matched without querying the customers table. Customers are
+matched on exact normalised keys (email, phone digits, name) instead of a
+substring search, so 'Ann' no longer matches 'Joanne'.
+
+Keys added mid-import stay pending until the caller commits; on rollback
+they are evicted, so a customer whose row was rolled back (and whose id
+SQLite may hand out again) is never matched.
+"""
+
+import re
+
+from database import db
+from models.customer import Customer
+
+_NON_ALNUM = re.compile(r'[^a-z0-9 ]+')
+_WHITESPACE = re.compile(r'\s+')
+_NON_DIGIT = re.compile(r'\D+')
+
+
+def normalise_name(name):
+    """Lower-case a name, drop punctuation and collapse whitespace"""
+    if not name:
+        return ''
+    name = _NON_ALNUM.sub(' ', str(name).casefold())
+    return _WHITESPACE.sub(' ', name).strip()
+
+
+def normalise_phone(phone):
+    """Reduce a phone number to its digits, mapping +44 numbers to 0..."""
+    if not phone:
+        return ''
+    digits = _NON_DIGIT.sub('', str(phone))
+    if digits.startswith('44') and len(digits) == 12:
+        digits = '0' + digits[2:]
+    return digits
+
+
+def normalise_email(email):
+    """Lower-case and trim an email address"""
+    if not email:
+        return ''
+    email = str(email).strip().casefold()
+    return email if '@' in email else ''
+
+
+class CustomerResolver:
+    """Upload-scoped lookup of customer IDs by email, phone and name"""
+
+    def __init__(self):
+        self.by_email = {}
+        self.by_phone = {}
+        self.by_name = {}
+        self._pending = []  # (index, key) added since the last commit
+
+    @classmethod
+    def from_database(cls):
+        """Build a resolver from every customer with a single query"""
+        resolver = cls()
+        rows = db.session.query(
+            Customer.id, Customer.name, Customer.phone, Customer.email
+        ).order_by(Customer.id).all()
+
+        for customer_id, name, phone, email in rows:
+            resolver.add(customer_id, name=name, phone=phone, email=email)
+        resolver.commit()
+
+        return resolver
+
+    def add(self, customer_id, name=None, phone=None, email=None):
+        """
+        Index a customer under each of its keys.
+        The first customer registered for a key wins, so results stay
+        deterministic when the table already contains duplicates.
+        """
+        for index, key in ((self.by_email, normalise_email(email)),
+                           (self.by_phone, normalise_phone(phone)),
+                           (self.by_name, normalise_name(name))):
+            if key and key not in index:
+                index[key] = customer_id
+                self._pending.append((index, key))
+
+    def commit(self):
+        """Keep the keys added since the last commit (call after db.session.commit())"""
+        self._pending.clear()
+
+    def rollback(self):
+        """Evict the keys added since the last commit (call after db.session.rollback())"""
+        for index, key in self._pending:
+            index.pop(key, None)
+        self._pending.clear()
+
+    def add_customer(self, customer):
+        """Index a Customer model instance (e.g. one created mid-import)"""
+        self.add(customer.id, name=customer.name, phone=customer.phone, email=customer.email)
+
+    def resolve(self, name=None, phone=None, email=None):
+        """Return the matching customer ID, or None if no key matches"""
+        email_key = normalise_email(email)
+        if email_key and email_key in self.by_email:
+            return self.by_email[email_key]
+
+        phone_key = normalise_phone(phone)
+        if phone_key and phone_key in self.by_phone:
+            return self.by_phone[phone_key]
+
+        name_key = normalise_name(name)
+        if name_key:
+            return self.by_name.get(name_key)
+
+        return None
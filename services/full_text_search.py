@@ -0,0 +1,149 @@
+"""
+Full-Text Search for MOT Reminder System
+
+SQLite FTS5 indexes over job sheet descriptions and service descriptions
+and advisories, so work history ('brake pads', 'cambelt') can be searched
+without scanning the tables with ILIKE '%...%'. The FTS tables are
+external-content indexes: they store only the index, read text back from
+job_sheets/services for snippets, and are kept in sync by triggers, so
+ORM writes, bulk upserts and raw SQL all update them.
+"""
+
+import re
+
+from sqlalchemy import text
+
+from database import db
+
+# Source table -> FTS table and indexed columns
+FTS_INDEXES = {
+    'job_sheets': {'fts_table': 'job_sheets_fts', 'columns': ('job_description',)},
+    'services': {'fts_table': 'services_fts', 'columns': ('description', 'advisories')},
+}
+
+# Porter stemming so 'pads' matches 'pad' and 'replaced' matches 'replace'
+FTS_TOKENIZER = 'porter unicode61 remove_diacritics 2'
+
+SNIPPET_TOKENS = 12
+
+_SEARCH_TERM = re.compile(r'\w+\*?')
+
+
+def full_text_available():
+    """FTS5 indexes are only built on SQLite"""
+    return db.engine.dialect.name == 'sqlite'
+
+
+def _index_statements(table, fts_table, columns):
+    """CREATE statements for one external-content FTS table and its sync triggers"""
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    delete_old = (
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});"
+    )
+    insert_new = f"INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values});"
+
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+        f"{column_list}, content='{table}', content_rowid='id', tokenize='{FTS_TOKENIZER}')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table} BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN {delete_old} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {column_list} ON {table} "
+        f"BEGIN {delete_old} {insert_new} END",
+    ]
+
+
+def ensure_full_text_indexes():
+    """
+    Create any missing FTS table with its triggers and build it from the
+    existing rows. Returns the FTS tables created; the caller commits.
+    """
+    if not full_text_available():
+        return []
+
+    created = []
+    for table, index in FTS_INDEXES.items():
+        fts_table = index['fts_table']
+        exists = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': fts_table}
+        ).first()
+        for statement in _index_statements(table, fts_table, index['columns']):
+            db.session.execute(text(statement))
+        if not exists:
+            db.session.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+            created.append(fts_table)
+    return created
+
+
+def fts_query(search):
+    """
+    FTS5 MATCH expression for free text: every word must match, each quoted
+    so FTS operators and punctuation in the input are taken literally; a
+    trailing '*' on a word is kept as a prefix search. '' if nothing to match.
+    """
+    terms = []
+    for term in _SEARCH_TERM.findall(search or ''):
+        word = term.rstrip('*')
+        terms.append(f'"{word}"*' if term.endswith('*') else f'"{word}"')
+    return ' '.join(terms)
+
+
+_JOB_SHEET_SEARCH = """
+    SELECT j.id, j.doc_no AS title, j.date_created AS date, j.vehicle_reg AS registration,
+           j.customer_name, j.linked_vehicle_id AS vehicle_id, j.linked_customer_id AS customer_id,
+           snippet(job_sheets_fts, -1, :open_mark, :close_mark, '…', :tokens) AS snippet,
+           bm25(job_sheets_fts) AS rank
+    FROM job_sheets_fts
+    JOIN job_sheets j ON j.id = job_sheets_fts.rowid
+    WHERE job_sheets_fts MATCH :query
+      AND (:date_from IS NULL OR j.date_created >= :date_from)
+    ORDER BY rank
+    LIMIT :limit
+"""
+
+_SERVICE_SEARCH = """
+    SELECT s.id, s.service_type AS title, s.service_date AS date, v.registration,
+           c.name AS customer_name, s.vehicle_id, v.customer_id,
+           snippet(services_fts, -1, :open_mark, :close_mark, '…', :tokens) AS snippet,
+           bm25(services_fts) AS rank
+    FROM services_fts
+    JOIN services s ON s.id = services_fts.rowid
+    LEFT JOIN vehicles v ON v.id = s.vehicle_id
+    LEFT JOIN customers c ON c.id = v.customer_id
+    WHERE services_fts MATCH :query
+      AND (:date_from IS NULL OR s.service_date >= :date_from)
+    ORDER BY rank
+    LIMIT :limit
+"""
+
+SEARCHES = {'job_sheets': _JOB_SHEET_SEARCH, 'services': _SERVICE_SEARCH}
+
+
+def search_work_history(search, sources=None, limit=50, date_from=None, marks=('<mark>', '</mark>')):
+    """
+    Ranked full-text search over job sheets and services. Each hit has its
+    source, the record's date, registration and customer, a snippet with
+    matched words wrapped in marks, and its bm25 rank (lower is better).
+    Hits from both sources are merged by rank.
+    """
+    query = fts_query(search)
+    if not query:
+        return []
+
+    params = {
+        'query': query,
+        'limit': limit,
+        'date_from': date_from.isoformat() if date_from else None,
+        'open_mark': marks[0],
+        'close_mark': marks[1],
+        'tokens': SNIPPET_TOKENS
+    }
+
+    hits = []
+    for source in sources or SEARCHES:
+        for row in db.session.execute(text(SEARCHES[source]), params).mappings():
+            hits.append({'source': source, **row})
+
+    hits.sort(key=lambda hit: hit['rank'])
+    return hits[:limit]
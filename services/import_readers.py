@@ -0,0 +1,164 @@
+"""
+Import Readers for MOT Reminder System
+
+Streams uploaded spreadsheets row by row so an import never holds the whole
+file in memory. CSV encoding is sniffed from a prefix of the upload and the
+rest is decoded incrementally as rows are consumed. Bytes that don't decode
+(a cp1252 '£' or 'é' past the sniffed prefix of a mostly UTF-8 file, say)
+are decoded as cp1252 rather than replaced; .xlsx workbooks are read
+with openpyxl's read-only mode, which parses the sheet as it is iterated.
+"""
+
+import codecs
+import csv
+import io
+import re
+from itertools import islice
+
+import pandas as pd
+from openpyxl import load_workbook
+
+# Bytes read from the start of an upload to decide its encoding
+SNIFF_BYTES = 64 * 1024
+
+# Rows handed to the import pipeline at a time
+DEFAULT_CHUNK_SIZE = 200
+
+# Workbooks openpyxl can stream; legacy .xls files are read whole by pandas
+XLSX_EXTENSIONS = ('.xlsx', '.xlsm')
+
+_HEADER_WHITESPACE = re.compile(r'\s+')
+
+# Codec error handler decoding undecodable bytes as cp1252 (latin-1 for the five bytes cp1252 leaves undefined)
+CP1252_FALLBACK = 'import-cp1252-fallback'
+
+
+class MissingColumnsError(ValueError):
+    """The file's header row lacks columns the import needs"""
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        super().__init__(f"Missing required column{'s' if len(self.columns) > 1 else ''}: {', '.join(self.columns)}")
+
+
+def _decode_cp1252_fallback(error):
+    if not isinstance(error, UnicodeDecodeError):
+        raise error
+    text = ''.join(
+        bytes([byte]).decode('cp1252', errors='strict') if byte not in (0x81, 0x8D, 0x8F, 0x90, 0x9D) else chr(byte)
+        for byte in error.object[error.start:error.end]
+    )
+    return text, error.end
+
+
+codecs.register_error(CP1252_FALLBACK, _decode_cp1252_fallback)
+
+
+def sniff_encoding(sample):
+    """
+    Pick an encoding for a byte sample: UTF-8 (with or without BOM) when the
+    sample decodes cleanly, otherwise cp1252, the usual Windows export encoding.
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        # final=False tolerates a multi-byte character cut off at the end of the sample
+        decoder.decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'cp1252'
+
+
+def normalise_header(header):
+    """Normalise a header the way the vehicle upload form does: 'Work Due' -> 'work_due'"""
+    return _HEADER_WHITESPACE.sub('_', (header or '').strip().lower())
+
+
+def iter_csv_rows(stream, normalise_headers=False, skip_comments=False, required_columns=()):
+    """
+    Yield each CSV row as a dict, decoding the binary stream incrementally.
+    The stream must be seekable (Werkzeug spools uploads to a temporary file).
+    Raises MissingColumnsError before the first row if a required column
+    (after header normalisation) is absent.
+    """
+    sample = stream.read(SNIFF_BYTES)
+    stream.seek(0)
+    encoding = sniff_encoding(sample)
+
+    text = io.TextIOWrapper(stream, encoding=encoding, errors=CP1252_FALLBACK, newline='')
+    try:
+        lines = text
+        if skip_comments:
+            lines = (line for line in text if not line.lstrip().startswith('#'))
+
+        reader = csv.reader(lines)
+        headers = next(reader, None) or []
+        if normalise_headers:
+            headers = [normalise_header(h) for h in headers]
+        else:
+            headers = [h.strip() for h in headers]
+        missing = [column for column in required_columns if column not in headers]
+        if missing:
+            raise MissingColumnsError(missing)
+        if not headers:
+            return
+
+        for values in reader:
+            if not any(value.strip() for value in values):
+                continue
+            yield dict(zip(headers, (value.strip() for value in values)))
+    finally:
+        # Leave the caller's stream open when the wrapper is discarded
+        text.detach()
+
+
+def iter_xlsx_rows(stream):
+    """
+    Yield each row of the workbook's active sheet as a dict keyed by the first
+    non-blank row. Cells keep their Excel types (numbers, datetimes); text is
+    stripped and fully blank rows are skipped.
+    """
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        headers = None
+        for values in workbook.active.iter_rows(values_only=True):
+            if not any(value is not None and str(value).strip() for value in values):
+                continue
+            if headers is None:
+                headers = ['' if h is None else str(h).strip() for h in values]
+                continue
+            yield dict(zip(headers, (v.strip() if isinstance(v, str) else v for v in values)))
+    finally:
+        workbook.close()
+
+
+def iter_upload_rows(filename, stream):
+    """Yield the rows of an uploaded CSV or Excel file as dicts, choosing the reader by extension"""
+    name = (filename or '').lower()
+    if name.endswith(XLSX_EXTENSIONS):
+        return iter_xlsx_rows(stream)
+    if name.endswith('.xls'):
+        # No streaming reader exists for the legacy binary format
+        return iter(pd.read_excel(stream).to_dict('records'))
+    return iter_csv_rows(stream)
+
+
+def iter_frames(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Group rows into DataFrames of at most `chunk_size` rows. Columns are kept
+    as object dtype so IDs such as 12345 aren't widened to 12345.0.
+    """
+    for chunk in iter_chunks(rows, chunk_size):
+        yield pd.DataFrame(chunk, dtype=object)
+
+
+def iter_chunks(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Group any row iterator into lists of at most `chunk_size` rows"""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,92 @@
+"""
+Job Sheet Analytics for MOT Reminder System
+
+Revenue, payment, MOT and linking figures for job sheets, computed by the
+database as one grouped aggregate instead of loading every job sheet.
+Results can optionally be bucketed by month or week of date_created.
+"""
+
+from sqlalchemy import case, distinct, func, select
+
+from database import db
+from models.job_sheet import JobSheet
+
+BUCKETS = ('month', 'week')
+
+
+def bucket_expression(column, bucket):
+    """
+    Period label for a date column: 'YYYY-MM' for months, 'YYYY-Www' for
+    weeks (SQLite numbers Monday-first weeks from 00; PostgreSQL uses ISO weeks).
+    """
+    if db.engine.dialect.name == 'postgresql':
+        return func.to_char(column, 'YYYY-MM' if bucket == 'month' else 'IYYY-"W"IW')
+    return func.strftime('%Y-%m' if bucket == 'month' else '%Y-W%W', column)
+
+
+def _metric_columns():
+    """Aggregate columns shared by the totals and the bucketed query"""
+    return [
+        func.count(JobSheet.id).label('total_jobs'),
+        func.coalesce(func.sum(JobSheet.grand_total), 0).label('total_revenue'),
+        func.count(JobSheet.date_paid).label('paid_jobs'),
+        func.coalesce(func.sum(case((JobSheet.is_mot, 1), else_=0)), 0).label('mot_jobs'),
+        func.coalesce(func.sum(case((JobSheet.is_mot, JobSheet.sub_mot_gross), else_=0)), 0).label('mot_revenue'),
+        func.count(distinct(func.nullif(JobSheet.customer_name, ''))).label('unique_customers'),
+        func.count(JobSheet.linked_customer_id).label('linked_customers'),
+        func.count(distinct(func.nullif(JobSheet.vehicle_reg, ''))).label('unique_vehicles'),
+        func.count(JobSheet.linked_vehicle_id).label('linked_vehicles'),
+    ]
+
+
+def _percentage(part, total):
+    return (part / total * 100) if total > 0 else 0
+
+
+def _as_metrics(row):
+    """The analytics response fields for one aggregate row"""
+    total_jobs = row.total_jobs
+    return {
+        'total_jobs': total_jobs,
+        'total_revenue': float(row.total_revenue or 0),
+        'paid_jobs': row.paid_jobs,
+        'unpaid_jobs': total_jobs - row.paid_jobs,
+        'payment_rate': _percentage(row.paid_jobs, total_jobs),
+        'mot_jobs': int(row.mot_jobs or 0),
+        'mot_revenue': float(row.mot_revenue or 0),
+        'unique_customers': row.unique_customers,
+        'linked_customers': row.linked_customers,
+        'customer_link_rate': _percentage(row.linked_customers, total_jobs),
+        'unique_vehicles': row.unique_vehicles,
+        'linked_vehicles': row.linked_vehicles,
+        'vehicle_link_rate': _percentage(row.linked_vehicles, total_jobs)
+    }
+
+
+def job_sheet_analytics(date_from=None, date_to=None, mot_only=False, bucket=None):
+    """
+    Analytics over job sheets created in [date_from, date_to]. With a bucket
+    ('month' or 'week') the result also has a 'buckets' list with the same
+    figures per period; unique counts are per period, so they don't sum to
+    the overall figures.
+    """
+    filters = []
+    if date_from:
+        filters.append(JobSheet.date_created >= date_from)
+    if date_to:
+        filters.append(JobSheet.date_created <= date_to)
+    if mot_only:
+        filters.append(JobSheet.is_mot.is_(True))
+
+    totals = db.session.execute(select(*_metric_columns()).where(*filters)).one()
+    analytics = _as_metrics(totals)
+
+    if bucket:
+        period = bucket_expression(JobSheet.date_created, bucket).label('period')
+        rows = db.session.execute(
+            select(period, *_metric_columns()).where(*filters).group_by(period).order_by(period)
+        ).all()
+        analytics['bucket'] = bucket
+        analytics['buckets'] = [{'period': row.period, **_as_metrics(row)} for row in rows]
+
+    return analytics
@@ -0,0 +1,405 @@
+"""
+Job Sheet Ingestion Engine for MOT Reminder System
+
+DataFrame-native import path for GA4 job sheet exports. Each frame is
+normalised column by column (blank markers, dd/mm/YYYY dates, money
+columns) instead of row by row, then written to the database in chunks:
+customers, vehicles and existing job sheets for a chunk are looked up with
+a handful of set-based queries, job sheets are upserted on their unique
+doc_id with one statement per chunk, and the chunk is committed once.
+"""
+
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import db
+from models.customer import Customer
+from models.job_sheet import JobSheet
+from models.vehicle import Vehicle, normalise_registration
+from services.customer_resolver import CustomerResolver
+from services.job_sheet_schema import (
+    DATE_FIELDS, JOB_SHEET_FIELDS, MONEY_FIELDS, JobSheetSchema, clean_cell
+)
+from services.reminder_generation import chunked
+
+# Rows written to the database per transaction
+DEFAULT_CHUNK_SIZE = 2000
+
+# Fields used to link or create customers and vehicles but not stored on the job sheet
+LOOKUP_FIELDS = ['customer_account', 'email', 'year', 'color']
+
+# Columns rewritten when a document is imported again (created_at is kept)
+UPSERT_UPDATE_COLUMNS = [field for field in JOB_SHEET_FIELDS if field != 'doc_id'] + [
+    'normalised_reg', 'is_mot', 'linked_customer_id', 'linked_vehicle_id', 'updated_at'
+]
+
+# GA4 exports use dd/mm/YYYY; older files use ISO dates, and Excel date
+# cells arrive as datetimes
+DATE_FORMATS = ['%d/%m/%Y', '%Y-%m-%d', '%Y-%m-%d %H:%M:%S']
+
+
+def _factorize_text(values):
+    """
+    Split a column into integer codes and its distinct values cleaned once
+    (stripped, with NaN/None and 'nan'/'null' markers as ''). Exports repeat
+    the same dates, amounts and makes on many rows, so each distinct value is
+    normalised and parsed a single time.
+    """
+    codes, uniques = pd.factorize(values)
+    # Missing cells get code -1, which indexes the trailing ''
+    cleaned = np.array([clean_cell(value) for value in uniques] + [''], dtype=object)
+    return codes, cleaned
+
+
+def _clean_text(frame, columns):
+    """Cleaned text of the first non-blank candidate column per row"""
+    if not columns:
+        return np.full(len(frame), '', dtype=object)
+    codes, cleaned = _factorize_text(frame[columns[0]])
+    text = cleaned[codes]
+    for column in columns[1:]:
+        blank = text == ''
+        if not blank.any():
+            break
+        codes, cleaned = _factorize_text(frame[column])
+        text[blank] = cleaned[codes[blank]]
+    return text
+
+
+def _parse_unique(text, parse):
+    """Apply a column-wise parser to the distinct values of a text column only"""
+    codes, uniques = pd.factorize(text)
+    return np.asarray(parse(pd.Series(uniques, dtype=object)), dtype=object)[codes]
+
+
+def _parse_dates(values):
+    """dd/mm/YYYY (GA4) then YYYY-MM-DD, giving datetime.date or None"""
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    for date_format in DATE_FORMATS:
+        pending = parsed.isna() & values.ne('')
+        if not pending.any():
+            break
+        parsed[pending] = pd.to_datetime(values[pending], format=date_format, errors='coerce')
+    return parsed.dt.date.astype(object).where(parsed.notna(), None)
+
+
+def _parse_money(values):
+    """
+    Money as Decimal, going through exact integer pennies so no float error
+    reaches the Numeric(10, 2) columns. Blanks and junk become 0.
+    """
+    amounts = pd.to_numeric(values, errors='coerce')
+    amounts = amounts.where(np.isfinite(amounts), 0.0)
+    pennies = (amounts * 100).round().astype(np.int64)
+    return [Decimal(int(value)) / 100 for value in pennies]
+
+
+def _parse_ints(values):
+    """Integers such as mileage or year, truncating '12345.0'; None if blank or junk"""
+    numbers = pd.to_numeric(values, errors='coerce')
+    numbers = numbers.where(np.isfinite(numbers))
+    return np.trunc(numbers).astype('Int64').astype(object).where(numbers.notna(), None)
+
+
+def normalise_job_sheet_frame(frame, schema):
+    """
+    Convert a raw export frame to one column per JobSheet/lookup field with
+    final Python types: str, datetime.date/None, Decimal money, int/None,
+    plus the derived is_mot flag.
+    Rows without a document ID get a generated AUTO_ ID.
+    """
+    columns = schema.columns
+    normalised = {}
+
+    for field in JOB_SHEET_FIELDS + LOOKUP_FIELDS:
+        text = _clean_text(frame, columns[field])
+        if field in DATE_FIELDS:
+            values = _parse_unique(text, _parse_dates)
+        elif field in MONEY_FIELDS:
+            values = _parse_unique(text, _parse_money)
+        elif field in ('mileage', 'year'):
+            values = _parse_unique(text, _parse_ints)
+        else:
+            values = text
+        normalised[field] = values
+
+    normalised = pd.DataFrame(normalised, index=frame.index, dtype=object)
+    normalised['doc_type'] = normalised['doc_type'].mask(normalised['doc_type'].eq(''), 'JS')
+    normalised['vehicle_reg'] = normalised['vehicle_reg'].str.upper()
+    # Same rule as JobSheet.mot_flag(), for the indexed is_mot column
+    normalised['is_mot'] = (
+        (normalised['sub_mot_gross'] > 0) |
+        normalised['job_description'].str.upper().str.contains('MOT', regex=False)
+    ).astype(bool)
+
+    missing_ids = normalised['doc_id'].eq('')
+    if missing_ids.any():
+        normalised.loc[missing_ids, 'doc_id'] = [
+            f"AUTO_{str(uuid.uuid4())[:8]}" for _ in range(int(missing_ids.sum()))
+        ]
+
+    return normalised
+
+
+def validate_job_sheet_frame(normalised):
+    """
+    Drop rows that would break a chunk write. Returns (valid_frame, errors).
+    A document ID repeated within the frame keeps its last row, matching the
+    row-by-row importer where later rows updated earlier ones.
+    """
+    errors = []
+    duplicated = normalised['doc_id'].duplicated(keep='last')
+    if duplicated.any():
+        errors.append(f"{int(duplicated.sum())} rows superseded by a later row with the same document ID")
+    return normalised[~duplicated], errors
+
+
+def job_sheet_upsert_statement():
+    """INSERT ... ON CONFLICT (doc_id) DO UPDATE for the configured database"""
+    dialect_insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    statement = dialect_insert(JobSheet.__table__)
+    return statement.on_conflict_do_update(
+        index_elements=['doc_id'],
+        set_={column: statement.excluded[column] for column in UPSERT_UPDATE_COLUMNS}
+    )
+
+
+def existing_doc_ids(doc_ids):
+    """The subset of doc_ids already stored"""
+    existing = set()
+    for id_chunk in chunked(set(doc_ids)):
+        existing.update(
+            doc_id for (doc_id,) in db.session.query(JobSheet.doc_id).filter(JobSheet.doc_id.in_(id_chunk))
+        )
+    return existing
+
+
+def upsert_job_sheet_chunk(rows, statement=None):
+    """
+    Upsert one chunk of job sheet rows (dicts of JobSheet columns, unique
+    doc_ids) in a single executemany statement. The chunk runs under a
+    savepoint; if it fails, its rows are retried one by one so only the bad
+    rows are skipped and reported. normalised_reg is (re)derived from each
+    row's vehicle_reg, as the JobSheet model does on write. The caller commits.
+    """
+    statement = statement if statement is not None else job_sheet_upsert_statement()
+    for row in rows:
+        row['normalised_reg'] = normalise_registration(row.get('vehicle_reg'))
+    existing = existing_doc_ids(row['doc_id'] for row in rows)
+    report = {'rows': len(rows), 'created': 0, 'updated': 0, 'errors': []}
+
+    try:
+        with db.session.begin_nested():
+            db.session.execute(statement, rows)
+        written = rows
+    except Exception:
+        written = []
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(statement, [row])
+                written.append(row)
+            except Exception as e:
+                report['errors'].append(f"Document {row.get('doc_id')}: {str(e).splitlines()[0]}")
+
+    report['updated'] = sum(1 for row in written if row['doc_id'] in existing)
+    report['created'] = len(written) - report['updated']
+    return report
+
+
+def upsert_job_sheets(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Upsert job sheet rows chunk by chunk, committing each; returns a report per chunk"""
+    statement = job_sheet_upsert_statement()
+    reports = []
+    for number, chunk in enumerate(chunked(rows, chunk_size), start=1):
+        report = upsert_job_sheet_chunk(chunk, statement)
+        db.session.commit()
+        report['chunk'] = number
+        reports.append(report)
+    return reports
+
+
+class JobSheetIngestor:
+    """Imports job sheet frames chunk by chunk, keeping counters for the upload"""
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.schema = None
+        self.customer_resolver = None
+        self.upsert_statement = None
+        # Registrations of the job sheets written, for post-import DVLA linking
+        self.registrations = set()
+        self.results = {
+            'processed': 0,
+            'created': 0,
+            'updated': 0,
+            'customers_created': 0,
+            'vehicles_created': 0,
+            'linked_customers': 0,
+            'linked_vehicles': 0,
+            'errors': [],
+            # Per-chunk created/updated/error counts
+            'chunks': [],
+            # Job sheet field -> source header, once the first frame is seen
+            'field_mapping': None
+        }
+
+    def ingest_frames(self, frames):
+        """Import an iterable of raw DataFrames sharing one header row"""
+        for frame in frames:
+            if frame.empty:
+                continue
+            if self.schema is None:
+                self.schema = JobSheetSchema(list(frame.columns))
+                self.results['field_mapping'] = self.schema.describe()
+            self.ingest_frame(frame)
+        return self.results
+
+    def ingest_frame(self, frame):
+        """Normalise one raw DataFrame and write it in chunks"""
+        normalised, errors = validate_job_sheet_frame(normalise_job_sheet_frame(frame, self.schema))
+        self.results['errors'].extend(errors)
+        self.write_frame(normalised)
+
+    def write_frame(self, normalised):
+        """Write a frame from normalise_job_sheet_frame() in chunks, committing each"""
+        fields = list(normalised.columns)
+        records = [dict(zip(fields, values)) for values in zip(*(normalised[field].tolist() for field in fields))]
+        for chunk in chunked(records, self.chunk_size):
+            try:
+                report = self.write_chunk(chunk)
+                db.session.commit()
+                if self.customer_resolver is not None:
+                    self.customer_resolver.commit()
+                report['chunk'] = len(self.results['chunks']) + 1
+                self.results['chunks'].append(report)
+                self.results['processed'] += report['created'] + report['updated']
+            except Exception as e:
+                db.session.rollback()
+                if self.customer_resolver is not None:
+                    # Customers created for this chunk are gone, and SQLite may reuse their ids
+                    self.customer_resolver.rollback()
+                self.results['errors'].append(
+                    f"Rows with document IDs {chunk[0]['doc_id']}..{chunk[-1]['doc_id']}: {str(e)}"
+                )
+
+    def write_chunk(self, records):
+        """Link customers and vehicles, then upsert the chunk's job sheets; returns the chunk report"""
+        customer_ids = self._resolve_customers(records)
+        vehicle_ids = self._resolve_vehicles(records, customer_ids)
+
+        now = datetime.now(timezone.utc)
+        rows = []
+        for record, customer_id, vehicle_id in zip(records, customer_ids, vehicle_ids):
+            values = {field: record[field] for field in JOB_SHEET_FIELDS}
+            values['is_mot'] = record['is_mot']
+            values['linked_customer_id'] = customer_id
+            values['linked_vehicle_id'] = vehicle_id
+            values['created_at'] = now
+            values['updated_at'] = now
+            rows.append(values)
+
+            if customer_id is not None:
+                self.results['linked_customers'] += 1
+            if vehicle_id is not None:
+                self.results['linked_vehicles'] += 1
+
+        if self.upsert_statement is None:
+            self.upsert_statement = job_sheet_upsert_statement()
+        report = upsert_job_sheet_chunk(rows, self.upsert_statement)
+
+        self.results['created'] += report['created']
+        self.results['updated'] += report['updated']
+        self.results['errors'].extend(report['errors'])
+        self.registrations.update(record['vehicle_reg'] for record in records if record['vehicle_reg'])
+        return report
+
+    def _resolve_customers(self, records):
+        """
+        Customer ID per record: by external account (creating the customer if
+        the file names it), otherwise by exact normalised name.
+        """
+        accounts = {record['customer_account'] for record in records if record['customer_account']}
+        by_account = {}
+        for account_chunk in chunked(accounts):
+            rows = db.session.query(Customer.account, Customer.id).filter(Customer.account.in_(account_chunk))
+            for account, customer_id in rows:
+                by_account.setdefault(account, customer_id)
+
+        # Built before this chunk's customers are flushed, so they stay pending until the chunk commits
+        if self.customer_resolver is None and any(
+                record['customer_name'] and not record['customer_account'] for record in records):
+            self.customer_resolver = CustomerResolver.from_database()
+
+        new_customers = {}
+        for record in records:
+            account = record['customer_account']
+            if account and account not in by_account and account not in new_customers and record['customer_name']:
+                new_customers[account] = Customer(
+                    account=account,
+                    name=record['customer_name'],
+                    phone=record['contact_number'] or None,
+                    email=record['email'] or None
+                )
+        if new_customers:
+            db.session.add_all(new_customers.values())
+            db.session.flush()
+            self.results['customers_created'] += len(new_customers)
+            for account, customer in new_customers.items():
+                by_account[account] = customer.id
+                if self.customer_resolver is not None:
+                    self.customer_resolver.add_customer(customer)
+
+        customer_ids = []
+        for record in records:
+            if record['customer_account']:
+                customer_ids.append(by_account.get(record['customer_account']))
+            elif record['customer_name']:
+                customer_ids.append(self.customer_resolver.resolve(name=record['customer_name']))
+            else:
+                customer_ids.append(None)
+        return customer_ids
+
+    def _resolve_vehicles(self, records, customer_ids):
+        """Vehicle ID per record by normalised registration, creating vehicles that don't exist yet"""
+        keys = [normalise_registration(record['vehicle_reg']) for record in records]
+        by_key = {}
+        for key_chunk in chunked({key for key in keys if key}):
+            for vehicle in Vehicle.query.filter(Vehicle.normalised_reg.in_(key_chunk)).order_by(Vehicle.id):
+                by_key.setdefault(vehicle.normalised_reg, vehicle)
+
+        new_vehicles = {}
+        for record, key, customer_id in zip(records, keys, customer_ids):
+            if not key:
+                continue
+            vehicle = by_key.get(key) or new_vehicles.get(key)
+            if vehicle is None:
+                new_vehicles[key] = Vehicle(
+                    registration=record['vehicle_reg'],
+                    make=record['make'],
+                    model=record['model'],
+                    year=record['year'],
+                    color=record['color'],
+                    customer_id=customer_id
+                )
+            elif not vehicle.customer_id and customer_id:
+                # Update customer link if missing
+                vehicle.customer_id = customer_id
+
+        if new_vehicles:
+            db.session.add_all(new_vehicles.values())
+            db.session.flush()
+            self.results['vehicles_created'] += len(new_vehicles)
+            by_key.update(new_vehicles)
+
+        return [by_key[key].id if key else None for key in keys]
+
+
+def ingest_job_sheet_frames(frames, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Import raw job sheet DataFrames and return the upload counters"""
+    return JobSheetIngestor(chunk_size).ingest_frames(frames)
@@ -0,0 +1,303 @@
+"""
+Job Sheet Linking for MOT Reminder System
+
+Links job sheets to customers and vehicles with set-based UPDATE statements:
+- After an upload, only the registrations it touched are looked up with
+  DVLA (when the vehicle or its MOT expiry is missing) and linked
+- /link-data links every unlinked job sheet with UPDATE ... FROM joins on
+  the indexed normalised_reg columns, customer account and exact customer name,
+  committing per range of job sheet IDs. Only the job sheets left over
+  go through the fuzzy (substring) customer name match.
+"""
+
+from bisect import bisect_right
+from datetime import datetime
+
+from sqlalchemy import bindparam, func, select, update
+
+from database import db
+from models.customer import Customer
+from models.job_sheet import JobSheet
+from models.vehicle import Vehicle, normalise_registration
+from services.reminder_generation import chunked
+
+# Job sheet IDs covered by each UPDATE; every range is committed separately
+LINK_CHUNK_SIZE = 5000
+
+
+def clean_registrations(registrations):
+    """
+    Map normalised registration -> registration as written (stripped and
+    upper-cased), one entry per vehicle, sorted by normalised registration
+    """
+    cleaned = {}
+    for reg in registrations:
+        key = normalise_registration(reg)
+        if key:
+            cleaned.setdefault(key, reg.strip().upper())
+    return dict(sorted(cleaned.items()))
+
+
+def vehicles_by_registration(normalised_regs):
+    """Map normalised registration -> Vehicle, one IN query per chunk"""
+    vehicles = {}
+    for key_chunk in chunked(normalised_regs):
+        for vehicle in Vehicle.query.filter(Vehicle.normalised_reg.in_(key_chunk)).order_by(Vehicle.id):
+            vehicles.setdefault(vehicle.normalised_reg, vehicle)
+    return vehicles
+
+
+def link_job_sheets_to_vehicles(normalised_regs):
+    """
+    Set linked_vehicle_id on unlinked job sheets with these normalised
+    registrations where a matching vehicle exists. Returns the number of job
+    sheets linked; the caller commits.
+    """
+    matching_vehicle = select(Vehicle.id).where(Vehicle.normalised_reg == JobSheet.normalised_reg)
+
+    linked = 0
+    for key_chunk in chunked(normalised_regs):
+        result = db.session.execute(
+            update(JobSheet)
+            .where(
+                JobSheet.normalised_reg.in_(key_chunk),
+                JobSheet.linked_vehicle_id.is_(None),
+                matching_vehicle.exists()
+            )
+            .values(linked_vehicle_id=matching_vehicle.order_by(Vehicle.id).limit(1).scalar_subquery())
+            .execution_options(synchronize_session=False)
+        )
+        linked += result.rowcount
+    return linked
+
+
+def lookup_and_link_registrations(registrations, dvla_api):
+    """
+    DVLA lookup and vehicle linking for the registrations touched by an upload.
+    DVLA is only called for plates with no vehicle or no MOT expiry; job
+    sheets are then linked with set-based updates. Commits.
+    """
+    registrations = clean_registrations(registrations)
+
+    dvla_results = {
+        'checked': len(registrations),
+        'found': 0,
+        'created': 0,
+        'updated': 0,
+        'linked': 0,
+        'errors': []
+    }
+
+    vehicles = vehicles_by_registration(registrations.keys())
+
+    for key, reg in registrations.items():
+        existing_vehicle = vehicles.get(key)
+        if existing_vehicle and existing_vehicle.mot_expiry:
+            continue
+
+        try:
+            dvla_data = dvla_api.get_vehicle_details(reg)
+
+            if not existing_vehicle:
+                # Create new vehicle with DVLA data
+                if dvla_data and dvla_data.get('registrationNumber'):
+                    dvla_results['found'] += 1
+
+                    new_vehicle = Vehicle(
+                        registration=reg,
+                        make=dvla_data.get('make'),
+                        model=dvla_data.get('model'),
+                        color=dvla_data.get('primaryColour'),
+                        year=int(dvla_data.get('yearOfManufacture')) if dvla_data.get('yearOfManufacture') else None,
+                        mot_expiry=datetime.strptime(dvla_data['motExpiryDate'], '%Y-%m-%d').date() if dvla_data.get('motExpiryDate') else None
+                    )
+                    db.session.add(new_vehicle)
+                    vehicles[key] = new_vehicle
+                    dvla_results['created'] += 1
+
+            elif dvla_data and dvla_data.get('motExpiryDate'):
+                # Update existing vehicle with DVLA data if MOT expiry is missing
+                dvla_results['found'] += 1
+                existing_vehicle.mot_expiry = datetime.strptime(dvla_data['motExpiryDate'], '%Y-%m-%d').date()
+
+                # Update other fields if missing
+                if not existing_vehicle.make and dvla_data.get('make'):
+                    existing_vehicle.make = dvla_data['make']
+                if not existing_vehicle.model and dvla_data.get('model'):
+                    existing_vehicle.model = dvla_data['model']
+                if not existing_vehicle.color and dvla_data.get('primaryColour'):
+                    existing_vehicle.color = dvla_data['primaryColour']
+                if not existing_vehicle.year and dvla_data.get('yearOfManufacture'):
+                    existing_vehicle.year = int(dvla_data['yearOfManufacture'])
+
+                dvla_results['updated'] += 1
+
+        except Exception as e:
+            error_msg = f"Error processing {reg}: {str(e)}"
+            dvla_results['errors'].append(error_msg)
+            print(error_msg)
+
+    db.session.flush()
+    dvla_results['linked'] = link_job_sheets_to_vehicles(registrations.keys())
+    db.session.commit()
+
+    return dvla_results
+
+
+def name_key(column):
+    """SQL expression for a name compared without surrounding spaces or case"""
+    return func.lower(func.trim(column))
+
+
+def _id_ranges(condition):
+    """Inclusive job sheet ID ranges covering the rows that match condition"""
+    low, high = db.session.query(func.min(JobSheet.id), func.max(JobSheet.id)).filter(condition).one()
+    if low is None:
+        return
+    for start in range(low, high + 1, LINK_CHUNK_SIZE):
+        yield start, start + LINK_CHUNK_SIZE - 1
+
+
+def _update_by_range(condition, build_statement):
+    """Run build_statement(low, high) for each ID range, committing each; returns rows updated"""
+    updated = 0
+    for low, high in _id_ranges(condition):
+        result = db.session.execute(
+            build_statement(low, high).execution_options(synchronize_session=False)
+        )
+        updated += result.rowcount
+        db.session.commit()
+    return updated
+
+
+def link_vehicles_by_registration():
+    """Link unlinked job sheets to the vehicle with the same normalised registration"""
+    vehicles = (
+        select(Vehicle.normalised_reg.label('normalised_reg'), func.min(Vehicle.id).label('vehicle_id'))
+        .where(Vehicle.normalised_reg.isnot(None))
+        .group_by(Vehicle.normalised_reg)
+        .subquery()
+    )
+    unlinked = JobSheet.linked_vehicle_id.is_(None) & JobSheet.normalised_reg.isnot(None)
+
+    return _update_by_range(unlinked, lambda low, high: (
+        update(JobSheet)
+        .where(
+            JobSheet.id.between(low, high),
+            unlinked,
+            JobSheet.normalised_reg == vehicles.c.normalised_reg
+        )
+        .values(linked_vehicle_id=vehicles.c.vehicle_id)
+    ))
+
+
+def link_customers_by_account():
+    """Link unlinked job sheets whose external customer ID is a customer's account"""
+    accounts = (
+        select(Customer.account.label('account'), func.min(Customer.id).label('customer_id'))
+        .where(Customer.account.isnot(None), Customer.account != '')
+        .group_by(Customer.account)
+        .subquery()
+    )
+    unlinked = JobSheet.linked_customer_id.is_(None) & JobSheet.customer_id_external.isnot(None)
+
+    return _update_by_range(unlinked, lambda low, high: (
+        update(JobSheet)
+        .where(
+            JobSheet.id.between(low, high),
+            unlinked,
+            JobSheet.customer_id_external == accounts.c.account
+        )
+        .values(linked_customer_id=accounts.c.customer_id)
+    ))
+
+
+def link_customers_by_name():
+    """Link unlinked job sheets to the only customer with the same normalised name"""
+    key = name_key(Customer.name)
+    names = (
+        select(key.label('name_key'), func.min(Customer.id).label('customer_id'))
+        .where(Customer.name.isnot(None), Customer.name != '')
+        .group_by(key)
+        # Names shared by several customers are ambiguous
+        .having(func.count(Customer.id) == 1)
+        .subquery()
+    )
+    unlinked = JobSheet.linked_customer_id.is_(None) & JobSheet.customer_name.isnot(None)
+
+    return _update_by_range(unlinked, lambda low, high: (
+        update(JobSheet)
+        .where(
+            JobSheet.id.between(low, high),
+            unlinked,
+            name_key(JobSheet.customer_name) == names.c.name_key
+        )
+        .values(linked_customer_id=names.c.customer_id)
+    ))
+
+
+def link_customers_by_name_fragment():
+    """
+    Fuzzy fallback for the job sheets still unlinked: the first customer (by
+    ID) whose name contains the job sheet's customer name, ignoring case -
+    what /link-data used to do with ILIKE '%name%' for every row.
+    """
+    leftover_names = [
+        name for (name,) in db.session.query(JobSheet.customer_name).filter(
+            JobSheet.linked_customer_id.is_(None),
+            JobSheet.customer_name.isnot(None),
+            func.trim(JobSheet.customer_name) != ''
+        ).distinct()
+    ]
+    if not leftover_names:
+        return 0
+
+    # Search one newline-joined string of all names: str.find runs in C, and
+    # the earliest match belongs to the lowest customer ID
+    customer_ids = []
+    offsets = []
+    parts = []
+    position = 0
+    for customer_id, name in db.session.query(Customer.id, Customer.name).order_by(Customer.id):
+        name = (name or '').lower().replace('\n', ' ')
+        customer_ids.append(customer_id)
+        offsets.append(position)
+        parts.append(name)
+        position += len(name) + 1
+    haystack = '\n'.join(parts)
+
+    matches = []
+    for name in leftover_names:
+        needle = name.strip().lower()
+        if '\n' in needle:
+            continue
+        found = haystack.find(needle)
+        if found >= 0:
+            matches.append({'match_name': name, 'match_customer_id': customer_ids[bisect_right(offsets, found) - 1]})
+
+    table = JobSheet.__table__
+    statement = (
+        update(table)
+        .where(table.c.linked_customer_id.is_(None), table.c.customer_name == bindparam('match_name'))
+        .values(linked_customer_id=bindparam('match_customer_id'))
+    )
+
+    linked = 0
+    for chunk in chunked(matches, LINK_CHUNK_SIZE):
+        linked += db.session.execute(statement, chunk).rowcount
+        db.session.commit()
+    return linked
+
+
+def link_all_job_sheets():
+    """Link every unlinked job sheet; exact keys first, fuzzy names last"""
+    by_account = link_customers_by_account()
+    by_name = link_customers_by_name()
+    by_fragment = link_customers_by_name_fragment()
+    vehicles_linked = link_vehicles_by_registration()
+
+    return {
+        'customers_linked': by_account + by_name + by_fragment,
+        'vehicles_linked': vehicles_linked,
+        'customers_linked_by': {'account': by_account, 'name': by_name, 'fuzzy_name': by_fragment}
+    }
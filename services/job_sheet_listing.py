@@ -0,0 +1,171 @@
+"""
+Job Sheet Listing for MOT Reminder System
+
+Keyset (cursor) pagination for /api/job-sheets, newest first on
+(date_created, id). Each page continues from the last row of the previous
+page with an indexed range condition instead of OFFSET, so a deep page
+costs the same as the first. Totals come from an approximate count cached
+per filter set and refreshed in a background thread once stale, so pages
+don't run COUNT(*) over the filtered set.
+"""
+
+import base64
+import json
+import threading
+import time
+from datetime import date
+
+from sqlalchemy import tuple_
+
+from models.job_sheet import JobSheet
+from models.vehicle import normalise_registration
+
+FILTERS = ('customer_name', 'vehicle_reg', 'date_from', 'date_to', 'doc_type')
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+
+# How long a cached total is served before a background refresh, and how
+# many filter sets are remembered
+COUNT_TTL_SECONDS = 60
+MAX_CACHED_COUNTS = 256
+
+
+class InvalidCursor(ValueError):
+    """A cursor token that was not produced by encode_cursor()"""
+
+
+def encode_cursor(job_sheet):
+    """Opaque token for the position just after this job sheet"""
+    position = {
+        'd': job_sheet.date_created.isoformat() if job_sheet.date_created else None,
+        'i': job_sheet.id
+    }
+    token = base64.urlsafe_b64encode(json.dumps(position, separators=(',', ':')).encode())
+    return token.decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """(date_created or None, id) from a cursor token"""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        created = date.fromisoformat(position['d']) if position['d'] is not None else None
+        if not isinstance(position['i'], int):
+            raise TypeError(position['i'])
+        return created, position['i']
+    except (ValueError, TypeError, KeyError) as e:
+        raise InvalidCursor(f"Invalid cursor: {token}") from e
+
+
+def filtered_job_sheets(filters):
+    """JobSheet query with the listing filters applied (dates already parsed)"""
+    query = JobSheet.query
+    if filters.get('customer_name'):
+        query = query.filter(JobSheet.customer_name.ilike(f"%{filters['customer_name']}%"))
+    if filters.get('vehicle_reg'):
+        normalised = normalise_registration(filters['vehicle_reg'])
+        if normalised:
+            query = query.filter(JobSheet.normalised_reg.like(f'%{normalised}%'))
+    if filters.get('date_from'):
+        query = query.filter(JobSheet.date_created >= filters['date_from'])
+    if filters.get('date_to'):
+        query = query.filter(JobSheet.date_created <= filters['date_to'])
+    if filters.get('doc_type'):
+        query = query.filter(JobSheet.doc_type == filters['doc_type'])
+    return query
+
+
+def list_job_sheets(filters, cursor=None, per_page=DEFAULT_PER_PAGE):
+    """
+    One page of job sheets after the cursor, newest first. Dated rows come
+    first as a (date_created, id) range on idx_job_sheets_date_id; undated
+    rows follow by id. Returns (job_sheets, next_cursor or None).
+    """
+    created, last_id = decode_cursor(cursor) if cursor else (None, None)
+    query = filtered_job_sheets(filters)
+    page = []
+
+    if cursor is None or created is not None:
+        dated = query.filter(JobSheet.date_created.isnot(None))
+        if created is not None:
+            dated = dated.filter(tuple_(JobSheet.date_created, JobSheet.id) < tuple_(created, last_id))
+        page = dated.order_by(JobSheet.date_created.desc(), JobSheet.id.desc()).limit(per_page + 1).all()
+
+    if len(page) <= per_page:
+        undated = query.filter(JobSheet.date_created.is_(None))
+        if created is None and last_id is not None:
+            undated = undated.filter(JobSheet.id < last_id)
+        page += undated.order_by(JobSheet.id.desc()).limit(per_page + 1 - len(page)).all()
+
+    if len(page) > per_page:
+        page = page[:per_page]
+        return page, encode_cursor(page[-1])
+    return page, None
+
+
+class ApproximateCounts:
+    """
+    Row counts per filter set, served from memory. A missing count is
+    computed in the request; a stale one is returned as is while a
+    background thread recomputes it.
+    """
+
+    def __init__(self, ttl_seconds=COUNT_TTL_SECONDS, max_entries=MAX_CACHED_COUNTS):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._counts = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(filters):
+        return tuple(sorted((name, str(value)) for name, value in filters.items() if value))
+
+    def get(self, filters, app=None):
+        """(count, computed_at) for the filter set, refreshing it in the background when stale"""
+        key = self.key(filters)
+        with self._lock:
+            cached = self._counts.get(key)
+        if cached is None:
+            return self.refresh(filters)
+
+        count, computed_at = cached
+        if app is not None and time.time() - computed_at > self.ttl_seconds:
+            self._refresh_in_background(app, filters)
+        return count, computed_at
+
+    def refresh(self, filters):
+        """Recompute the count for a filter set now"""
+        key = self.key(filters)
+        try:
+            entry = (filtered_job_sheets(filters).order_by(None).count(), time.time())
+            with self._lock:
+                self._counts.pop(key, None)
+                self._counts[key] = entry
+                # Dicts keep insertion order, so the least recently refreshed go first
+                while len(self._counts) > self.max_entries:
+                    del self._counts[next(iter(self._counts))]
+            return entry
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _refresh_in_background(self, app, filters):
+        key = self.key(filters)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run_refresh():
+            with app.app_context():
+                self.refresh(filters)
+
+        threading.Thread(target=run_refresh, daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+job_sheet_counts = ApproximateCounts()
@@ -0,0 +1,198 @@
+"""
+Job Sheet Schema Resolution for MOT Reminder System
+
+GA4 exports and older job sheet files name their columns differently
+('Customer Name', 'customer_name', 'Customer', ...). A JobSheetSchema is
+resolved once from a file's header row: for each JobSheet field it keeps
+only the candidate headers that the file actually has, so every row of the
+file is extracted without re-trying absent column names.
+"""
+
+import math
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import pandas as pd
+
+# Cell values treated as blank after str().strip().lower()
+BLANK_VALUES = frozenset(['nan', 'none', '', 'null'])
+
+# Candidate source headers for each field, in order of preference
+FIELD_CANDIDATES = {
+    'doc_id': ['id', 'ID Doc', 'Doc ID', 'Document ID', 'document_id'],
+    'doc_type': ['doc_type', 'Doc Type', 'Document Type', 'Type'],
+    'doc_no': ['doc_number', 'Doc No', 'Document Number', 'Number', 'Job Number'],
+    'date_created': ['date_created', 'Date Created', 'Created Date', 'Date'],
+    'date_issued': ['date_issued', 'Date Issued', 'Issued Date', 'Issue Date'],
+    'date_paid': ['date_paid', 'Date Paid', 'Paid Date', 'Payment Date'],
+    'customer_account': ['customer_account', 'Customer Account', 'ID Customer'],
+    'customer_id_external': ['customer_account', 'ID Customer', 'Customer ID', 'Customer'],
+    'customer_name': ['customer_name', 'Customer Name', 'Customer', 'Name', 'Client Name'],
+    'customer_address': ['customer_address', 'Customer Address', 'Address', 'Customer Addr'],
+    'contact_number': ['contact_number', 'Contact Number', 'Phone', 'Mobile', 'Contact', 'Phone Number'],
+    'email': ['email', 'Email', 'customer_email'],
+    'postcode': ['postcode', 'Postcode', 'Post Code'],
+    'vehicle_id_external': ['ID Vehicle', 'Vehicle ID', 'Vehicle'],
+    'vehicle_reg': ['vehicle_reg', 'Vehicle Reg', 'Registration', 'Reg', 'Plate', 'Number Plate'],
+    'make': ['vehicle_make', 'Make', 'Vehicle Make', 'Manufacturer'],
+    'model': ['vehicle_model', 'Model', 'Vehicle Model'],
+    'year': ['year', 'Year', 'Model Year'],
+    'color': ['color', 'Color', 'Colour'],
+    'vin': ['VIN', 'Chassis Number', 'Vehicle VIN'],
+    'mileage': ['Mileage', 'Miles', 'Odometer'],
+    'sub_labour_net': ['labour_net', 'Sub Labour Net', 'Labour Net', 'Labor Net'],
+    'sub_labour_tax': ['labour_tax', 'Sub Labour Tax', 'Labour Tax', 'Labor Tax'],
+    'sub_labour_gross': ['labour_gross', 'Sub Labour Gross', 'Labour Gross', 'Labor Gross'],
+    'sub_parts_net': ['parts_net', 'Sub Parts Net', 'Parts Net'],
+    'sub_parts_tax': ['parts_tax', 'Sub Parts Tax', 'Parts Tax'],
+    'sub_parts_gross': ['parts_gross', 'Sub Parts Gross', 'Parts Gross'],
+    'sub_mot_net': ['mot_net', 'Sub MOT Net', 'MOT Net'],
+    'sub_mot_tax': ['mot_tax', 'Sub MOT Tax', 'MOT Tax'],
+    'sub_mot_gross': ['mot_gross', 'Sub MOT Gross', 'MOT Gross'],
+    'vat': ['total_tax', 'VAT', 'Tax', 'Sales Tax'],
+    'grand_total': ['total_gross', 'Grand Total', 'Total', 'Amount', 'Final Total'],
+    'job_description': ['Job Description', 'Description', 'Work Description', 'Notes'],
+}
+
+MONEY_FIELDS = [
+    'sub_labour_net', 'sub_labour_tax', 'sub_labour_gross',
+    'sub_parts_net', 'sub_parts_tax', 'sub_parts_gross',
+    'sub_mot_net', 'sub_mot_tax', 'sub_mot_gross',
+    'vat', 'grand_total'
+]
+
+DATE_FIELDS = ['date_created', 'date_issued', 'date_paid']
+
+# Fields copied onto the JobSheet model by extract_job_sheet()
+JOB_SHEET_FIELDS = [
+    'doc_id', 'doc_type', 'doc_no', 'date_created', 'date_issued', 'date_paid',
+    'customer_id_external', 'customer_name', 'customer_address', 'contact_number',
+    'vehicle_id_external', 'vehicle_reg', 'make', 'model', 'vin', 'mileage',
+    *MONEY_FIELDS, 'job_description'
+]
+
+
+def clean_cell(value):
+    """Return a cell as a stripped string, or '' for None, NaN, NaT and 'nan'/'null' text"""
+    if type(value) is str:
+        text = value.strip()
+    elif value is None or value is pd.NaT or value is pd.NA:
+        return ''
+    elif isinstance(value, float) and math.isnan(value):
+        return ''
+    else:
+        text = str(value).strip()
+    # Only short strings can be one of the blank markers
+    if len(text) <= 4 and text.lower() in BLANK_VALUES:
+        return ''
+    return text
+
+
+def parse_date(date_str):
+    """Parse DD/MM/YYYY (GA4) or YYYY-MM-DD dates, returning None if neither fits"""
+    if not date_str or date_str.strip() == '':
+        return None
+    try:
+        return datetime.strptime(date_str.strip(), '%d/%m/%Y').date()
+    except ValueError:
+        try:
+            return datetime.strptime(date_str.strip(), '%Y-%m-%d').date()
+        except ValueError:
+            return None
+
+
+def parse_decimal(value_str):
+    """Parse a money value, treating blanks and junk as zero"""
+    if not value_str or value_str.strip() == '':
+        return Decimal('0')
+    try:
+        return Decimal(str(value_str).strip())
+    except (InvalidOperation, ValueError):
+        return Decimal('0')
+
+
+def parse_int(value_str):
+    """Parse an integer such as mileage or year, allowing '12345.0'"""
+    if not value_str or value_str.strip() == '':
+        return None
+    try:
+        return int(float(str(value_str).strip()))
+    except (ValueError, TypeError):
+        return None
+
+
+class JobSheetSchema:
+    """Source-header mapping for one file, resolved once from its header row"""
+
+    def __init__(self, headers, candidates=FIELD_CANDIDATES):
+        header_set = set(headers)
+        self.headers = list(headers)
+        self.columns = {
+            field: [name for name in names if name in header_set]
+            for field, names in candidates.items()
+        }
+        self._job_sheet_plan = None
+
+    @classmethod
+    def from_row(cls, row):
+        """Resolve a schema from the keys of a row dict"""
+        return cls(row.keys())
+
+    def source_column(self, field):
+        """The preferred source header for a field, or None if the file has none"""
+        columns = self.columns.get(field)
+        return columns[0] if columns else None
+
+    def describe(self):
+        """Field -> source header mapping, for logging"""
+        return {field: columns[0] for field, columns in self.columns.items() if columns}
+
+    def get(self, row, field, default=''):
+        """
+        Get a field's value from a row. If the file has several candidate
+        headers for the field, the first non-blank one wins, as before.
+        """
+        for name in self.columns[field]:
+            value = clean_cell(row.get(name))
+            if value:
+                return value
+        return default
+
+    def _compile_job_sheet_plan(self):
+        """
+        Split JobSheet fields into those this file can supply and constant
+        defaults for the rest, so absent columns cost nothing per row.
+        """
+        converters = {field: parse_date for field in DATE_FIELDS}
+        converters.update({field: parse_decimal for field in MONEY_FIELDS})
+        converters['mileage'] = parse_int
+        converters['vehicle_reg'] = str.upper
+        defaults = {'doc_type': 'JS'}
+
+        plan = []
+        constants = {}
+        for field in JOB_SHEET_FIELDS:
+            convert = converters.get(field)
+            default = defaults.get(field, '')
+            columns = self.columns[field]
+            if columns:
+                plan.append((field, columns[0] if len(columns) == 1 else None, convert, default))
+            else:
+                constants[field] = convert(default) if convert else default
+        return plan, constants
+
+    def extract_job_sheet(self, row):
+        """Extract and convert every JobSheet column for a row (doc_id may be '')"""
+        if self._job_sheet_plan is None:
+            self._job_sheet_plan = self._compile_job_sheet_plan()
+        plan, constants = self._job_sheet_plan
+
+        job_sheet_data = dict(constants)
+        for field, column, convert, default in plan:
+            if column is not None:
+                value = clean_cell(row.get(column)) or default
+            else:
+                value = self.get(row, field, default)
+            job_sheet_data[field] = convert(value) if convert else value
+
+        return job_sheet_data
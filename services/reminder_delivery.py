@@ -0,0 +1,473 @@
+"""
+Reminder Delivery for MOT Reminder System
+
+Outbound reminder messages go through the outbox_messages table.
+/api/reminders/process writes an email and/or SMS per due reminder in the
+same transaction that marks the reminder queued; a worker (outbox_worker.py
+or /api/reminders/outbox/drain) then claims pending messages in batches.
+Emails are sent here over one persistent, authenticated SMTP session,
+reconnecting when the server drops it; SMS go through sms_dispatch.
+Temporary failures are retried with backoff, permanent ones fail the
+message, and each outcome is recorded on the reminder.
+
+Delivery is at least once: a worker that dies mid-batch leaves its claimed
+messages to be reclaimed after CLAIM_TIMEOUT.
+"""
+
+import logging
+import os
+import smtplib
+import ssl
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+
+from sqlalchemy import and_, bindparam, case, exists, func, or_, select, update
+from sqlalchemy.orm import joinedload
+
+from database import db
+from models.outbox import OutboxMessage, OutboxMessageReminder
+from models.reminder import Reminder
+from models.vehicle import Vehicle
+from services.reminder_generation import chunked
+from services.reminder_templates import CHANNELS, digest_values, get_template, template_values
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 200
+
+# A message is given up after this many failed attempts
+MAX_ATTEMPTS = 5
+
+# Retry delay after the first failure; doubles with each further attempt
+RETRY_BASE_DELAY = timedelta(minutes=1)
+
+# Messages claimed longer ago than this by a worker that never finished are sent again
+CLAIM_TIMEOUT = timedelta(minutes=15)
+
+# In digest mode, reminders due this many days ahead join a customer's digest
+DEFAULT_DIGEST_WINDOW_DAYS = 7
+
+
+class DeliveryUnavailable(Exception):
+    """The mail server could not be reached or refused the session"""
+
+
+class SMTPSession:
+    """
+    One SMTP connection reused for many messages. The connection (with
+    STARTTLS and login) is opened on the first send, reopened after the
+    server drops it or after max_messages_per_connection messages, and
+    closed with close().
+    """
+
+    def __init__(self, host, port=587, username=None, password=None, sender=None, use_tls=True,
+                 timeout=30, max_messages_per_connection=500):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.max_messages_per_connection = max_messages_per_connection
+        self.connections_opened = 0
+        self._server = None
+        self._sent_on_connection = 0
+
+    @classmethod
+    def from_environment(cls):
+        return cls(
+            host=os.environ['SMTP_SERVER'],
+            port=int(os.environ.get('SMTP_PORT', 587)),
+            username=os.environ.get('SMTP_USERNAME'),
+            password=os.environ.get('SMTP_PASSWORD'),
+            sender=os.environ.get('SENDER_EMAIL', 'garage@example.com'),
+            use_tls=os.environ.get('SMTP_USE_TLS', 'true').lower() not in ('0', 'false', 'no'),
+            max_messages_per_connection=int(os.environ.get('SMTP_MAX_MESSAGES_PER_CONNECTION', 500))
+        )
+
+    def _connect(self):
+        try:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                server.ehlo()
+                if self.use_tls:
+                    server.starttls(context=ssl.create_default_context())
+                    server.ehlo()
+                if self.username:
+                    server.login(self.username, self.password)
+            except Exception:
+                server.close()
+                raise
+        except (smtplib.SMTPException, OSError) as e:
+            raise DeliveryUnavailable(f"Could not open SMTP session with {self.host}:{self.port}: {e}") from e
+
+        self._server = server
+        self._sent_on_connection = 0
+        self.connections_opened += 1
+        logger.info(f"Opened SMTP session with {self.host}:{self.port}")
+
+    def send(self, message):
+        """Send an EmailMessage, reconnecting once if the connection has gone away"""
+        if self._server is not None and self._sent_on_connection >= self.max_messages_per_connection:
+            self.close()
+
+        for attempt in range(2):
+            if self._server is None:
+                self._connect()
+            try:
+                self._server.send_message(message)
+                self._sent_on_connection += 1
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                logger.warning(f"SMTP connection lost, reconnecting: {e}")
+                self._discard()
+                if attempt:
+                    raise DeliveryUnavailable(f"SMTP connection lost: {e}") from e
+
+    def _discard(self):
+        if self._server is not None:
+            try:
+                self._server.close()
+            finally:
+                self._server = None
+
+    def close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._discard()
+
+
+class LoggingTransport:
+    """Stands in for SMTP when no SMTP_SERVER is configured (local development)"""
+
+    def __init__(self, sender=None):
+        self.sender = sender or os.environ.get('SENDER_EMAIL', 'garage@example.com')
+        self.connections_opened = 0
+
+    def send(self, message):
+        logger.info(f"[SIMULATED EMAIL] To: {message['To']}, Subject: {message['Subject']}")
+
+    def close(self):
+        pass
+
+
+def email_transport():
+    """The configured email transport: SMTP if SMTP_SERVER is set, otherwise simulated"""
+    if os.environ.get('SMTP_SERVER'):
+        return SMTPSession.from_environment()
+    return LoggingTransport()
+
+
+def due_reminders_query(today):
+    """Scheduled reminders due by today, with vehicle and customer loaded in the same query"""
+    return Reminder.query.filter(
+        Reminder.status == 'scheduled',
+        Reminder.reminder_date <= today
+    ).options(
+        joinedload(Reminder.vehicle).joinedload(Vehicle.customer)
+    ).order_by(Reminder.reminder_date, Reminder.id)
+
+
+def _queue_single(reminder, vehicle, customer, templates, results):
+    values = template_values(vehicle, customer)
+    messages = []
+    if customer.email:
+        messages.append(OutboxMessage(
+            reminder_id=reminder.id,
+            channel='email',
+            recipient=customer.email,
+            subject=templates['email'].subject.render(values),
+            body=templates['email'].body.render(values)
+        ))
+        reminder.email_status = 'queued'
+        results['emails_queued'] += 1
+    if customer.phone:
+        messages.append(OutboxMessage(
+            reminder_id=reminder.id,
+            channel='sms',
+            recipient=customer.phone,
+            body=templates['sms'].body.render(values)
+        ))
+        reminder.sms_status = 'queued'
+        results['sms_queued'] += 1
+    return messages
+
+
+def _queue_digest(reminders, customer, templates, results):
+    """One message per channel listing all of a customer's reminders"""
+    vehicles = [reminder.vehicle for reminder in reminders]
+    messages = []
+    for channel, recipient in (('email', customer.email), ('sms', customer.phone)):
+        if not recipient:
+            continue
+        template = templates[f'{channel}_digest']
+        values = digest_values(channel, customer, vehicles)
+        messages.append(OutboxMessage(
+            channel=channel,
+            recipient=recipient,
+            subject=template.subject.render(values) if template.subject else None,
+            body=template.body.render(values),
+            digest_reminders=[OutboxMessageReminder(reminder_id=reminder.id) for reminder in reminders]
+        ))
+        for reminder in reminders:
+            setattr(reminder, f'{channel}_status', 'queued')
+        results['emails_queued' if channel == 'email' else 'sms_queued'] += 1
+        results['digests_queued'] += 1
+    return messages
+
+
+def queue_reminders(reminders, templates=None, digest=False):
+    """
+    Write outbox messages for reminders and mark them queued. Each reminder
+    gets an email and/or SMS depending on which contact details its
+    customer has; with digest, a customer with several reminders instead
+    gets one email and/or SMS listing all of their vehicles. Reminders
+    without a vehicle, customer or contact details are marked failed.
+    templates maps channel to reminder_templates.ChannelTemplate and
+    defaults to the saved ones. Returns counters; the caller commits.
+    """
+    templates = templates or {}
+    templates = {channel: templates.get(channel) or get_template(channel) for channel in CHANNELS}
+    results = {'reminders_queued': 0, 'reminders_failed': 0, 'emails_queued': 0, 'sms_queued': 0,
+               'digests_queued': 0}
+
+    by_customer = {}
+    for reminder in reminders:
+        vehicle = reminder.vehicle
+        customer = vehicle.customer if vehicle else None
+        if not customer or not (customer.email or customer.phone):
+            reminder.status = 'failed'
+            results['reminders_failed'] += 1
+            continue
+        by_customer.setdefault(customer.id, (customer, []))[1].append(reminder)
+
+    messages = []
+    for customer, customer_reminders in by_customer.values():
+        if digest and len(customer_reminders) > 1:
+            messages.extend(_queue_digest(customer_reminders, customer, templates, results))
+        else:
+            for reminder in customer_reminders:
+                messages.extend(_queue_single(reminder, reminder.vehicle, customer, templates, results))
+        for reminder in customer_reminders:
+            reminder.status = 'queued'
+        results['reminders_queued'] += len(customer_reminders)
+
+    db.session.add_all(messages)
+    return results
+
+
+def queue_due_reminders(today, digest=False, digest_window_days=DEFAULT_DIGEST_WINDOW_DAYS):
+    """
+    Queue the reminders due by today. With digest, reminders due within
+    digest_window_days after today are brought forward for customers who
+    already have one due, so they go out in the same digest instead of
+    separately a few days later. The caller commits.
+    """
+    if not digest:
+        return queue_reminders(due_reminders_query(today).all())
+
+    reminders = due_reminders_query(today + timedelta(days=digest_window_days)).all()
+    customers_due = {
+        reminder.vehicle.customer_id for reminder in reminders
+        if reminder.reminder_date <= today and reminder.vehicle and reminder.vehicle.customer_id is not None
+    }
+    # Vehicles without a customer share no digest, so none of theirs is brought forward
+    return queue_reminders([
+        reminder for reminder in reminders
+        if reminder.reminder_date <= today or (
+            reminder.vehicle and reminder.vehicle.customer_id is not None
+            and reminder.vehicle.customer_id in customers_due
+        )
+    ], digest=True)
+
+
+def retry_delay(attempts):
+    """How long to wait before retrying a message that has failed `attempts` times"""
+    return RETRY_BASE_DELAY * 2 ** (attempts - 1)
+
+
+def _build_email(row, sender):
+    message = EmailMessage()
+    message['From'] = sender
+    message['To'] = row.recipient
+    message['Subject'] = row.subject or ''
+    message['Date'] = formatdate(localtime=True)
+    message['Message-ID'] = make_msgid()
+    message.set_content(row.body)
+    return message
+
+
+def _is_permanent(error):
+    """Whether the server rejected the message itself (5xx) rather than failing temporarily"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(500 <= code < 600 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 500 <= error.smtp_code < 600
+    return False
+
+
+def claim_outbox_batch(channel, now, batch_size):
+    """Atomically mark the next batch of due messages for a channel as sending and return them"""
+    outbox = OutboxMessage.__table__
+    claimable = select(outbox.c.id).where(
+        outbox.c.channel == channel,
+        or_(
+            (outbox.c.status == 'pending') & (outbox.c.next_attempt_at <= now),
+            (outbox.c.status == 'sending') & (outbox.c.claimed_at < now - CLAIM_TIMEOUT)
+        )
+    ).order_by(outbox.c.id).limit(batch_size)
+
+    rows = db.session.execute(
+        update(outbox)
+        .where(outbox.c.id.in_(claimable))
+        .values(status='sending', claimed_at=now)
+        .returning(outbox.c.id, outbox.c.reminder_id, outbox.c.recipient, outbox.c.subject,
+                   outbox.c.body, outbox.c.attempts)
+    ).all()
+    db.session.commit()
+    return sorted(rows, key=lambda row: row.id)
+
+
+def _reminders_covered(rows):
+    """{message id: set of reminder ids} for outbox rows, including the reminders of digests"""
+    covered = {row.id: {row.reminder_id} if row.reminder_id else set() for row in rows}
+    digests = [row.id for row in rows if not row.reminder_id]
+    links = OutboxMessageReminder.__table__
+    for ids in chunked(digests):
+        for message_id, reminder_id in db.session.execute(
+            select(links.c.message_id, links.c.reminder_id).where(links.c.message_id.in_(ids))
+        ):
+            covered[message_id].add(reminder_id)
+    return covered
+
+
+def record_delivery_outcomes(channel, now, sent, failed, retry):
+    """
+    Write a batch's outcomes to the outbox and its reminders. sent holds
+    claimed rows, failed (row, attempts, error) and retry (row, attempts,
+    error, next attempt). A reminder is sent once any of its messages is; it
+    fails when a message fails and none of its others is sent or pending.
+    """
+    outbox = OutboxMessage.__table__
+    if sent:
+        db.session.execute(
+            update(outbox).where(outbox.c.id == bindparam('message_id'))
+            .values(status='sent', sent_at=now, attempts=outbox.c.attempts + 1, last_error=None, updated_at=now),
+            [{'message_id': row.id} for row in sent]
+        )
+    unsent = [
+        {'message_id': row.id, 'new_status': 'failed', 'new_attempts': attempts, 'error': error, 'next_at': None}
+        for row, attempts, error in failed
+    ] + [
+        {'message_id': row.id, 'new_status': 'pending', 'new_attempts': attempts, 'error': error, 'next_at': next_at}
+        for row, attempts, error, next_at in retry
+    ]
+    if unsent:
+        db.session.execute(
+            update(outbox).where(outbox.c.id == bindparam('message_id'))
+            .values(status=bindparam('new_status'), attempts=bindparam('new_attempts'),
+                    last_error=bindparam('error'), next_attempt_at=bindparam('next_at'), updated_at=now),
+            unsent
+        )
+
+    reminders = Reminder.__table__
+    links = OutboxMessageReminder.__table__
+    covered = _reminders_covered([row for row in sent] + [row for row, _, _ in failed])
+    channel_status = reminders.c[f'{channel}_status']
+    now_sent = reminders.c.status.in_(('queued', 'failed'))
+    sent_reminders = set().union(*(covered[row.id] for row in sent))
+    for ids in chunked(list(sent_reminders)):
+        db.session.execute(
+            update(reminders).where(reminders.c.id.in_(ids)).values({
+                channel_status: 'sent',
+                reminders.c.status: case((now_sent, 'sent'), else_=reminders.c.status),
+                reminders.c.sent_at: case((now_sent, now), else_=reminders.c.sent_at),
+                reminders.c.updated_at: now
+            })
+        )
+    still_deliverable = exists().where(
+        or_(outbox.c.reminder_id == reminders.c.id,
+            outbox.c.id.in_(
+                select(links.c.message_id).where(links.c.reminder_id == reminders.c.id).correlate(reminders)
+            )),
+        outbox.c.status.in_(('pending', 'sending', 'sent'))
+    )
+    now_failed = and_(reminders.c.status == 'queued', ~still_deliverable)
+    failed_reminders = set().union(*(covered[row.id] for row, _, _ in failed))
+    for ids in chunked(list(failed_reminders)):
+        db.session.execute(
+            update(reminders).where(reminders.c.id.in_(ids)).values({
+                channel_status: 'failed',
+                reminders.c.status: case((now_failed, 'failed'), else_=reminders.c.status),
+                reminders.c.updated_at: now
+            })
+        )
+    db.session.commit()
+
+
+def drain_outbox(transport, batch_size=DEFAULT_BATCH_SIZE, max_attempts=MAX_ATTEMPTS, now=None):
+    """
+    Send every due email in the outbox through transport, batch by batch.
+    Stops early (leaving the rest pending) if the transport becomes
+    unavailable. The transport is left open for the caller to reuse or close.
+    """
+    results = {'sent': 0, 'retrying': 0, 'failed': 0, 'batches': 0, 'error': None}
+    sender = getattr(transport, 'sender', None) or os.environ.get('SENDER_EMAIL', 'garage@example.com')
+    connections_before = transport.connections_opened
+
+    as_of = now
+    while True:
+        now = as_of or datetime.now(timezone.utc)
+        batch = claim_outbox_batch('email', now, batch_size)
+        if not batch:
+            break
+        results['batches'] += 1
+
+        sent, failed, retry = [], [], []
+        for index, row in enumerate(batch):
+            attempts = row.attempts + 1
+            try:
+                transport.send(_build_email(row, sender))
+                sent.append(row)
+            except DeliveryUnavailable as e:
+                # Nothing else in the batch can go out either; hand it back untouched
+                results['error'] = str(e)
+                retry.extend((pending, pending.attempts, str(e), now + RETRY_BASE_DELAY) for pending in batch[index:])
+                break
+            except (smtplib.SMTPException, OSError) as e:
+                if _is_permanent(e) or attempts >= max_attempts:
+                    failed.append((row, attempts, str(e)))
+                else:
+                    retry.append((row, attempts, str(e), now + retry_delay(attempts)))
+
+        record_delivery_outcomes('email', now, sent, failed, retry)
+        results['sent'] += len(sent)
+        results['failed'] += len(failed)
+        results['retrying'] += len(retry)
+        if results['error']:
+            logger.error(f"Stopped draining outbox: {results['error']}")
+            break
+
+    results['connections_opened'] = transport.connections_opened - connections_before
+    logger.info(
+        f"Drained email outbox: {results['sent']} sent, {results['retrying']} to retry, {results['failed']} failed "
+        f"over {results['connections_opened']} SMTP connection(s)"
+    )
+    return results
+
+
+def outbox_status_counts():
+    """Number of outbox messages in each status, per channel"""
+    counts = {}
+    for channel, status, count in db.session.execute(
+        select(OutboxMessage.channel, OutboxMessage.status, func.count())
+        .group_by(OutboxMessage.channel, OutboxMessage.status)
+    ):
+        counts.setdefault(channel, {})[status] = count
+    return counts
@@ -0,0 +1,140 @@
+"""
+Reminder Generation for MOT Reminder System
+
+Creates reminders for a batch of vehicles with a fixed number of queries:
+one query for the vehicles that are due, then a single bulk
+INSERT ... ON CONFLICT DO NOTHING of the new reminders. The partial unique
+index idx_reminders_one_scheduled allows one scheduled reminder per
+vehicle, so vehicles that already have one are skipped by the database
+rather than by a separate check that could race. Regenerating reminders for
+hand-picked vehicles is likewise an UPDATE archiving their active reminders
+and one bulk insert, chunked by vehicle id.
+"""
+
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import db
+from models.reminder import Reminder
+from models.vehicle import Vehicle
+from services.reminder_reconciliation import ACTIVE_STATUSES
+
+# SQLite builds before 3.32 allow at most 999 bound parameters per statement
+ID_CHUNK_SIZE = 500
+
+# Create a reminder when the MOT expires within this many days (or has expired)
+DEFAULT_WINDOW_DAYS = 60
+
+# Reminders are sent this many days before the MOT expires
+DEFAULT_LEAD_DAYS = 30
+
+
+def chunked(items, size=ID_CHUNK_SIZE):
+    """Yield successive lists of at most `size` items"""
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def find_vehicles_needing_reminders(vehicle_ids, window_days=DEFAULT_WINDOW_DAYS, today=None):
+    """
+    Return (vehicle_id, mot_expiry) pairs for vehicles whose MOT expires within
+    the window (or has expired). Vehicles with a scheduled reminder are left
+    to the insert to skip.
+    """
+    today = today or date.today()
+    cutoff = today + timedelta(days=window_days)
+
+    eligible = []
+    for id_chunk in chunked(sorted(set(vehicle_ids))):
+        query = select(Vehicle.id, Vehicle.mot_expiry).where(
+            Vehicle.id.in_(id_chunk),
+            Vehicle.mot_expiry.isnot(None),
+            Vehicle.mot_expiry <= cutoff
+        )
+        eligible.extend(db.session.execute(query).all())
+
+    return eligible
+
+
+def scheduled_reminder_insert():
+    """INSERT ... ON CONFLICT DO NOTHING into reminders for the configured database"""
+    dialect_insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    return dialect_insert(Reminder.__table__).on_conflict_do_nothing()
+
+
+def insert_scheduled_reminders(rows):
+    """Insert reminder rows, skipping vehicles that already have a scheduled reminder; returns how many were inserted"""
+    if not rows:
+        return 0
+    return db.session.execute(scheduled_reminder_insert(), rows).rowcount
+
+
+def generate_reminders_for_vehicles(vehicle_ids, batch_id=None, window_days=DEFAULT_WINDOW_DAYS,
+                                    lead_days=DEFAULT_LEAD_DAYS, today=None):
+    """
+    Create scheduled reminders for every eligible vehicle in `vehicle_ids`
+    without one. The reminder date is `lead_days` before MOT expiry, or today
+    if that is already past. Returns the number of reminders created; the
+    caller commits.
+    """
+    today = today or date.today()
+    now = datetime.now(timezone.utc)
+
+    rows = []
+    for vehicle_id, mot_expiry in find_vehicles_needing_reminders(vehicle_ids, window_days, today):
+        reminder_date = max(mot_expiry - timedelta(days=lead_days), today)
+        rows.append({
+            'vehicle_id': vehicle_id,
+            'reminder_date': reminder_date,
+            'status': 'scheduled',
+            'review_batch_id': batch_id,
+            'created_at': now,
+            'updated_at': now
+        })
+
+    return insert_scheduled_reminders(rows)
+
+
+def archive_active_reminders(vehicle_ids, now=None):
+    """Archive the active reminders of the given vehicles; returns how many. The caller commits."""
+    now = now or datetime.now(timezone.utc)
+    archived = 0
+    for id_chunk in chunked(sorted(set(vehicle_ids))):
+        archived += db.session.execute(
+            update(Reminder)
+            .where(Reminder.vehicle_id.in_(id_chunk), Reminder.status.in_(ACTIVE_STATUSES))
+            .values(status='archived', archived_at=now, updated_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    return archived
+
+
+def regenerate_reminders_for_vehicles(vehicle_ids, batch_id=None, lead_days=DEFAULT_LEAD_DAYS, today=None):
+    """
+    Archive the vehicles' active reminders and create a scheduled reminder
+    for each one with a known MOT expiry, dated as in
+    generate_reminders_for_vehicles but without the window check.
+    Returns (archived, created); the caller commits.
+    """
+    today = today or date.today()
+    now = datetime.now(timezone.utc)
+    archived = archive_active_reminders(vehicle_ids, now)
+
+    rows = []
+    for id_chunk in chunked(sorted(set(vehicle_ids))):
+        vehicles = db.session.execute(
+            select(Vehicle.id, Vehicle.mot_expiry).where(Vehicle.id.in_(id_chunk), Vehicle.mot_expiry.isnot(None))
+        ).all()
+        rows.extend({
+            'vehicle_id': vehicle_id,
+            'reminder_date': max(mot_expiry - timedelta(days=lead_days), today),
+            'status': 'scheduled',
+            'review_batch_id': batch_id,
+            'created_at': now,
+            'updated_at': now
+        } for vehicle_id, mot_expiry in vehicles)
+
+    return archived, insert_scheduled_reminders(rows)
@@ -0,0 +1,175 @@
+"""
+Reminder Planning for MOT Reminder System
+
+Cache-first scheduling behind /api/reminders/schedule. Vehicles whose
+stored MOT expiry is well outside the reminder threshold are planned from
+the database; only vehicles near the threshold or with no expiry are
+re-verified, concurrently, and only if DVLA was not asked about them
+recently. Every lookup is recorded, including those that find nothing,
+so a vehicle DVLA cannot resolve is not looked up on every run. DVLA
+results are written back and reminders are then reconciled by
+reminder_reconciliation.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import bindparam, select, update
+
+from database import db
+from models.reminder import Reminder
+from models.vehicle import Vehicle
+from services.reminder_reconciliation import ACTIVE_STATUSES, DEFAULT_WINDOW_DAYS, reconcile_reminders
+
+logger = logging.getLogger(__name__)
+
+# Stored expiries further out than this are trusted without a DVLA call
+DEFAULT_VERIFY_WINDOW_DAYS = 45
+
+# A DVLA lookup newer than this (successful or not) is not repeated
+DEFAULT_MAX_VERIFICATION_AGE_HOURS = 24
+
+DEFAULT_MAX_WORKERS = 8
+
+# Individual lookup errors included in the results; dvla_errors counts them all
+MAX_REPORTED_ERRORS = 50
+
+
+def _needs_verification(mot_expiry, checked_at, verify_before, fresh_after):
+    """Whether a vehicle's stored MOT data is too uncertain to plan from"""
+    if mot_expiry is not None and mot_expiry > verify_before:
+        return False
+    return checked_at is None or checked_at < fresh_after
+
+
+def _last_lookup(*moments):
+    """The latest of the given DVLA lookup times (naive ones are UTC), or None"""
+    return max((moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+                for moment in moments if moment is not None), default=None)
+
+
+def _verify(lookup, registration):
+    """(MOT expiry from DVLA or None, error message or None)"""
+    try:
+        dvla_data = lookup(registration)
+        if dvla_data and dvla_data.get('motExpiryDate'):
+            return datetime.strptime(dvla_data['motExpiryDate'], '%Y-%m-%d').date(), None
+        return None, f"No DVLA data available for {registration}"
+    except Exception as e:
+        return None, f"Error processing {registration}: {e}"
+
+
+def verify_mot_expiries(vehicles, lookup, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Look up vehicles (rows with id, registration, mot_expiry) with DVLA on
+    a thread pool and write the MOT expiries found back with one
+    executemany UPDATE; vehicles DVLA gave no expiry for only get
+    dvla_checked_at. Returns counters; the caller commits.
+    """
+    results = {
+        'verification_attempted': len(vehicles),
+        'dvla_verified': 0,
+        'dvla_errors': 0,
+        'mot_dates_updated': 0,
+        'errors': []
+    }
+    if not vehicles:
+        return results
+
+    now = datetime.now(timezone.utc)
+    verified, unresolved = [], []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(vehicles)))) as executor:
+        outcomes = executor.map(lambda vehicle: _verify(lookup, vehicle.registration), vehicles)
+        for vehicle, (dvla_expiry, error) in zip(vehicles, outcomes):
+            if error:
+                results['dvla_errors'] += 1
+                if len(results['errors']) < MAX_REPORTED_ERRORS:
+                    results['errors'].append(error)
+                unresolved.append({'vehicle_pk': vehicle.id, 'checked_at': now})
+                continue
+            results['dvla_verified'] += 1
+            verified.append({'vehicle_pk': vehicle.id, 'mot_expiry': dvla_expiry, 'verified_at': now})
+            if dvla_expiry != vehicle.mot_expiry:
+                results['mot_dates_updated'] += 1
+
+    vehicles_table = Vehicle.__table__
+    if verified:
+        db.session.execute(
+            update(vehicles_table)
+            .where(vehicles_table.c.id == bindparam('vehicle_pk'))
+            .values(mot_expiry=bindparam('mot_expiry'), dvla_verified_at=bindparam('verified_at'),
+                    dvla_checked_at=bindparam('verified_at')),
+            verified
+        )
+    if unresolved:
+        db.session.execute(
+            update(vehicles_table)
+            .where(vehicles_table.c.id == bindparam('vehicle_pk'))
+            .values(dvla_checked_at=bindparam('checked_at')),
+            unresolved
+        )
+    return results
+
+
+def plan_reminders(lookup, today=None, verify_window_days=DEFAULT_VERIFY_WINDOW_DAYS,
+                   threshold_days=DEFAULT_WINDOW_DAYS,
+                   max_verification_age_hours=DEFAULT_MAX_VERIFICATION_AGE_HOURS,
+                   max_workers=DEFAULT_MAX_WORKERS, verify_all=False):
+    """
+    Schedule reminders for customer-linked vehicles.
+
+    lookup(registration) returns DVLA vehicle details (motExpiryDate as
+    YYYY-MM-DD) and is called from worker threads for the vehicles that
+    need verifying: all of them with verify_all, otherwise those with no
+    stored expiry or an expiry within verify_window_days, unless the last
+    DVLA lookup (successful or not) is newer than
+    max_verification_age_hours. If a lookup fails the stored expiry is
+    used. Reminders are then reconciled with a threshold_days window.
+    Commits and returns counters.
+    """
+    started = time.monotonic()
+    today = today or date.today()
+    verify_before = today + timedelta(days=verify_window_days)
+    fresh_after = datetime.now(timezone.utc) - timedelta(hours=max_verification_age_hours)
+
+    vehicles = db.session.execute(
+        select(Vehicle.id, Vehicle.registration, Vehicle.mot_expiry, Vehicle.dvla_verified_at, Vehicle.dvla_checked_at)
+        .where(Vehicle.customer_id.isnot(None))
+    ).all()
+
+    to_verify = [
+        vehicle for vehicle in vehicles
+        if verify_all or _needs_verification(
+            # Batch DVLA verification elsewhere only sets dvla_verified_at
+            vehicle.mot_expiry, _last_lookup(vehicle.dvla_verified_at, vehicle.dvla_checked_at),
+            verify_before, fresh_after
+        )
+    ]
+
+    results = {
+        'total_vehicles': len(vehicles),
+        'planned_from_stored_data': len(vehicles) - len(to_verify),
+        **verify_mot_expiries(to_verify, lookup, max_workers)
+    }
+    reconciled = reconcile_reminders(today=today, window_days=threshold_days)
+    results['reminders_created'] = reconciled['reminders_created']
+    results['invalid_reminders_removed'] = reconciled['invalid_reminders_removed']
+    db.session.commit()
+
+    results['duration_seconds'] = round(time.monotonic() - started, 3)
+    logger.info(
+        f"Planned reminders for {results['total_vehicles']} vehicles: "
+        f"{results['verification_attempted']} re-verified, {results['reminders_created']} created, "
+        f"{results['invalid_reminders_removed']} removed in {results['duration_seconds']}s"
+    )
+    return results
+
+
+def vehicles_with_active_reminders():
+    """(id, registration, mot_expiry) of vehicles that have an active reminder"""
+    return db.session.execute(
+        select(Vehicle.id, Vehicle.registration, Vehicle.mot_expiry)
+        .where(Vehicle.id.in_(select(Reminder.vehicle_id).where(Reminder.status.in_(ACTIVE_STATUSES))))
+    ).all()
@@ -0,0 +1,162 @@
+"""
+Reminder Reconciliation for MOT Reminder System
+
+The one place the fleet-wide reminder rule lives: a customer-linked vehicle
+whose MOT expires within the window (or has expired) has an active
+reminder, and a vehicle whose MOT is further away has none. Applying it is
+one DELETE (plus two clearing the removed reminders' outbox messages) and
+one INSERT ... SELECT over the whole fleet; a dry run returns the same
+difference without writing.
+"""
+
+import logging
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import and_, delete, exists, insert, literal, or_, select
+
+from database import db
+from models.outbox import OutboxMessage, OutboxMessageReminder
+from models.reminder import Reminder
+from models.vehicle import Vehicle
+
+logger = logging.getLogger(__name__)
+
+# A reminder is due when the MOT expires within this many days (or has expired)
+DEFAULT_WINDOW_DAYS = 30
+
+# Reminder statuses that count as "the vehicle has a reminder"
+ACTIVE_STATUSES = ('scheduled', 'queued', 'sent')
+
+
+def _active_reminder_for_vehicle():
+    return exists().where(Reminder.vehicle_id == Vehicle.id, Reminder.status.in_(ACTIVE_STATUSES))
+
+
+def _vehicle_scope(vehicle_ids):
+    """Conditions limiting reconciliation to vehicle_ids (None: the whole fleet)"""
+    return () if vehicle_ids is None else (Vehicle.id.in_(list(vehicle_ids)),)
+
+
+def _missing_reminders(cutoff, vehicle_ids=None):
+    """Vehicles that are due but have no active reminder"""
+    return select(Vehicle.id).where(
+        *_vehicle_scope(vehicle_ids),
+        Vehicle.customer_id.isnot(None),
+        Vehicle.mot_expiry.isnot(None),
+        Vehicle.mot_expiry <= cutoff,
+        ~_active_reminder_for_vehicle()
+    )
+
+
+def _invalid_reminders(cutoff, vehicle_ids=None):
+    """Active reminders of vehicles whose MOT is not due within the window"""
+    not_due = select(Vehicle.id).where(Vehicle.mot_expiry > cutoff, *_vehicle_scope(vehicle_ids))
+    return Reminder.status.in_(ACTIVE_STATUSES), Reminder.vehicle_id.in_(not_due)
+
+
+def delete_reminders(*conditions):
+    """
+    Delete the reminders matching conditions together with their outbox
+    messages, so a queued reminder's pending email or SMS is not sent (or
+    left pointing at a missing reminder). A digest also covering other
+    reminders is kept and only loses the deleted reminders' links.
+    Returns the number of reminders deleted; the caller commits.
+    """
+    targets = select(Reminder.id).where(*conditions)
+    link = OutboxMessageReminder.__table__.alias('link')
+    other_link = OutboxMessageReminder.__table__.alias('other_link')
+    messages = OutboxMessage.__table__
+
+    db.session.execute(
+        delete(messages).where(or_(
+            messages.c.reminder_id.in_(targets),
+            and_(
+                messages.c.reminder_id.is_(None),
+                exists().where(link.c.message_id == messages.c.id, link.c.reminder_id.in_(targets)),
+                ~exists().where(other_link.c.message_id == messages.c.id, other_link.c.reminder_id.notin_(targets))
+            )
+        ))
+    )
+    db.session.execute(
+        delete(OutboxMessageReminder.__table__).where(OutboxMessageReminder.reminder_id.in_(targets))
+    )
+    return db.session.execute(
+        delete(Reminder).where(*conditions).execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def reconciliation_diff(cutoff, vehicle_ids=None):
+    """What reconciling would change: reminders to create and to remove"""
+    to_create = db.session.execute(
+        select(Vehicle.id, Vehicle.registration, Vehicle.mot_expiry)
+        .where(Vehicle.id.in_(_missing_reminders(cutoff, vehicle_ids)))
+        .order_by(Vehicle.mot_expiry, Vehicle.id)
+    ).all()
+    to_remove = db.session.execute(
+        select(Reminder.id, Reminder.vehicle_id, Reminder.status, Vehicle.registration, Vehicle.mot_expiry)
+        .join(Vehicle, Vehicle.id == Reminder.vehicle_id)
+        .where(*_invalid_reminders(cutoff, vehicle_ids))
+        .order_by(Vehicle.mot_expiry, Reminder.id)
+    ).all()
+
+    return {
+        'to_create': [
+            {'vehicle_id': row.id, 'registration': row.registration, 'mot_expiry': row.mot_expiry.isoformat()}
+            for row in to_create
+        ],
+        'to_remove': [
+            {'reminder_id': row.id, 'vehicle_id': row.vehicle_id, 'status': row.status,
+             'registration': row.registration, 'mot_expiry': row.mot_expiry.isoformat()}
+            for row in to_remove
+        ]
+    }
+
+
+def reconcile_reminders(today=None, window_days=DEFAULT_WINDOW_DAYS, reminder_date=None, dry_run=False,
+                        vehicle_ids=None):
+    """
+    Bring reminders in line with stored MOT expiries as of `today`: remove
+    active reminders of vehicles whose MOT is more than window_days away,
+    and create a scheduled reminder dated reminder_date (default today)
+    for each due vehicle without an active one. vehicle_ids limits this to
+    those vehicles instead of the whole fleet.
+
+    Returns counters; with dry_run, nothing is written and the result also
+    lists the reminders that would be created and removed. Otherwise the
+    caller commits.
+    """
+    today = today or date.today()
+    cutoff = today + timedelta(days=window_days)
+    results = {
+        'today': today.isoformat(),
+        'window_days': window_days,
+        'dry_run': dry_run
+    }
+
+    if dry_run:
+        diff = reconciliation_diff(cutoff, vehicle_ids)
+        results.update({
+            'reminders_created': len(diff['to_create']),
+            'invalid_reminders_removed': len(diff['to_remove']),
+            **diff
+        })
+        return results
+
+    now = datetime.now(timezone.utc)
+    removed = delete_reminders(*_invalid_reminders(cutoff, vehicle_ids))
+
+    missing = _missing_reminders(cutoff, vehicle_ids).add_columns(
+        literal(reminder_date or today, Reminder.reminder_date.type),
+        literal('scheduled', Reminder.status.type),
+        literal(now, Reminder.created_at.type),
+        literal(now, Reminder.updated_at.type)
+    )
+    created = db.session.execute(
+        insert(Reminder).from_select(
+            ['vehicle_id', 'reminder_date', 'status', 'created_at', 'updated_at'], missing
+        )
+    ).rowcount
+
+    logger.info(f"Reconciled reminders (window {window_days} days): {created} created, {removed} removed")
+    results.update({'reminders_created': created, 'invalid_reminders_removed': removed})
+    return results
@@ -0,0 +1,292 @@
+"""
+Reminder Scheduler for MOT Reminder System
+
+Sends reminders as they fall due without anyone calling
+/api/reminders/process; reminder_scheduler_worker.py runs it alongside the
+app. The scheduler keeps a min-heap of (due time, reminder id) for every
+scheduled reminder, loaded at startup with one indexed query on
+(status, reminder_date) and kept current by ORM events:
+committed inserts and updates reschedule a reminder, status changes and
+deletes drop it. A background thread sleeps until the earliest due time
+and then queues and sends what is due through the outbox.
+
+Bulk INSERT/UPDATE statements on reminders (reconciliation, for example)
+carry no per-row events, so committing one triggers a reload. ORM events
+only cover the scheduler's own process, so the heap is also reloaded every
+resync interval to pick up changes made by the app. Entries are checked
+against the database when they fire, so a stale one never sends a
+reminder twice.
+"""
+
+import heapq
+import logging
+import os
+import threading
+import weakref
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from database import db
+from models.reminder import Reminder
+from services.reminder_delivery import (
+    DEFAULT_DIGEST_WINDOW_DAYS, drain_outbox, due_reminders_query, email_transport, queue_due_reminders,
+    queue_reminders
+)
+from services.reminder_generation import chunked
+from services.sms_dispatch import drain_sms_outbox, sms_gateway
+
+logger = logging.getLogger(__name__)
+
+# Reminders are sent at this hour (local time) on their reminder date
+DEFAULT_SEND_HOUR = 9
+
+# Full reload of the heap from the database
+RESYNC_INTERVAL = timedelta(hours=1)
+
+_CHANGES_KEY = 'reminder_scheduler_changes'
+_RESYNC_KEY = 'reminder_scheduler_resync'
+
+# Schedulers receiving ORM change notifications
+_attached = weakref.WeakSet()
+
+
+def deliver_due_reminders(reminder_ids, digest=False, digest_window_days=DEFAULT_DIGEST_WINDOW_DAYS, today=None):
+    """
+    Queue the given reminders if they are still scheduled and due (with
+    digest, everything due is queued per customer instead), commit, then
+    send the outbox. Returns the queueing counters.
+    """
+    today = today or date.today()
+    if digest:
+        results = queue_due_reminders(today, digest=True, digest_window_days=digest_window_days)
+    else:
+        reminders = []
+        for ids in chunked(list(reminder_ids)):
+            reminders.extend(due_reminders_query(today).filter(Reminder.id.in_(ids)).all())
+        results = queue_reminders(reminders)
+    db.session.commit()
+
+    if results['reminders_queued']:
+        transport = email_transport()
+        try:
+            drain_outbox(transport)
+        finally:
+            transport.close()
+        gateway = sms_gateway()
+        try:
+            drain_sms_outbox(gateway)
+        finally:
+            gateway.close()
+    return results
+
+
+class ReminderScheduler:
+    def __init__(self, app, deliver=None, send_hour=DEFAULT_SEND_HOUR, resync_interval=RESYNC_INTERVAL,
+                 clock=datetime.now):
+        self.app = app
+        self.deliver = deliver or deliver_due_reminders
+        self.send_hour = send_hour
+        self.resync_interval = resync_interval
+        self.clock = clock
+        self._heap = []
+        self._due = {}  # reminder id -> due time of its live heap entry
+        self._condition = threading.Condition()
+        self._resync_requested = False
+        self._last_load = None
+        self._stopping = False
+        self._thread = None
+
+    def due_time(self, reminder_date):
+        return datetime.combine(reminder_date, time(self.send_hour))
+
+    def __len__(self):
+        return len(self._due)
+
+    def load(self):
+        """Rebuild the heap from the scheduled reminders in the database"""
+        with self.app.app_context():
+            rows = db.session.execute(
+                select(Reminder.id, Reminder.reminder_date)
+                .where(Reminder.status == 'scheduled')
+                .order_by(Reminder.reminder_date)
+            ).all()
+            db.session.remove()
+        due = {reminder_id: self.due_time(reminder_date) for reminder_id, reminder_date in rows}
+        heap = [(due_at, reminder_id) for reminder_id, due_at in due.items()]
+        heapq.heapify(heap)
+        with self._condition:
+            self._heap = heap
+            self._due = due
+            self._resync_requested = False
+            self._last_load = self.clock()
+            self._condition.notify()
+        logger.info(f"Reminder scheduler loaded {len(due)} scheduled reminders")
+
+    def schedule(self, reminder_id, reminder_date):
+        with self._condition:
+            due_at = self.due_time(reminder_date)
+            if self._due.get(reminder_id) == due_at:
+                return
+            self._due[reminder_id] = due_at
+            heapq.heappush(self._heap, (due_at, reminder_id))
+            self._condition.notify()
+
+    def cancel(self, reminder_id):
+        # The heap entry is skipped when it surfaces
+        with self._condition:
+            self._due.pop(reminder_id, None)
+
+    def request_resync(self):
+        with self._condition:
+            self._resync_requested = True
+            self._condition.notify()
+
+    def _discard_stale(self):
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def next_due(self):
+        with self._condition:
+            self._discard_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """Remove and return the ids of reminders due at or before now"""
+        due = []
+        with self._condition:
+            self._discard_stale()
+            while self._heap and self._heap[0][0] <= now:
+                _, reminder_id = heapq.heappop(self._heap)
+                del self._due[reminder_id]
+                due.append(reminder_id)
+                self._discard_stale()
+        return due
+
+    def run_pending(self, now=None):
+        """Deliver whatever is due; returns the reminder ids fired"""
+        due = self.pop_due(now or self.clock())
+        if due:
+            logger.info(f"Reminder scheduler firing {len(due)} due reminders")
+            with self.app.app_context():
+                try:
+                    self.deliver(due)
+                except Exception:
+                    logger.exception("Reminder delivery failed")
+                    db.session.rollback()
+                    # The reminders are still scheduled; pick them up again on the next reload
+                    self.request_resync()
+                finally:
+                    db.session.remove()
+        return due
+
+    def attach(self):
+        """Follow committed reminder changes through ORM events"""
+        _attached.add(self)
+
+    def detach(self):
+        _attached.discard(self)
+
+    def start(self):
+        self.load()
+        self.attach()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='reminder-scheduler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.detach()
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._stopping:
+                    return
+                resync = self._resync_requested or self.clock() - self._last_load >= self.resync_interval
+            if resync:
+                try:
+                    self.load()
+                except Exception:
+                    logger.exception("Reminder scheduler reload failed")
+
+            self.run_pending()
+
+            with self._condition:
+                if self._stopping or self._resync_requested:
+                    continue
+                self._discard_stale()
+                now = self.clock()
+                wake_at = self._last_load + self.resync_interval
+                if self._heap:
+                    wake_at = min(wake_at, self._heap[0][0])
+                self._condition.wait(max(0.0, (wake_at - now).total_seconds()))
+
+
+def start_scheduler(app, send_hour=None, resync_interval=RESYNC_INTERVAL):
+    """
+    Start a scheduler delivering with REMINDER_DIGEST, at send_hour
+    (default REMINDER_SEND_HOUR); returns it. reminder_scheduler_worker.py
+    runs one.
+    """
+    digest = os.environ.get('REMINDER_DIGEST', 'false').lower() in ('1', 'true', 'yes')
+    if send_hour is None:
+        send_hour = int(os.environ.get('REMINDER_SEND_HOUR', DEFAULT_SEND_HOUR))
+    scheduler = ReminderScheduler(
+        app,
+        deliver=lambda reminder_ids: deliver_due_reminders(reminder_ids, digest=digest),
+        send_hour=send_hour,
+        resync_interval=resync_interval
+    )
+    return scheduler.start()
+
+
+@event.listens_for(Reminder, 'after_insert')
+@event.listens_for(Reminder, 'after_update')
+def _reminder_saved(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None and _attached:
+        session.info.setdefault(_CHANGES_KEY, []).append((target.id, target.status, target.reminder_date))
+
+
+@event.listens_for(Reminder, 'after_delete')
+def _reminder_deleted(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None and _attached:
+        session.info.setdefault(_CHANGES_KEY, []).append((target.id, None, None))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bulk_statement(orm_execute_state):
+    if not _attached or not (orm_execute_state.is_insert or orm_execute_state.is_update):
+        return
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if table is not None and getattr(table, 'name', None) == Reminder.__tablename__:
+        orm_execute_state.session.info[_RESYNC_KEY] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_committed(session):
+    changes = session.info.pop(_CHANGES_KEY, None)
+    resync = session.info.pop(_RESYNC_KEY, False)
+    for scheduler in list(_attached):
+        if resync:
+            scheduler.request_resync()
+        for reminder_id, status, reminder_date in changes or ():
+            if status == 'scheduled' and reminder_date:
+                scheduler.schedule(reminder_id, reminder_date)
+            else:
+                scheduler.cancel(reminder_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop(_CHANGES_KEY, None)
+    session.info.pop(_RESYNC_KEY, None)
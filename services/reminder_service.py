@@ -12,6 +12,8 @@ import requests
 from datetime import datetime
 import os
 
+from services.reminder_templates import compile_template
+
 class ReminderService:
     def __init__(self):
         # Email settings
@@ -30,6 +32,8 @@ class ReminderService:
         """
         Send an email reminder.
         For local development, this simulates sending an email.
+        Scheduled reminders are delivered through the outbox instead
+        (services/reminder_delivery.py), which reuses one SMTP session.
         """
         # In a real implementation, this would send an actual email
         # try:
@@ -91,13 +95,14 @@ class ReminderService:
         if isinstance(mot_expiry_date, datetime):
             mot_expiry_date = mot_expiry_date.strftime('%d/%m/%Y')
         
-        return template.format(
-            customer_name=customer.get('name', 'Customer'),
-            vehicle_make=vehicle.get('make', 'Unknown'),
-            vehicle_model=vehicle.get('model', 'Unknown'),
-            vehicle_registration=vehicle.get('registration', 'Unknown'),
-            mot_expiry_date=mot_expiry_date
-        )
+        # Compiled once per distinct template, so formatting many reminders doesn't re-parse it
+        return compile_template(template).render({
+            'customer_name': str(customer.get('name', 'Customer')),
+            'vehicle_make': str(vehicle.get('make', 'Unknown')),
+            'vehicle_model': str(vehicle.get('model', 'Unknown')),
+            'vehicle_registration': str(vehicle.get('registration', 'Unknown')),
+            'mot_expiry_date': str(mot_expiry_date)
+        })
     
     def process_reminder(self, reminder, vehicle, customer, email_template, sms_template):
         """Process a reminder by sending email and/or SMS"""
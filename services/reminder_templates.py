@@ -0,0 +1,238 @@
+"""
+Reminder Templates for MOT Reminder System
+
+Email and SMS templates, and the digest templates listing several of a
+customer's vehicles in one message, are stored in the reminder_templates
+table (the built-in defaults apply until one is saved). A template is validated and
+compiled once: its {placeholders} are resolved into a list of literal
+pieces and field names, so rendering a message is a join with no parsing.
+Compiled templates are cached in-process and dropped when a template
+change is committed.
+"""
+
+import logging
+import threading
+from collections import namedtuple
+from functools import lru_cache
+from string import Formatter
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from database import db
+from models.reminder_template import ReminderTemplate
+
+logger = logging.getLogger(__name__)
+
+# Placeholders a template may use
+PLACEHOLDERS = ('customer_name', 'vehicle_make', 'vehicle_model', 'vehicle_registration', 'mot_expiry_date')
+
+# Placeholders a digest template may use; vehicle_list holds one line per vehicle
+DIGEST_PLACEHOLDERS = ('customer_name', 'vehicle_count', 'vehicle_list')
+
+CHANNELS = ('email', 'sms', 'email_digest', 'sms_digest')
+
+DEFAULT_EMAIL_TEMPLATE = """Dear {customer_name},
+
+This is a reminder that the MOT for your {vehicle_make} {vehicle_model} (Registration: {vehicle_registration}) is due to expire on {mot_expiry_date}.
+
+Please contact us to schedule an appointment.
+
+Thank you,
+Your Garage
+"""
+
+DEFAULT_EMAIL_SUBJECT = "MOT Reminder for {vehicle_registration}"
+
+DEFAULT_SMS_TEMPLATE = """MOT Reminder: Your {vehicle_make} {vehicle_model} (Reg: {vehicle_registration}) MOT expires on {mot_expiry_date}. Please contact us to book."""
+
+DEFAULT_EMAIL_DIGEST_TEMPLATE = """Dear {customer_name},
+
+This is a reminder that the MOT for {vehicle_count} of your vehicles is due to expire:
+
+{vehicle_list}
+
+Please contact us to schedule appointments.
+
+Thank you,
+Your Garage
+"""
+
+DEFAULT_EMAIL_DIGEST_SUBJECT = "MOT Reminder for {vehicle_count} of your vehicles"
+
+DEFAULT_SMS_DIGEST_TEMPLATE = """MOT Reminder: {vehicle_count} of your vehicles have MOTs expiring: {vehicle_list}. Please contact us to book."""
+
+DEFAULTS = {
+    'email': (DEFAULT_EMAIL_SUBJECT, DEFAULT_EMAIL_TEMPLATE),
+    'sms': (None, DEFAULT_SMS_TEMPLATE),
+    'email_digest': (DEFAULT_EMAIL_DIGEST_SUBJECT, DEFAULT_EMAIL_DIGEST_TEMPLATE),
+    'sms_digest': (None, DEFAULT_SMS_DIGEST_TEMPLATE),
+}
+
+# How each vehicle is listed in a digest, and what separates the lines
+DIGEST_LINES = {
+    'email': ("- {vehicle_make} {vehicle_model} ({vehicle_registration}): MOT expires {mot_expiry_date}", "\n"),
+    'sms': ("{vehicle_registration} ({mot_expiry_date})", ", "),
+}
+
+# Compiled subject (email only, else None) and body for a channel
+ChannelTemplate = namedtuple('ChannelTemplate', ['subject', 'body', 'saved'])
+
+
+class TemplateError(ValueError):
+    """A template that cannot be compiled"""
+
+
+class CompiledTemplate:
+    """A template resolved into literal text interleaved with placeholder names"""
+
+    __slots__ = ('source', 'fields', '_head', '_tail')
+
+    def __init__(self, source, head, tail):
+        self.source = source
+        self.fields = tuple(field for field, _ in tail)
+        self._head = head
+        self._tail = tail
+
+    def render(self, values):
+        """Render with values, a dict holding a string for each placeholder used"""
+        parts = [self._head]
+        for field, literal in self._tail:
+            parts.append(values[field])
+            parts.append(literal)
+        return ''.join(parts)
+
+
+def placeholders_for(channel):
+    return DIGEST_PLACEHOLDERS if channel.endswith('_digest') else PLACEHOLDERS
+
+
+@lru_cache(maxsize=64)
+def compile_template(source, placeholders=PLACEHOLDERS):
+    """Validate a template using the given placeholders and compile it; raises TemplateError"""
+    literals = ['']
+    fields = []
+    try:
+        for literal, field_name, format_spec, conversion in Formatter().parse(source):
+            literals[-1] += literal
+            if field_name is None:
+                continue
+            if field_name not in placeholders:
+                raise TemplateError(
+                    f"Unknown placeholder {{{field_name}}}; use one of "
+                    + ', '.join(f'{{{name}}}' for name in placeholders)
+                )
+            if format_spec or conversion:
+                raise TemplateError(f"Formatting options are not supported in {{{field_name}}}")
+            fields.append(field_name)
+            literals.append('')
+    except TemplateError:
+        raise
+    except ValueError as e:
+        raise TemplateError(f"Invalid template: {e}") from e
+    return CompiledTemplate(source, literals[0], tuple(zip(fields, literals[1:])))
+
+
+def template_values(vehicle, customer):
+    """Placeholder values for a vehicle and customer (model objects)"""
+    return {
+        'customer_name': customer.name or 'Customer',
+        'vehicle_make': vehicle.make or 'Unknown',
+        'vehicle_model': vehicle.model or 'Unknown',
+        'vehicle_registration': vehicle.registration,
+        'mot_expiry_date': vehicle.mot_expiry.strftime('%d/%m/%Y') if vehicle.mot_expiry else 'Unknown'
+    }
+
+
+def digest_values(channel, customer, vehicles):
+    """Digest placeholder values for a customer's vehicles, listed the way `channel` (email or sms) lists them"""
+    line, separator = DIGEST_LINES[channel]
+    line = compile_template(line)
+    return {
+        'customer_name': customer.name or 'Customer',
+        'vehicle_count': str(len(vehicles)),
+        'vehicle_list': separator.join(line.render(template_values(vehicle, customer)) for vehicle in vehicles)
+    }
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+_generation = 0
+_CHANGED_KEY = 'reminder_templates_changed'
+
+
+def invalidate_templates(channels=CHANNELS):
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        for channel in channels:
+            _cache.pop(channel, None)
+
+
+def get_template(channel):
+    """The compiled template for a channel, from the cache or the database"""
+    template = _cache.get(channel)
+    if template is not None:
+        return template
+
+    with _cache_lock:
+        generation = _generation
+    row = ReminderTemplate.query.filter_by(channel=channel).first()
+    subject, body = (row.subject, row.body) if row else DEFAULTS[channel]
+    placeholders = placeholders_for(channel)
+    template = ChannelTemplate(
+        subject=compile_template(subject, placeholders) if subject else None,
+        body=compile_template(body, placeholders),
+        saved=row is not None
+    )
+    with _cache_lock:
+        # Don't cache what was read before a concurrent change was committed
+        if generation == _generation:
+            _cache[channel] = template
+    return template
+
+
+def save_template(channel, body, subject=None):
+    """Validate and store a channel's template; raises TemplateError. Commits."""
+    if channel not in CHANNELS:
+        raise TemplateError(f"Unknown channel {channel}")
+    if not body or not body.strip():
+        raise TemplateError("Template is empty")
+    placeholders = placeholders_for(channel)
+    compile_template(body, placeholders)
+    if channel.startswith('email'):
+        subject = subject or DEFAULTS[channel][0]
+        compile_template(subject, placeholders)
+    else:
+        subject = None
+
+    row = ReminderTemplate.query.filter_by(channel=channel).first()
+    if row is None:
+        row = ReminderTemplate(channel=channel)
+        db.session.add(row)
+    row.body = body
+    row.subject = subject
+    db.session.commit()
+    logger.info(f"Saved {channel} reminder template")
+    return row
+
+
+@event.listens_for(ReminderTemplate, 'after_insert')
+@event.listens_for(ReminderTemplate, 'after_update')
+@event.listens_for(ReminderTemplate, 'after_delete')
+def _template_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_CHANGED_KEY, set()).add(target.channel)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    channels = session.info.pop(_CHANGED_KEY, None)
+    if channels:
+        invalidate_templates(channels)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop(_CHANGED_KEY, None)
@@ -0,0 +1,230 @@
+"""
+SMS Dispatch for MOT Reminder System
+
+Sends the SMS messages queued in the outbox (see reminder_delivery). If
+the gateway accepts bulk submissions (SMS_BULK_SIZE > 0), each request
+carries up to that many messages; otherwise each carries one. Requests run
+concurrently on a thread pool over one pooled HTTP session, throttled by a
+shared rate limit, and each message's outcome is written back to the
+outbox and its reminder.
+
+Gateway protocol (JSON, bearer token):
+    POST {SMS_API_URL}/messages       {"to", "from", "message", "reference"}
+    POST {SMS_API_URL}/messages/bulk  {"messages": [...]} ->
+        {"results": [{"reference", "status": "accepted" | "rejected", "error"}]}
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from services.reminder_delivery import (
+    DEFAULT_BATCH_SIZE, MAX_ATTEMPTS, claim_outbox_batch, record_delivery_outcomes, retry_delay
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 8
+
+
+class SMSDeliveryError(Exception):
+    """A message (or request) the gateway did not accept; permanent if retrying cannot help"""
+
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+class RateLimiter:
+    """Token bucket shared by worker threads: at most `rate` acquisitions per second"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate or 0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class SMSGateway:
+    """HTTP client for the SMS gateway, keeping connections to it alive across requests"""
+
+    def __init__(self, api_url, api_key, sender_id, bulk_size=0, pool_size=DEFAULT_MAX_WORKERS,
+                 rate_per_second=10, timeout=10):
+        self.api_url = api_url.rstrip('/')
+        self.sender_id = sender_id
+        self.bulk_size = bulk_size
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter(rate_per_second)
+        self.requests_made = 0
+        self._counter_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Authorization': f'Bearer {api_key}'})
+
+    @classmethod
+    def from_environment(cls):
+        return cls(
+            api_url=os.environ['SMS_API_URL'],
+            api_key=os.environ.get('SMS_API_KEY', ''),
+            sender_id=os.environ.get('SMS_SENDER_ID', 'GarageReminder'),
+            bulk_size=int(os.environ.get('SMS_BULK_SIZE', 0)),
+            pool_size=int(os.environ.get('SMS_POOL_SIZE', DEFAULT_MAX_WORKERS)),
+            rate_per_second=float(os.environ.get('SMS_RATE_LIMIT', 10))
+        )
+
+    def _post(self, path, payload):
+        self.rate_limiter.acquire()
+        with self._counter_lock:
+            self.requests_made += 1
+        try:
+            response = self.session.post(f"{self.api_url}{path}", json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise SMSDeliveryError(f"SMS gateway request failed: {e}") from e
+        if response.status_code == 429 or response.status_code >= 500:
+            raise SMSDeliveryError(f"SMS gateway returned HTTP {response.status_code}")
+        if response.status_code >= 400:
+            raise SMSDeliveryError(f"SMS gateway rejected message: HTTP {response.status_code} {response.text[:200]}",
+                                   permanent=True)
+        return response.json() if response.content else {}
+
+    def _payload(self, message):
+        return {'to': message['to'], 'from': self.sender_id, 'message': message['message'],
+                'reference': message['reference']}
+
+    def send(self, message):
+        """Send one message ({'reference', 'to', 'message'}); raises SMSDeliveryError"""
+        self._post('/messages', self._payload(message))
+
+    def send_bulk(self, messages):
+        """Send messages in one request; returns {reference: SMSDeliveryError or None}"""
+        data = self._post('/messages/bulk', {'messages': [self._payload(message) for message in messages]})
+        results = {result.get('reference'): result for result in data.get('results', [])}
+
+        outcomes = {}
+        for message in messages:
+            result = results.get(message['reference'])
+            if result is None:
+                outcomes[message['reference']] = SMSDeliveryError("No result for message in bulk response")
+            elif result.get('status') == 'accepted':
+                outcomes[message['reference']] = None
+            else:
+                outcomes[message['reference']] = SMSDeliveryError(
+                    f"SMS gateway rejected message: {result.get('error') or result.get('status')}", permanent=True
+                )
+        return outcomes
+
+    def close(self):
+        self.session.close()
+
+
+class LoggingSMSGateway:
+    """Stands in for the gateway when no SMS_API_URL is configured (local development)"""
+
+    bulk_size = 0
+    requests_made = 0
+
+    def send(self, message):
+        logger.info(f"[SIMULATED SMS] To: {message['to']}")
+
+    def close(self):
+        pass
+
+
+def sms_gateway():
+    """The configured SMS gateway: HTTP if SMS_API_URL is set, otherwise simulated"""
+    if os.environ.get('SMS_API_URL'):
+        return SMSGateway.from_environment()
+    return LoggingSMSGateway()
+
+
+def _submit(gateway, group):
+    """Send a group of messages in one request; returns {reference: SMSDeliveryError or None}"""
+    try:
+        if gateway.bulk_size:
+            return gateway.send_bulk(group)
+        for message in group:
+            gateway.send(message)
+        return {message['reference']: None for message in group}
+    except SMSDeliveryError as e:
+        return {message['reference']: e for message in group}
+
+
+def dispatch_sms(gateway, messages, executor):
+    """
+    Send messages ({'reference', 'to', 'message'}) through the gateway,
+    bulk_size per request or one per request, concurrently on executor.
+    Returns {reference: SMSDeliveryError or None}.
+    """
+    size = gateway.bulk_size or 1
+    groups = [messages[start:start + size] for start in range(0, len(messages), size)]
+    outcomes = {}
+    for group_outcomes in executor.map(lambda group: _submit(gateway, group), groups):
+        outcomes.update(group_outcomes)
+    return outcomes
+
+
+def drain_sms_outbox(gateway, batch_size=DEFAULT_BATCH_SIZE, max_workers=DEFAULT_MAX_WORKERS,
+                     max_attempts=MAX_ATTEMPTS, now=None):
+    """Send every due SMS in the outbox through gateway, batch by batch; returns counters"""
+    results = {'sent': 0, 'retrying': 0, 'failed': 0, 'batches': 0, 'error': None}
+    requests_before = gateway.requests_made
+
+    as_of = now
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        while True:
+            now = as_of or datetime.now(timezone.utc)
+            batch = claim_outbox_batch('sms', now, batch_size)
+            if not batch:
+                break
+            results['batches'] += 1
+
+            outcomes = dispatch_sms(gateway, [
+                {'reference': row.id, 'to': row.recipient, 'message': row.body} for row in batch
+            ], executor)
+
+            sent, failed, retry = [], [], []
+            for row in batch:
+                error = outcomes[row.id]
+                attempts = row.attempts + 1
+                if error is None:
+                    sent.append(row)
+                elif error.permanent or attempts >= max_attempts:
+                    failed.append((row, attempts, str(error)))
+                else:
+                    retry.append((row, attempts, str(error), now + retry_delay(attempts)))
+
+            record_delivery_outcomes('sms', now, sent, failed, retry)
+            results['sent'] += len(sent)
+            results['failed'] += len(failed)
+            results['retrying'] += len(retry)
+
+    results['requests_made'] = gateway.requests_made - requests_before
+    logger.info(
+        f"Drained SMS outbox: {results['sent']} sent, {results['retrying']} to retry, {results['failed']} failed "
+        f"in {results['requests_made']} gateway request(s)"
+    )
+    return results
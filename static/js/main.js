@@ -1654,8 +1654,12 @@ function saveEmailTemplate(e) {
         },
         body: JSON.stringify({ template: template })
     })
-        .then(response => response.json())
-        .then(data => {
+        .then(response => response.json().then(data => ({ ok: response.ok, data })))
+        .then(({ ok, data }) => {
+            if (!ok) {
+                showToast('Error', data.error || 'Failed to save email template');
+                return;
+            }
             showToast('Success', 'Email template saved successfully');
         })
         .catch(error => {
@@ -1677,8 +1681,12 @@ function saveSmsTemplate(e) {
         },
         body: JSON.stringify({ template: template })
     })
-        .then(response => response.json())
-        .then(data => {
+        .then(response => response.json().then(data => ({ ok: response.ok, data })))
+        .then(({ ok, data }) => {
+            if (!ok) {
+                showToast('Error', data.error || 'Failed to save SMS template');
+                return;
+            }
             showToast('Success', 'SMS template saved successfully');
         })
         .catch(error => {
@@ -1871,12 +1879,80 @@ function handleCSVUpload() {
 }
 
 function handleCSVFile(file) {
-    const reader = new FileReader();
-    reader.onload = function(e) {
-        const csv = e.target.result;
-        processFileData(csv, 'csv');
-    };
-    reader.readAsText(file);
+    // CSV files are sent as-is and parsed on the server in chunks
+    const processBtn = document.getElementById('process-csv-btn');
+    processBtn.innerHTML = '<i class="bi bi-hourglass-split"></i> Processing with DVLA lookup...';
+    processBtn.disabled = true;
+
+    const formData = new FormData();
+    formData.append('file', file);
+
+    fetch('/api/vehicles/csv/upload-file', {
+        method: 'POST',
+        body: formData
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.error) {
+            showToast('Error', data.error);
+            return;
+        }
+
+        showStreamedUploadResults(data);
+
+        // Refresh the vehicles list
+        loadVehicles();
+
+        // Hide upload section
+        document.getElementById('csv-upload-section').style.display = 'none';
+        document.getElementById('csv-file-input').value = '';
+
+        // Redirect to reminders review if batch_id is provided
+        if (data.batch_id && data.redirect_to_review) {
+            setTimeout(() => {
+                showRemindersReview(data.batch_id);
+            }, 2000);
+        }
+    })
+    .catch(error => {
+        console.error('Error processing csv file:', error);
+        showToast('Error', 'Failed to process CSV file');
+    })
+    .finally(() => {
+        processBtn.innerHTML = 'Process File';
+        processBtn.disabled = false;
+    });
+}
+
+function showStreamedUploadResults(data) {
+    let message = `Successfully processed ${data.processed} vehicles from CSV file.`;
+
+    if (data.vehicles_created_count > 0) {
+        message += ` Created ${data.vehicles_created_count} new vehicles.`;
+    }
+
+    if (data.vehicles_updated_count > 0) {
+        message += ` Updated ${data.vehicles_updated_count} existing vehicles.`;
+    }
+
+    if (data.customers_created_count > 0) {
+        message += ` Created ${data.customers_created_count} new customers.`;
+    }
+
+    if (data.reminders_created > 0) {
+        message += ` Created ${data.reminders_created} reminders for vehicles needing MOT attention.`;
+    }
+
+    if (data.dvla_found_count > 0) {
+        message += ` ${data.dvla_found_count} vehicles verified with DVLA data.`;
+    }
+
+    if (data.error_count > 0) {
+        message += ` ${data.error_count} errors occurred.`;
+        console.error('CSV processing errors:', data.errors);
+    }
+
+    showToast(data.error_count > 0 ? 'Warning' : 'Success', message);
 }
 
 function handleExcelFile(file) {
@@ -3823,24 +3899,29 @@ function uploadMultipleFiles(files) {
     processBtn.disabled = true;
     progressContainer.style.display = 'block';
 
-    // Simulate progress (since we can't get real progress from server)
-    let progress = 0;
-    const progressInterval = setInterval(() => {
-        progress += Math.random() * 15;
-        if (progress > 90) progress = 90;
-
-        progressBar.style.width = progress + '%';
-        progressPercentage.textContent = Math.round(progress) + '%';
-        progressText.textContent = `Processing ${files.length} files...`;
-    }, 500);
+    progressText.textContent = `Uploading ${files.length} files...`;
 
     fetch('/api/job-sheets/upload-bulk', {
         method: 'POST',
         body: formData
     })
     .then(response => response.json())
+    .then(job => {
+        if (job.error) {
+            throw new Error(job.error);
+        }
+
+        // Files are parsed and imported by a background job; follow its progress
+        return pollBulkUpload(job.status_url, status => {
+            const percent = status.total_files > 0
+                ? Math.round(status.processed_files / status.total_files * 100)
+                : 0;
+            progressBar.style.width = percent + '%';
+            progressPercentage.textContent = percent + '%';
+            progressText.textContent = `${status.status}: ${status.processed_files}/${status.total_files} files`;
+        });
+    })
     .then(data => {
-        clearInterval(progressInterval);
         progressBar.style.width = '100%';
         progressPercentage.textContent = '100%';
         progressText.textContent = 'Complete!';
@@ -3878,7 +3959,7 @@ function uploadMultipleFiles(files) {
         if (data.file_results && data.file_results.length > 0) {
             message += `\n📄 File Details:\n`;
             data.file_results.forEach(result => {
-                if (result.success) {
+                if (result.status === 'completed') {
                     message += `✅ ${result.filename}: ${result.processed} records\n`;
                 } else {
                     message += `❌ ${result.filename}: ${result.error}\n`;
@@ -3910,7 +3991,6 @@ function uploadMultipleFiles(files) {
         }
     })
     .catch(error => {
-        clearInterval(progressInterval);
         console.error('Error uploading files:', error);
         showToast('Error', 'Failed to upload files');
     })
@@ -3927,6 +4007,40 @@ function uploadMultipleFiles(files) {
     });
 }
 
+// Bulk upload job states (JobStatus in services/bulk_import.py)
+const BULK_UPLOAD_RUNNING = ['queued', 'parsing', 'writing'];
+const BULK_UPLOAD_FINISHED = ['completed', 'error'];
+
+// Poll a bulk upload job until it finishes, reporting progress along the way.
+// Jobs live in the server process's memory, so after a restart (or on another
+// worker) the job is unknown; that and any unexpected reply end the polling.
+function pollBulkUpload(statusUrl, onProgress) {
+    return new Promise((resolve, reject) => {
+        const poll = () => {
+            fetch(statusUrl)
+                .then(response => response.json().then(status => {
+                    if (!response.ok) {
+                        throw new Error(status.error || `Bulk upload status failed (HTTP ${response.status})`);
+                    }
+                    return status;
+                }))
+                .then(status => {
+                    if (BULK_UPLOAD_FINISHED.includes(status.status)) {
+                        onProgress(status);
+                        resolve(status);
+                    } else if (BULK_UPLOAD_RUNNING.includes(status.status)) {
+                        onProgress(status);
+                        setTimeout(poll, 1000);
+                    } else {
+                        throw new Error(`Unknown bulk upload status: ${status.status}`);
+                    }
+                })
+                .catch(reject);
+        };
+        poll();
+    });
+}
+
 // Upload single job sheet file (legacy function)
 function uploadJobSheets(file) {
     const formData = new FormData();
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test the bulk-import orchestrator behind /api/job-sheets/upload-bulk
+"""
+
+import os
+import sys
+import tempfile
+
+os.environ.setdefault('DVLA_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('DVLA_CLIENT_SECRET', 'test-client-secret')
+os.environ.setdefault('DVLA_API_KEY', 'test-api-key')
+os.environ.setdefault('DVLA_TENANT_ID', 'test-tenant-id')
+# A throwaway database (the same file for every test module in the run), never the garage's own
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.gettempdir(), f'mot_reminder_test_{os.getpid()}.db'))
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import app
+from services.bulk_import import BulkImportJob, classify_upload
+
+JOB_SHEETS_CSV = (
+    'ID Doc,Doc No,Customer Name,Vehicle Reg,Grand Total\n'
+    'BULKTEST1,1,Bulk Tester,bk01 aaa,10.00\n'
+    'BULKTEST2,2,Bulk Tester,BK01 BBB,£20\n'
+).encode('cp1252')
+
+
+def test_classify_upload():
+    assert classify_upload('Customers.csv') == 'customers'
+    assert classify_upload('mot_due_2024.xlsx') == 'vehicles'
+    assert classify_upload('Documents.csv') == 'job_sheets'
+    assert classify_upload('export.csv') == 'other'
+
+
+def test_bulk_import_job_parses_in_parallel_and_writes_by_stage():
+    from database import db
+    from models.job_sheet import JobSheet
+    from models.vehicle import Vehicle
+
+    looked_up = []
+
+    with app.app.app_context():
+        job = BulkImportJob(
+            [
+                ('Documents.csv', JOB_SHEETS_CSV),
+                ('customers.csv', b'Name,Phone\nA,1\nB,2\nC,3\n'),
+                ('broken_jobs.xlsx', b'not a spreadsheet'),
+            ],
+            dvla_lookup=lambda registrations: looked_up.append(set(registrations)) or {'checked': len(registrations)},
+            max_workers=2
+        )
+        try:
+            job.run()
+            status = job.get_status()
+
+            assert status['status'] == 'completed'
+            assert status['total_files'] == 3
+            assert status['processed_files'] == 2
+            assert status['customers_processed'] == 3
+            assert status['job_sheets_processed'] == 2
+
+            files = {f['filename']: f for f in status['file_results']}
+            assert files['Documents.csv']['status'] == 'completed'
+            assert files['Documents.csv']['created'] == 2
+            assert files['Documents.csv']['vehicles_created'] == 2
+            assert files['Documents.csv']['field_mapping']['doc_id'] == 'ID Doc'
+            assert files['customers.csv']['field_mapping'] is None
+            assert files['broken_jobs.xlsx']['status'] == 'error'
+
+            assert looked_up == [{'BK01 AAA', 'BK01 BBB'}]
+            assert status['dvla_lookups'] == {'checked': 2}
+            assert JobSheet.query.filter(JobSheet.doc_id.like('BULKTEST%')).count() == 2
+        finally:
+            db.session.rollback()
+            JobSheet.query.filter(JobSheet.doc_id.like('BULKTEST%')).delete(synchronize_session=False)
+            Vehicle.query.filter(Vehicle.registration.like('BK01%')).delete(synchronize_session=False)
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    test_classify_upload()
+    test_bulk_import_job_parses_in_parallel_and_writes_by_stage()
+    print("All bulk import tests passed")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test the upload-scoped customer resolver used by the vehicle CSV import
+"""
+
+from services.customer_resolver import CustomerResolver, normalise_name, normalise_phone
+
+
+def build_resolver():
+    resolver = CustomerResolver()
+    resolver.add(1, name='Joanne Smith', phone='07939 887633', email='jo@example.com')
+    resolver.add(2, name='Ann Smith', phone='020 8203 0611')
+    resolver.add(3, name='Mr. Scot Murphy')
+    resolver.commit()
+    return resolver
+
+
+def test_normalisation():
+    assert normalise_name('  Mr.  Scot   MURPHY ') == 'mr scot murphy'
+    assert normalise_phone('+44 7939 887633') == '07939887633'
+    assert normalise_phone('07939 887633') == '07939887633'
+
+
+def test_exact_name_match_only():
+    resolver = build_resolver()
+    assert resolver.resolve(name='ann smith') == 2
+    assert resolver.resolve(name='Ann') is None
+    assert resolver.resolve(name='mr scot murphy') == 3
+
+
+def test_email_and_phone_take_priority():
+    resolver = build_resolver()
+    assert resolver.resolve(name='Someone Else', email='JO@example.com') == 1
+    assert resolver.resolve(name='Someone Else', phone='02082030611') == 2
+
+
+def test_customers_added_mid_import_are_found():
+    resolver = build_resolver()
+    assert resolver.resolve(name='Christy Hadjipateras') is None
+    resolver.add(4, name='Christy Hadjipateras', phone='07793093414')
+    assert resolver.resolve(name='christy hadjipateras') == 4
+    assert resolver.resolve(phone='07793 093414') == 4
+
+
+def test_first_customer_wins_for_duplicate_keys():
+    resolver = build_resolver()
+    resolver.add(5, name='Ann Smith')
+    assert resolver.resolve(name='Ann Smith') == 2
+
+
+def test_rolled_back_customers_are_evicted():
+    resolver = build_resolver()
+    resolver.add(4, name='Christy Hadjipateras', phone='07793093414')
+    # A new email address for an existing customer, saved in the same row
+    resolver.add(2, name='Ann Smith', email='ann@example.com')
+    resolver.rollback()
+    assert resolver.resolve(name='Christy Hadjipateras') is None
+    assert resolver.resolve(phone='07793093414') is None
+    assert resolver.resolve(email='ann@example.com') is None
+    assert resolver.resolve(name='Ann Smith') == 2
+
+    resolver.add(4, name='Kate Bush')
+    resolver.commit()
+    resolver.rollback()
+    assert resolver.resolve(name='Kate Bush') == 4
+
+
+if __name__ == "__main__":
+    test_normalisation()
+    test_exact_name_match_only()
+    test_email_and_phone_take_priority()
+    test_customers_added_mid_import_are_found()
+    test_first_customer_wins_for_duplicate_keys()
+    test_rolled_back_customers_are_evicted()
+    print("All customer resolver tests passed")
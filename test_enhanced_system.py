@@ -4,6 +4,7 @@ Comprehensive test script for the enhanced MOT reminder system
 Tests all major functionality including database relationships, reminders, and API endpoints
 """
 
+import os
 import sqlite3
 import requests
 import json
@@ -11,7 +12,9 @@ from datetime import datetime, date, timedelta
 
 # Test configuration
 BASE_URL = "http://127.0.0.1:5000"
-DB_PATH = "instance/mot_reminder.db"
+# The app's SQLite database; under pytest, the throwaway one conftest.py sets up
+DATABASE_URL = os.environ.get('DATABASE_URL', '')
+DB_PATH = DATABASE_URL[len('sqlite:///'):] if DATABASE_URL.startswith('sqlite:///') else "instance/mot_reminder.db"
 
 def test_database_schema():
     """Test that all required tables and columns exist"""
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test the FTS5 work-history index and /api/search/work-history
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date
+
+os.environ.setdefault('DVLA_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('DVLA_CLIENT_SECRET', 'test-client-secret')
+os.environ.setdefault('DVLA_API_KEY', 'test-api-key')
+os.environ.setdefault('DVLA_TENANT_ID', 'test-tenant-id')
+# A throwaway database (the same file for every test module in the run), never the garage's own
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.gettempdir(), f'mot_reminder_test_{os.getpid()}.db'))
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import app
+from services.full_text_search import fts_query
+
+
+def test_fts_query_quotes_terms():
+    assert fts_query('brake pads') == '"brake" "pads"'
+    assert fts_query('cam* OR "belt"-') == '"cam"* "OR" "belt"'
+    assert fts_query(' -*- ') == ''
+
+
+def test_work_history_search_is_ranked_and_kept_in_sync():
+    from database import db
+    from models.job_sheet import JobSheet
+    from models.service import Service
+    from models.vehicle import Vehicle
+
+    with app.app.app_context():
+        client = app.app.test_client()
+        try:
+            vehicle = Vehicle(registration='FT01 AAA')
+            db.session.add(vehicle)
+            db.session.flush()
+            job_sheet = JobSheet(doc_id='FTSTEST1', doc_type='JS', doc_no='FT1', date_created=date(2024, 3, 1),
+                                 vehicle_reg='FT01 AAA', job_description='Replaced front brake pad set and discs')
+            service = Service(vehicle_id=vehicle.id, service_date=date(2024, 4, 1), service_type='MOT',
+                              description='Annual MOT', advisories='Rear brake pads wearing thin, cambelt due')
+            db.session.add_all([job_sheet, service])
+            db.session.commit()
+
+            data = client.get('/api/search/work-history?q=brake+pads').get_json()
+            hits = {(hit['source'], hit['id']): hit for hit in data['results']}
+            assert ('job_sheets', job_sheet.id) in hits
+            assert ('services', service.id) in hits
+            assert '<mark>pads</mark>' in hits[('services', service.id)]['snippet']
+            assert hits[('job_sheets', job_sheet.id)]['registration'] == 'FT01 AAA'
+            ranks = [hit['rank'] for hit in data['results']]
+            assert ranks == sorted(ranks)
+
+            data = client.get('/api/search/work-history?q=cambelt&source=services').get_json()
+            assert [(hit['source'], hit['id']) for hit in data['results']] == [('services', service.id)]
+
+            # The limit is clamped to 1..500; a negative one must not become SQLite's unlimited LIMIT -1
+            for limit in (0, -1):
+                data = client.get(f'/api/search/work-history?q=brake+pads&limit={limit}').get_json()
+                assert len(data['results']) == 1
+
+            # Updates and deletes reach the index through the triggers
+            job_sheet.job_description = 'Cambelt and water pump replaced'
+            db.session.delete(service)
+            db.session.commit()
+            data = client.get('/api/search/work-history?q=cambelt').get_json()
+            assert [(hit['source'], hit['id']) for hit in data['results']] == [('job_sheets', job_sheet.id)]
+            data = client.get('/api/search/work-history?q=cambelt&date_from=2024-03-02').get_json()
+            assert ('job_sheets', job_sheet.id) not in {(hit['source'], hit['id']) for hit in data['results']}
+
+            assert client.get('/api/search/work-history').status_code == 400
+            assert client.get('/api/search/work-history?q=brake&source=parts').status_code == 400
+        finally:
+            db.session.rollback()
+            Service.query.filter_by(vehicle_id=vehicle.id).delete(synchronize_session=False)
+            JobSheet.query.filter(JobSheet.doc_id.like('FTSTEST%')).delete(synchronize_session=False)
+            Vehicle.query.filter(Vehicle.registration.like('FT01%')).delete(synchronize_session=False)
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    test_fts_query_quotes_terms()
+    test_work_history_search_is_ranked_and_kept_in_sync()
+    print("All full-text search tests passed")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test the streaming CSV readers used by the file upload endpoints
+"""
+
+import io
+from datetime import datetime
+
+from openpyxl import Workbook
+
+from services.import_readers import (
+    MissingColumnsError, iter_chunks, iter_csv_rows, iter_frames, iter_upload_rows, sniff_encoding
+)
+
+
+def test_sniff_encoding():
+    assert sniff_encoding('Mrs Sheridan £30'.encode('utf-8')) == 'utf-8'
+    assert sniff_encoding(b'\xef\xbb\xbfRegistration') == 'utf-8-sig'
+    assert sniff_encoding('Mrs Sheridan £30'.encode('cp1252')) == 'cp1252'
+    # A multi-byte character cut off by the sample boundary is still UTF-8
+    assert sniff_encoding('£'.encode('utf-8')[:1]) == 'utf-8'
+
+
+def test_iter_csv_rows_normalises_headers_and_skips_comments():
+    content = (
+        '# exported from GA4\n'
+        'Registration,Make,Work Due,Customer\n'
+        'AB12 CDE, Ford ,01/02/2025,"Mr Scot Murphy t: m: 07950214811 e:"\n'
+        '\n'
+        'XY99 ZZZ,Vauxhall,15/03/2025,-\n'
+    ).encode('utf-8')
+    stream = io.BytesIO(content)
+
+    rows = list(iter_csv_rows(stream, normalise_headers=True, skip_comments=True))
+
+    assert rows == [
+        {'registration': 'AB12 CDE', 'make': 'Ford', 'work_due': '01/02/2025',
+         'customer': 'Mr Scot Murphy t: m: 07950214811 e:'},
+        {'registration': 'XY99 ZZZ', 'make': 'Vauxhall', 'work_due': '15/03/2025', 'customer': '-'},
+    ]
+    # The caller's stream is left open after the rows are consumed
+    assert not stream.closed
+
+
+def test_iter_csv_rows_required_columns():
+    stream = io.BytesIO(b'Reg No,Make\nAB12 CDE,Ford\n')
+    try:
+        list(iter_csv_rows(stream, normalise_headers=True, required_columns=('registration',)))
+        assert False, "A file without a registration column was read"
+    except MissingColumnsError as e:
+        assert e.columns == ['registration']
+        assert str(e) == 'Missing required column: registration'
+
+    # An empty file has no columns at all
+    try:
+        list(iter_csv_rows(io.BytesIO(b''), required_columns=('registration',)))
+        assert False, "An empty file was read"
+    except MissingColumnsError:
+        pass
+
+    stream = io.BytesIO(b'Registration,Make\n')
+    assert list(iter_csv_rows(stream, normalise_headers=True, required_columns=('registration',))) == []
+
+
+def test_iter_csv_rows_latin1_fallback():
+    stream = io.BytesIO('Customer Name,Total\nRené Dupont,£30\n'.encode('cp1252'))
+    rows = list(iter_csv_rows(stream))
+    assert rows == [{'Customer Name': 'René Dupont', 'Total': '£30'}]
+
+
+def test_iter_csv_rows_cp1252_after_the_sniffed_sample():
+    from services.import_readers import SNIFF_BYTES
+
+    filler = ''.join(f'AB{i:05d},Ford,£30\n' for i in range(SNIFF_BYTES // 14 + 10)).encode('utf-8')
+    assert len(filler) > SNIFF_BYTES
+    # A Windows-encoded row after a clean UTF-8 prefix, and a byte cp1252 leaves undefined
+    stream = io.BytesIO(b'Registration,Make,Note\n' + filler + 'ZZ99 ZZZ,Citroën,€5 £3'.encode('cp1252') + b'\x81\n')
+    rows = list(iter_csv_rows(stream))
+    assert rows[0] == {'Registration': 'AB00000', 'Make': 'Ford', 'Note': '£30'}
+    assert rows[-1] == {'Registration': 'ZZ99 ZZZ', 'Make': 'Citroën', 'Note': '€5 £3\x81'}
+    assert not any('\ufffd' in value for row in rows for value in row.values())
+
+
+def test_iter_chunks():
+    chunks = list(iter_chunks(iter(range(7)), 3))
+    assert chunks == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(iter_chunks([], 3)) == []
+
+
+def test_iter_upload_rows_streams_xlsx():
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append([])
+    sheet.append(['ID Doc', 'Doc No', 'Date Created', ' Vehicle Reg '])
+    sheet.append(['ABC', 12345, datetime(2024, 1, 15), ' ls18 zza '])
+    sheet.append([None, None, None, None])
+    sheet.append(['DEF', None, None, 'AB12CDE'])
+    stream = io.BytesIO()
+    workbook.save(stream)
+    stream.seek(0)
+
+    rows = list(iter_upload_rows('Documents.xlsx', stream))
+    assert rows == [
+        {'ID Doc': 'ABC', 'Doc No': 12345, 'Date Created': datetime(2024, 1, 15), 'Vehicle Reg': 'ls18 zza'},
+        {'ID Doc': 'DEF', 'Doc No': None, 'Date Created': None, 'Vehicle Reg': 'AB12CDE'},
+    ]
+
+    # Object columns keep integer IDs as they are
+    frames = list(iter_frames(rows, 1))
+    assert len(frames) == 2
+    assert frames[0]['Doc No'].tolist() == [12345]
+
+
+def test_iter_upload_rows_csv():
+    stream = io.BytesIO(b'Registration,Make\nAB12 CDE,Ford\n')
+    assert list(iter_upload_rows('vehicles.csv', stream)) == [{'Registration': 'AB12 CDE', 'Make': 'Ford'}]
+
+
+if __name__ == "__main__":
+    test_sniff_encoding()
+    test_iter_csv_rows_normalises_headers_and_skips_comments()
+    test_iter_csv_rows_required_columns()
+    test_iter_csv_rows_latin1_fallback()
+    test_iter_csv_rows_cp1252_after_the_sniffed_sample()
+    test_iter_chunks()
+    test_iter_upload_rows_streams_xlsx()
+    test_iter_upload_rows_csv()
+    print("All import reader tests passed")
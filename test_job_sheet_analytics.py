@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test SQL-aggregated job sheet analytics and the persisted is_mot flag
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date
+from decimal import Decimal
+
+os.environ.setdefault('DVLA_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('DVLA_CLIENT_SECRET', 'test-client-secret')
+os.environ.setdefault('DVLA_API_KEY', 'test-api-key')
+os.environ.setdefault('DVLA_TENANT_ID', 'test-tenant-id')
+# A throwaway database (the same file for every test module in the run), never the garage's own
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.gettempdir(), f'mot_reminder_test_{os.getpid()}.db'))
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import app
+
+
+def _job_sheet(doc_id, created, total, mot_gross=0, description='', paid=None, customer='', reg=''):
+    from models.job_sheet import JobSheet
+    return JobSheet(
+        doc_id=doc_id, doc_type='JS', doc_no=doc_id, date_created=created, date_paid=paid,
+        grand_total=Decimal(total), sub_mot_gross=Decimal(mot_gross), job_description=description,
+        customer_name=customer, vehicle_reg=reg,
+        is_mot=JobSheet.mot_flag(Decimal(mot_gross), description)
+    )
+
+
+def test_analytics_aggregates_in_sql():
+    from database import db
+    from models.job_sheet import JobSheet
+
+    with app.app.app_context():
+        db.session.add_all([
+            _job_sheet('ANTEST1', date(1999, 1, 4), '100.00', mot_gross='54.85', paid=date(1999, 1, 5),
+                       customer='A', reg='AN01 AAA'),
+            _job_sheet('ANTEST2', date(1999, 1, 20), '40.00', description='Annual mot test', customer='A'),
+            _job_sheet('ANTEST3', date(1999, 2, 1), '10.50', description='Tyres', customer='B', reg='AN01 BBB'),
+        ])
+        db.session.commit()
+        client = app.app.test_client()
+        try:
+            data = client.get('/api/job-sheets/analytics?date_from=1999-01-01&date_to=1999-12-31').get_json()
+            assert data['total_jobs'] == 3
+            assert data['total_revenue'] == 150.5
+            assert data['paid_jobs'] == 1
+            assert data['unpaid_jobs'] == 2
+            assert data['mot_jobs'] == 2
+            assert data['mot_revenue'] == 54.85
+            assert data['unique_customers'] == 2
+            assert data['unique_vehicles'] == 2
+
+            data = client.get('/api/job-sheets/analytics?date_from=1999-01-01&date_to=1999-12-31'
+                              '&bucket=month&mot_only=true').get_json()
+            assert data['total_jobs'] == 2
+            assert [(b['period'], b['total_jobs'], b['total_revenue']) for b in data['buckets']] == [
+                ('1999-01', 2, 140.0)
+            ]
+
+            assert client.get('/api/job-sheets/analytics?bucket=day').status_code == 400
+
+            # The MOT filter is served by the (is_mot, date_created) index
+            plan = db.session.execute(db.text(
+                "EXPLAIN QUERY PLAN SELECT count(*) FROM job_sheets "
+                "WHERE is_mot = 1 AND date_created >= '1999-01-01'"
+            )).all()
+            assert any('idx_job_sheets_mot_date' in row[-1] for row in plan)
+        finally:
+            db.session.rollback()
+            JobSheet.query.filter(JobSheet.doc_id.like('ANTEST%')).delete(synchronize_session=False)
+            db.session.commit()
+
+
+def test_mot_flag():
+    from models.job_sheet import JobSheet
+    assert JobSheet.mot_flag(Decimal('54.85'), '') is True
+    assert JobSheet.mot_flag(Decimal('0'), 'Class 4 MOT') is True
+    assert JobSheet.mot_flag(None, None) is False
+
+
+if __name__ == "__main__":
+    test_mot_flag()
+    test_analytics_aggregates_in_sql()
+    print("All job sheet analytics tests passed")
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Test the DataFrame-native job sheet ingestion engine
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date
+from decimal import Decimal
+
+import pandas as pd
+
+os.environ.setdefault('DVLA_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('DVLA_CLIENT_SECRET', 'test-client-secret')
+os.environ.setdefault('DVLA_API_KEY', 'test-api-key')
+os.environ.setdefault('DVLA_TENANT_ID', 'test-tenant-id')
+# A throwaway database (the same file for every test module in the run), never the garage's own
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.gettempdir(), f'mot_reminder_test_{os.getpid()}.db'))
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import app
+from services.job_sheet_ingest import ingest_job_sheet_frames, normalise_job_sheet_frame, upsert_job_sheets
+from services.job_sheet_schema import JOB_SHEET_FIELDS, JobSheetSchema
+
+GA4_FRAME = pd.DataFrame({
+    'ID Doc': ['JSINGEST01', 'JSINGEST02', 'JSINGEST03'],
+    'Doc No': ['1001', '1002', 'nan'],
+    'Date Created': ['15/01/2024', '2024-02-01', 'not a date'],
+    'ID Customer': ['JSINGESTACC', 'JSINGESTACC', ''],
+    'Customer Name': ['Lisa Renak', 'Lisa Renak', 'NULL'],
+    'Vehicle Reg': ['js18 ing', 'JS18 ING', ''],
+    'Mileage': ['45210.0', '', 'junk'],
+    'Sub MOT Gross': ['54.85', '', '£30'],
+    'Grand Total': ['216.00', '0.1', '12'],
+})
+
+
+def test_normalise_matches_row_extraction():
+    schema = JobSheetSchema(list(GA4_FRAME.columns))
+    normalised = normalise_job_sheet_frame(GA4_FRAME, schema)
+
+    assert normalised['date_created'].tolist() == [date(2024, 1, 15), date(2024, 2, 1), None]
+    assert normalised['sub_mot_gross'].tolist() == [Decimal('54.85'), Decimal('0'), Decimal('0')]
+    assert normalised['mileage'].tolist() == [45210, None, None]
+    assert normalised['doc_type'].tolist() == ['JS', 'JS', 'JS']
+    assert normalised['is_mot'].tolist() == [True, False, False]
+
+    for position, row in enumerate(GA4_FRAME.to_dict('records')):
+        expected = schema.extract_job_sheet(row)
+        actual = normalised.iloc[position]
+        for field in JOB_SHEET_FIELDS:
+            assert actual[field] == expected[field], field
+
+
+def test_ingest_creates_then_updates():
+    from database import db
+    from models.customer import Customer
+    from models.job_sheet import JobSheet
+    from models.vehicle import Vehicle
+
+    with app.app.app_context():
+        try:
+            results = ingest_job_sheet_frames([GA4_FRAME], chunk_size=2)
+            assert results['processed'] == 3
+            assert results['created'] == 3
+            assert results['customers_created'] == 1
+            assert results['vehicles_created'] == 1
+            assert results['linked_vehicles'] == 2
+            assert [(c['chunk'], c['created']) for c in results['chunks']] == [(1, 2), (2, 1)]
+
+            customer = Customer.query.filter_by(account='JSINGESTACC').one()
+            vehicle = Vehicle.query.filter_by(registration='JS18 ING').one()
+            assert vehicle.customer_id == customer.id
+
+            job_sheet = JobSheet.query.filter_by(doc_id='JSINGEST01').one()
+            assert job_sheet.linked_customer_id == customer.id
+            assert job_sheet.linked_vehicle_id == vehicle.id
+            assert float(job_sheet.grand_total) == 216.0
+
+            # Re-importing the same documents updates them in place
+            results = ingest_job_sheet_frames([GA4_FRAME.assign(**{'Grand Total': '99.99'})])
+            assert results['created'] == 0
+            assert results['updated'] == 3
+            assert results['customers_created'] == 0
+            db.session.expire_all()
+            assert float(JobSheet.query.filter_by(doc_id='JSINGEST01').one().grand_total) == 99.99
+        finally:
+            db.session.rollback()
+            JobSheet.query.filter(JobSheet.doc_id.like('JSINGEST%')).delete(synchronize_session=False)
+            Vehicle.query.filter_by(registration='JS18 ING').delete(synchronize_session=False)
+            Customer.query.filter_by(account='JSINGESTACC').delete(synchronize_session=False)
+            db.session.commit()
+
+
+def test_upsert_isolates_bad_rows():
+    from datetime import datetime
+    from database import db
+    from models.job_sheet import JobSheet
+
+    normalised = normalise_job_sheet_frame(GA4_FRAME, JobSheetSchema(list(GA4_FRAME.columns)))
+    rows = []
+    for record in normalised.to_dict('records'):
+        row = {field: record[field] for field in JOB_SHEET_FIELDS}
+        row.update(linked_customer_id=None, linked_vehicle_id=None,
+                   created_at=datetime.utcnow(), updated_at=datetime.utcnow())
+        rows.append(row)
+    # doc_no is NOT NULL, so this row fails on its own
+    rows[1]['doc_no'] = None
+
+    with app.app.app_context():
+        try:
+            reports = upsert_job_sheets(rows, chunk_size=2)
+            assert [(r['chunk'], r['created'], r['updated'], len(r['errors'])) for r in reports] == [
+                (1, 1, 0, 1), (2, 1, 0, 0)
+            ]
+            assert 'JSINGEST02' in reports[0]['errors'][0]
+            assert JobSheet.query.filter(JobSheet.doc_id.like('JSINGEST%')).count() == 2
+
+            rows[1]['doc_no'] = '1002'
+            reports = upsert_job_sheets(rows, chunk_size=10)
+            assert (reports[0]['created'], reports[0]['updated'], reports[0]['errors']) == (1, 2, [])
+        finally:
+            db.session.rollback()
+            JobSheet.query.filter(JobSheet.doc_id.like('JSINGEST%')).delete(synchronize_session=False)
+            db.session.commit()
+
+
+def test_failed_chunk_customers_are_not_matched_later():
+    from database import db
+    from models.customer import Customer
+    from models.job_sheet import JobSheet
+    from services.job_sheet_ingest import JobSheetIngestor
+
+    class FailFirstChunk(JobSheetIngestor):
+        def _resolve_vehicles(self, records, customer_ids):
+            if not self.results['errors']:
+                raise RuntimeError('vehicle lookup failed')
+            return super()._resolve_vehicles(records, customer_ids)
+
+    frame = pd.DataFrame({
+        'ID Doc': ['JSINGEST11', 'JSINGEST12', 'JSINGEST13'],
+        'Doc No': ['2001', '2002', '2003'],
+        'Date Created': ['15/01/2024', '15/01/2024', '15/01/2024'],
+        'ID Customer': ['JSINGESTROLL', '', ''],
+        'Customer Name': ['Jsingest Rolledback', 'Jsingest Other', 'Jsingest Rolledback'],
+        'Grand Total': ['1', '2', '3'],
+    })
+    with app.app.app_context():
+        try:
+            ingestor = FailFirstChunk(chunk_size=2)
+            results = ingestor.ingest_frames([frame])
+            assert len(results['errors']) == 1 and results['processed'] == 1
+            assert results['field_mapping']['customer_account'] == 'ID Customer'
+            assert Customer.query.filter_by(account='JSINGESTROLL').count() == 0
+            # The customer created for the failed chunk was rolled back, so its id must not be matched
+            assert JobSheet.query.filter_by(doc_id='JSINGEST13').one().linked_customer_id is None
+        finally:
+            db.session.rollback()
+            JobSheet.query.filter(JobSheet.doc_id.like('JSINGEST%')).delete(synchronize_session=False)
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    test_normalise_matches_row_extraction()
+    test_ingest_creates_then_updates()
+    test_upsert_isolates_bad_rows()
+    test_failed_chunk_customers_are_not_matched_later()
+    print("All job sheet ingestion tests passed")
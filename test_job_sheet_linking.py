@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Test post-import DVLA lookup and linking scoped to an upload's registrations
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date
+
+os.environ.setdefault('DVLA_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('DVLA_CLIENT_SECRET', 'test-client-secret')
+os.environ.setdefault('DVLA_API_KEY', 'test-api-key')
+os.environ.setdefault('DVLA_TENANT_ID', 'test-tenant-id')
+# A throwaway database (the same file for every test module in the run), never the garage's own
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.gettempdir(), f'mot_reminder_test_{os.getpid()}.db'))
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import app
+
+
+def test_dvla_lookup_only_touches_upload_registrations():
+    import routes.vehicle
+    from database import db
+    from models.job_sheet import JobSheet
+    from models.vehicle import Vehicle
+    from routes.job_sheet import trigger_dvla_lookup_for_job_sheets
+
+    looked_up = []
+
+    def fake_lookup(registration):
+        looked_up.append(registration)
+        return {
+            'registrationNumber': registration.replace(' ', ''),
+            'make': 'FORD',
+            'yearOfManufacture': '2018',
+            'motExpiryDate': '2026-03-01'
+        }
+
+    with app.app.app_context():
+        original_lookup = routes.vehicle.dvla_api.get_vehicle_details
+        routes.vehicle.dvla_api.get_vehicle_details = fake_lookup
+        try:
+            db.session.add_all([
+                Vehicle(registration='LK01 NEW'),
+                Vehicle(registration='LK01 OLD', mot_expiry=date(2026, 1, 1)),
+                JobSheet(doc_id='LKTEST1', doc_type='JS', doc_no='1', vehicle_reg='LK01 NEW'),
+                JobSheet(doc_id='LKTEST2', doc_type='JS', doc_no='2', vehicle_reg='LK01 OLD'),
+                JobSheet(doc_id='LKTEST3', doc_type='JS', doc_no='3', vehicle_reg='LK01 DVL'),
+                # Not part of this upload, so left alone
+                JobSheet(doc_id='LKTEST4', doc_type='JS', doc_no='4', vehicle_reg='LK01 OUT'),
+            ])
+            db.session.commit()
+
+            results = trigger_dvla_lookup_for_job_sheets({'lk01 new', 'LK01 OLD', 'LK01 DVL', ''})
+
+            # The vehicle with an MOT expiry is not looked up again
+            assert sorted(looked_up) == ['LK01 DVL', 'LK01 NEW']
+            assert results['checked'] == 3
+            assert results['created'] == 1
+            assert results['updated'] == 1
+            assert results['linked'] == 3
+
+            vehicles = {v.registration: v for v in Vehicle.query.filter(Vehicle.registration.like('LK01%'))}
+            assert vehicles['LK01 NEW'].mot_expiry == date(2026, 3, 1)
+            assert vehicles['LK01 DVL'].year == 2018
+            linked = dict(db.session.query(JobSheet.doc_id, JobSheet.linked_vehicle_id)
+                          .filter(JobSheet.doc_id.like('LKTEST%')))
+            assert linked == {
+                'LKTEST1': vehicles['LK01 NEW'].id,
+                'LKTEST2': vehicles['LK01 OLD'].id,
+                'LKTEST3': vehicles['LK01 DVL'].id,
+                'LKTEST4': None,
+            }
+        finally:
+            routes.vehicle.dvla_api.get_vehicle_details = original_lookup
+            db.session.rollback()
+            JobSheet.query.filter(JobSheet.doc_id.like('LKTEST%')).delete(synchronize_session=False)
+            Vehicle.query.filter(Vehicle.registration.like('LK01%')).delete(synchronize_session=False)
+            db.session.commit()
+
+
+def test_link_data_links_by_exact_keys_then_fuzzy_name():
+    from database import db
+    from models.customer import Customer
+    from models.job_sheet import JobSheet
+    from models.vehicle import Vehicle
+
+    with app.app.app_context():
+        try:
+            by_account = Customer(name='LKNAME Someone Else', account='LKACC1')
+            by_name = Customer(name='LKNAME Exact Person')
+            by_fragment = Customer(name='LKNAME Fragment Holdings Ltd')
+            vehicle = Vehicle(registration='LK02 ABC')
+            db.session.add_all([by_account, by_name, by_fragment, vehicle])
+            db.session.flush()
+            db.session.add_all([
+                JobSheet(doc_id='LKDATA1', doc_type='JS', doc_no='1', customer_id_external='LKACC1',
+                         customer_name='LKNAME Exact Person', vehicle_reg='lk02abc'),
+                JobSheet(doc_id='LKDATA2', doc_type='JS', doc_no='2', customer_name='  lkname exact PERSON '),
+                JobSheet(doc_id='LKDATA3', doc_type='JS', doc_no='3', customer_name='LKNAME Fragment'),
+                JobSheet(doc_id='LKDATA4', doc_type='JS', doc_no='4', customer_name='LKNAME Nobody',
+                         vehicle_reg='LK02 ZZZ'),
+            ])
+            db.session.commit()
+
+            data = app.app.test_client().post('/api/job-sheets/link-data').get_json()
+
+            assert data['errors'] == []
+            assert data['customers_linked_by']['fuzzy_name'] >= 1
+            linked = {
+                doc_id: (customer_id, vehicle_id)
+                for doc_id, customer_id, vehicle_id in db.session.query(
+                    JobSheet.doc_id, JobSheet.linked_customer_id, JobSheet.linked_vehicle_id
+                ).filter(JobSheet.doc_id.like('LKDATA%'))
+            }
+            assert linked == {
+                # The account wins over the name
+                'LKDATA1': (by_account.id, vehicle.id),
+                'LKDATA2': (by_name.id, None),
+                'LKDATA3': (by_fragment.id, None),
+                'LKDATA4': (None, None),
+            }
+        finally:
+            db.session.rollback()
+            JobSheet.query.filter(JobSheet.doc_id.like('LKDATA%')).delete(synchronize_session=False)
+            Vehicle.query.filter(Vehicle.registration.like('LK02%')).delete(synchronize_session=False)
+            Customer.query.filter(Customer.name.like('LKNAME%')).delete(synchronize_session=False)
+            db.session.commit()
+
+
+def test_normalised_registration_is_set_on_write_and_indexed():
+    from database import db
+    from models.job_sheet import JobSheet
+    from models.vehicle import Vehicle, normalise_registration
+
+    assert normalise_registration(' lk03-abc ') == 'LK03ABC'
+    assert normalise_registration('  ') is None
+    assert normalise_registration(None) is None
+
+    with app.app.app_context():
+        try:
+            vehicle = Vehicle(registration='LK03 ABC')
+            job_sheet = JobSheet(doc_id='LKNORM1', doc_type='JS', doc_no='1', vehicle_reg='lk03abc')
+            db.session.add_all([vehicle, job_sheet])
+            db.session.commit()
+
+            assert vehicle.normalised_reg == job_sheet.normalised_reg == 'LK03ABC'
+            assert Vehicle.find_by_registration('lk03 a-b-c').id == vehicle.id
+            assert Vehicle.find_by_registration('') is None
+
+            vehicle.registration = 'LK03 ABD'
+            db.session.commit()
+            assert vehicle.normalised_reg == 'LK03ABD'
+
+            for table in ('vehicles', 'job_sheets'):
+                plan = db.session.execute(db.text(
+                    f"EXPLAIN QUERY PLAN SELECT id FROM {table} WHERE normalised_reg = 'LK03ABC'"
+                )).all()
+                assert any(f'idx_{table}_normalised_reg' in row[-1] for row in plan)
+        finally:
+            db.session.rollback()
+            JobSheet.query.filter(JobSheet.doc_id.like('LKNORM%')).delete(synchronize_session=False)
+            Vehicle.query.filter(Vehicle.registration.like('LK03%')).delete(synchronize_session=False)
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    test_dvla_lookup_only_touches_upload_registrations()
+    test_link_data_links_by_exact_keys_then_fuzzy_name()
+    test_normalised_registration_is_set_on_write_and_indexed()
+    print("All job sheet linking tests passed")
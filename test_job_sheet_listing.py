@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test keyset pagination and cached totals for /api/job-sheets
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date
+
+os.environ.setdefault('DVLA_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('DVLA_CLIENT_SECRET', 'test-client-secret')
+os.environ.setdefault('DVLA_API_KEY', 'test-api-key')
+os.environ.setdefault('DVLA_TENANT_ID', 'test-tenant-id')
+# A throwaway database (the same file for every test module in the run), never the garage's own
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.gettempdir(), f'mot_reminder_test_{os.getpid()}.db'))
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import app
+
+CUSTOMER = 'KSTEST Customer'
+
+
+def _job_sheet(number, created):
+    from models.job_sheet import JobSheet
+    return JobSheet(doc_id=f'KSTEST{number}', doc_type='JS', doc_no=str(number),
+                    date_created=created, customer_name=CUSTOMER)
+
+
+def test_cursor_pages_cover_every_row_once():
+    from database import db
+    from models.job_sheet import JobSheet
+    from services.job_sheet_listing import ApproximateCounts, job_sheet_counts
+
+    with app.app.app_context():
+        client = app.app.test_client()
+        try:
+            job_sheets = [
+                _job_sheet(1, date(2024, 1, 1)),
+                _job_sheet(2, date(2024, 3, 1)),
+                _job_sheet(3, date(2024, 3, 1)),
+                _job_sheet(4, None),
+                _job_sheet(5, date(2024, 2, 1)),
+                _job_sheet(6, None),
+                _job_sheet(7, date(2024, 3, 1)),
+            ]
+            db.session.add_all(job_sheets)
+            db.session.commit()
+            ids = {js.doc_id: js.id for js in job_sheets}
+
+            seen = []
+            cursor = None
+            pages = 0
+            while True:
+                url = f'/api/job-sheets/?customer_name={CUSTOMER}&per_page=3'
+                data = client.get(url + (f'&cursor={cursor}' if cursor else '')).get_json()
+                seen += [js['doc_id'] for js in data['job_sheets']]
+                pages += 1
+                assert data['total'] == 7
+                cursor = data['next_cursor']
+                assert data['has_more'] == (cursor is not None)
+                if cursor is None:
+                    break
+
+            # Newest first with ties broken by id, undated rows last
+            expected = sorted(
+                (js for js in job_sheets if js.date_created), key=lambda js: (js.date_created, js.id), reverse=True
+            ) + sorted((js for js in job_sheets if not js.date_created), key=lambda js: js.id, reverse=True)
+            assert seen == [js.doc_id for js in expected]
+            assert pages == 3
+
+            assert client.get('/api/job-sheets/?cursor=not-a-cursor').status_code == 400
+
+            # The dated range is read from the (date_created, id) index
+            plan = db.session.execute(db.text(
+                "EXPLAIN QUERY PLAN SELECT id FROM job_sheets WHERE date_created IS NOT NULL "
+                "AND (date_created, id) < ('2024-03-01', :id) ORDER BY date_created DESC, id DESC LIMIT 3"
+            ), {'id': ids['KSTEST7']}).all()
+            assert any('idx_job_sheets_date_id' in row[-1] for row in plan)
+            assert not any('TEMP B-TREE' in row[-1] for row in plan)
+
+            # Totals are served from the cache until refreshed
+            counts = ApproximateCounts(ttl_seconds=3600)
+            filters = {'customer_name': CUSTOMER}
+            assert counts.get(filters)[0] == 7
+            db.session.add(_job_sheet(8, date(2024, 4, 1)))
+            db.session.commit()
+            assert counts.get(filters)[0] == 7
+            assert counts.refresh(filters)[0] == 8
+        finally:
+            db.session.rollback()
+            JobSheet.query.filter(JobSheet.doc_id.like('KSTEST%')).delete(synchronize_session=False)
+            db.session.commit()
+            job_sheet_counts.clear()
+
+
+if __name__ == "__main__":
+    test_cursor_pages_cover_every_row_once()
+    print("All job sheet listing tests passed")
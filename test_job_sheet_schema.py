@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Test per-file column mapping resolution for job sheet imports
+"""
+
+from datetime import date
+from decimal import Decimal
+
+from services.job_sheet_schema import JobSheetSchema, clean_cell
+
+GA4_ROW = {
+    'ID Doc': 'F22A5CD403C3DC4780B499718DB165F4',
+    'Doc Type': 'JS',
+    'Doc No': '12345',
+    'Date Created': '15/01/2024',
+    'Date Issued': '16/01/2024',
+    'Date Paid': float('nan'),
+    'ID Customer': 'CUST001',
+    'Customer Name': 'Lisa Renak',
+    'Vehicle Reg': 'ls18 zza',
+    'Make': 'Ford',
+    'Mileage': '45210.0',
+    'Sub MOT Gross': '54.85',
+    'Grand Total': '216.00',
+    'Job Description': 'MOT and brake pads',
+}
+
+
+def test_schema_keeps_only_present_headers():
+    schema = JobSheetSchema(GA4_ROW.keys())
+    assert schema.columns['customer_name'] == ['Customer Name']
+    assert schema.columns['vin'] == []
+    assert schema.source_column('grand_total') == 'Grand Total'
+    assert 'vin' not in schema.describe()
+
+
+def test_extract_job_sheet():
+    data = JobSheetSchema.from_row(GA4_ROW).extract_job_sheet(GA4_ROW)
+    assert data['doc_id'] == 'F22A5CD403C3DC4780B499718DB165F4'
+    assert data['date_created'] == date(2024, 1, 15)
+    assert data['date_paid'] is None
+    assert data['customer_id_external'] == 'CUST001'
+    assert data['vehicle_reg'] == 'LS18 ZZA'
+    assert data['mileage'] == 45210
+    assert data['sub_mot_gross'] == Decimal('54.85')
+    assert data['sub_labour_net'] == Decimal('0')
+    assert data['vin'] == ''
+
+
+def test_blank_preferred_column_falls_back_to_next_candidate():
+    row = {'customer_name': 'nan', 'Customer Name': '  Lisa Renak ', 'doc_type': None}
+    schema = JobSheetSchema.from_row(row)
+    assert schema.get(row, 'customer_name') == 'Lisa Renak'
+    assert schema.get(row, 'doc_type', 'JS') == 'JS'
+
+
+def test_clean_cell():
+    assert clean_cell(None) == ''
+    assert clean_cell(float('nan')) == ''
+    assert clean_cell(' NULL ') == ''
+    assert clean_cell(42) == '42'
+
+
+if __name__ == "__main__":
+    test_schema_keeps_only_present_headers()
+    test_extract_job_sheet()
+    test_blank_preferred_column_falls_back_to_next_candidate()
+    test_clean_cell()
+    print("All job sheet schema tests passed")
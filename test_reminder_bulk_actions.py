@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Test that /api/reminders/bulk-action and /api/reminders/generate-batch change
+reminders with one statement per chunk of ids
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+os.environ.setdefault('DVLA_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('DVLA_CLIENT_SECRET', 'test-client-secret')
+os.environ.setdefault('DVLA_API_KEY', 'test-api-key')
+os.environ.setdefault('DVLA_TENANT_ID', 'test-tenant-id')
+# A throwaway database (the same file for every test module in the run), never the garage's own
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.gettempdir(), f'mot_reminder_test_{os.getpid()}.db'))
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import app
+from test_reminder_generation import count_queries
+
+# More than two chunks of ids
+COUNT = 1200
+
+
+def _statements(statements, verb):
+    return [s for s in statements if s.lstrip().upper().startswith(verb)]
+
+
+def _vehicles_with_reminders(db, count, status='scheduled'):
+    from sqlalchemy import insert, select
+    from models.reminder import Reminder
+    from models.vehicle import Vehicle
+
+    today = date.today()
+    db.session.execute(insert(Vehicle), [
+        {'registration': f'BATEST{index:05d}', 'mot_expiry': today + timedelta(days=index % 90)}
+        for index in range(count)
+    ])
+    vehicle_ids = db.session.scalars(
+        select(Vehicle.id).where(Vehicle.registration.like('BATEST%')).order_by(Vehicle.id)
+    ).all()
+    db.session.execute(insert(Reminder), [
+        {'vehicle_id': vehicle_id, 'reminder_date': today, 'status': status} for vehicle_id in vehicle_ids
+    ])
+    db.session.commit()
+    reminder_ids = db.session.scalars(
+        select(Reminder.id).where(Reminder.vehicle_id.in_(vehicle_ids[:500])).order_by(Reminder.id)
+    ).all()
+    reminder_ids += db.session.scalars(
+        select(Reminder.id).where(Reminder.vehicle_id.in_(vehicle_ids[500:])).order_by(Reminder.id)
+    ).all()
+    return vehicle_ids, reminder_ids
+
+
+def test_bulk_action_updates_in_chunks():
+    from database import db
+    from models.outbox import OutboxMessage
+    from models.reminder import Reminder
+
+    client = app.app.test_client()
+    with app.app.app_context():
+        try:
+            _, reminder_ids = _vehicles_with_reminders(db, COUNT)
+
+            statements, stop = count_queries(db.engine)
+            try:
+                response = client.post('/api/reminders/bulk-action',
+                                       json={'reminder_ids': reminder_ids + [-1], 'action': 'archive'})
+            finally:
+                stop()
+            assert response.status_code == 200
+            assert response.get_json()['processed_count'] == COUNT
+            assert len(_statements(statements, 'UPDATE')) == 3
+            assert not _statements(statements, 'SELECT')
+
+            db.session.expire_all()
+            archived = Reminder.query.filter(Reminder.id.in_(reminder_ids[:10]))
+            assert {(r.status, r.archived_at is not None) for r in archived} == {('archived', True)}
+
+            response = client.post('/api/reminders/bulk-action', json={'reminder_ids': reminder_ids[:5], 'action': 'send'})
+            assert response.get_json()['processed_count'] == 5
+            assert {r.status for r in Reminder.query.filter(Reminder.id.in_(reminder_ids[:5]))} == {'sent'}
+
+            # A queued reminder's pending outbox message is deleted with it
+            Reminder.query.filter(Reminder.id == reminder_ids[-1]).update({'status': 'queued'})
+            message = OutboxMessage(reminder_id=reminder_ids[-1], channel='email', recipient='batest@example.com',
+                                    body='x')
+            db.session.add(message)
+            db.session.commit()
+            message_id = message.id
+
+            response = client.post('/api/reminders/bulk-action', json={'reminder_ids': reminder_ids, 'action': 'delete'})
+            assert response.get_json()['processed_count'] == COUNT
+            assert Reminder.query.filter(Reminder.id.in_(reminder_ids[:500])).count() == 0
+            assert Reminder.query.filter(Reminder.id.in_(reminder_ids[-500:])).count() == 0
+            assert OutboxMessage.query.filter_by(id=message_id).count() == 0
+
+            response = client.post('/api/reminders/bulk-action', json={'reminder_ids': [1], 'action': 'explode'})
+            assert response.status_code == 400
+        finally:
+            _cleanup(db)
+
+
+def test_generate_batch_archives_active_reminders_and_creates_new_ones():
+    from database import db
+    from models.reminder import Reminder
+    from models.vehicle import Vehicle
+
+    client = app.app.test_client()
+    today = date.today()
+    with app.app.app_context():
+        try:
+            vehicle_ids, reminder_ids = _vehicles_with_reminders(db, COUNT, status='queued')
+            # An already archived reminder stays as it is
+            Reminder.query.filter(Reminder.id == reminder_ids[0]).update({'status': 'archived'})
+            no_expiry = Vehicle(registration='BATESTNONE')
+            db.session.add(no_expiry)
+            db.session.flush()
+            no_expiry_id = no_expiry.id
+            db.session.commit()
+
+            statements, stop = count_queries(db.engine)
+            try:
+                response = client.post('/api/reminders/generate-batch', json={
+                    'vehicle_ids': vehicle_ids + [no_expiry_id], 'batch_id': 'BATEST-BATCH'
+                })
+            finally:
+                stop()
+            body = response.get_json()
+            assert response.status_code == 200
+            assert (body['archived_count'], body['created_count']) == (COUNT - 1, COUNT)
+            assert len(_statements(statements, 'UPDATE')) == 3
+            assert len(_statements(statements, 'SELECT')) == 3
+
+            created = Reminder.query.filter_by(review_batch_id='BATEST-BATCH')
+            assert created.count() == COUNT
+            first = created.filter_by(vehicle_id=vehicle_ids[0]).one()
+            assert (first.status, first.reminder_date) == ('scheduled', today)
+            later = created.filter_by(vehicle_id=vehicle_ids[89]).one()
+            assert later.reminder_date == today + timedelta(days=89 - 30)
+            assert Reminder.query.filter(Reminder.id.in_(reminder_ids[:500]), Reminder.status != 'archived').count() == 0
+        finally:
+            _cleanup(db)
+
+
+def _cleanup(db):
+    from models.outbox import OutboxMessage
+    from models.reminder import Reminder
+    from models.vehicle import Vehicle
+
+    db.session.rollback()
+    OutboxMessage.query.filter_by(recipient='batest@example.com').delete(synchronize_session=False)
+    ids = [v.id for v in Vehicle.query.filter(Vehicle.registration.like('BATEST%'))]
+    for start in range(0, len(ids), 500):
+        Reminder.query.filter(Reminder.vehicle_id.in_(ids[start:start + 500])).delete(synchronize_session=False)
+    Vehicle.query.filter(Vehicle.registration.like('BATEST%')).delete(synchronize_session=False)
+    db.session.commit()
+
+
+if __name__ == "__main__":
+    test_bulk_action_updates_in_chunks()
+    test_generate_batch_archives_active_reminders_and_creates_new_ones()
+    print("All reminder bulk action tests passed")
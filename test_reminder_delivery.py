@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Test outbox-based reminder delivery against a local SMTP server
+"""
+
+import itertools
+import os
+import socket
+import sys
+import tempfile
+from datetime import date, datetime, timedelta, timezone
+
+os.environ.setdefault('DVLA_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('DVLA_CLIENT_SECRET', 'test-client-secret')
+os.environ.setdefault('DVLA_API_KEY', 'test-api-key')
+os.environ.setdefault('DVLA_TENANT_ID', 'test-tenant-id')
+# A throwaway database (the same file for every test module in the run), never the garage's own
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.gettempdir(), f'mot_reminder_test_{os.getpid()}.db'))
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import app
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+
+class RecordingHandler:
+    """Accepts mail except for addresses in `responses`, which get that SMTP reply"""
+
+    def __init__(self):
+        self.messages = []
+        self.logins = 0
+        self.responses = {}
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.responses:
+            return self.responses[address]
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append({'peer': session.peer, 'to': envelope.rcpt_tos, 'content': envelope.content})
+        return '250 Message accepted for delivery'
+
+    def authenticate(self, server, session, envelope, mechanism, auth_data):
+        self.logins += 1
+        return AuthResult(success=(auth_data.login, auth_data.password) == (b'garage', b'secret'))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(handler, port):
+    controller = Controller(handler, hostname='127.0.0.1', port=port,
+                            authenticator=handler.authenticate, auth_require_tls=False)
+    controller.start()
+    return controller
+
+
+_registrations = itertools.count()
+
+
+def _create_reminders(db, count, email='dltest@example.com'):
+    from models.customer import Customer
+    from models.reminder import Reminder
+    from models.vehicle import Vehicle
+
+    customer = Customer(name='DLTEST Customer', email=email)
+    db.session.add(customer)
+    db.session.flush()
+    vehicles = [
+        Vehicle(registration=f'DLTEST{next(_registrations):03d}', make='Ford', model='Focus',
+                mot_expiry=date.today() + timedelta(days=14), customer_id=customer.id)
+        for _ in range(count)
+    ]
+    db.session.add_all(vehicles)
+    db.session.flush()
+    reminders = [Reminder(vehicle_id=v.id, reminder_date=date.today(), status='scheduled') for v in vehicles]
+    db.session.add_all(reminders)
+    db.session.commit()
+    return reminders
+
+
+def _cleanup(db):
+    from models.customer import Customer
+    from models.outbox import OutboxMessage
+    from models.reminder import Reminder
+    from models.vehicle import Vehicle
+
+    db.session.rollback()
+    ids = [v.id for v in Vehicle.query.filter(Vehicle.registration.like('DLTEST%'))]
+    reminder_ids = [r.id for r in Reminder.query.filter(Reminder.vehicle_id.in_(ids))]
+    OutboxMessage.query.filter(OutboxMessage.reminder_id.in_(reminder_ids)).delete(synchronize_session=False)
+    Reminder.query.filter(Reminder.vehicle_id.in_(ids)).delete(synchronize_session=False)
+    Vehicle.query.filter(Vehicle.registration.like('DLTEST%')).delete(synchronize_session=False)
+    Customer.query.filter(Customer.name.like('DLTEST%')).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def test_drain_outbox_over_one_smtp_session():
+    from database import db
+    from models.outbox import OutboxMessage
+    from models.reminder import Reminder
+    from services.reminder_delivery import SMTPSession, drain_outbox, queue_reminders
+
+    handler = RecordingHandler()
+    port = free_port()
+    controller = start_server(handler, port)
+    session = SMTPSession('127.0.0.1', port, username='garage', password='secret',
+                          sender='garage@example.com', use_tls=False)
+    with app.app.app_context():
+        try:
+            reminders = _create_reminders(db, 25)
+            results = queue_reminders(reminders)
+            db.session.commit()
+            assert (results['reminders_queued'], results['emails_queued'], results['sms_queued']) == (25, 25, 0)
+
+            results = drain_outbox(session, batch_size=10)
+            assert results['sent'] >= 25 and results['failed'] == 0 and results['error'] is None
+            assert results['connections_opened'] == 1
+            assert handler.logins == 1
+            ours = [m for m in handler.messages if m['to'] == ['dltest@example.com']]
+            assert len(ours) == 25
+            assert len({m['peer'] for m in handler.messages}) == 1
+            assert b'Ford Focus (Registration: DLTEST000)' in ours[0]['content']
+
+            ids = [r.id for r in reminders]
+            assert {(r.status, r.email_status, r.sms_status) for r in Reminder.query.filter(Reminder.id.in_(ids))} == {
+                ('sent', 'sent', None)
+            }
+            assert {m.status for m in OutboxMessage.query.filter(OutboxMessage.reminder_id.in_(ids))} == {'sent'}
+
+            # The server goes away between drains; the session reconnects on the next send
+            controller.stop()
+            controller = start_server(handler, port)
+            more = _create_reminders(db, 3)
+            queue_reminders(more)
+            db.session.commit()
+            results = drain_outbox(session)
+            assert results['sent'] >= 3 and results['error'] is None
+            assert results['connections_opened'] == 1
+            assert session.connections_opened == 2
+        finally:
+            session.close()
+            controller.stop()
+            _cleanup(db)
+
+
+def test_drain_outbox_retries_and_failures():
+    from database import db
+    from models.outbox import OutboxMessage
+    from models.reminder import Reminder
+    from services.reminder_delivery import RETRY_BASE_DELAY, SMTPSession, drain_outbox, queue_reminders
+
+    handler = RecordingHandler()
+    handler.responses = {
+        'dltest-bounce@example.com': '550 No such user',
+        'dltest-busy@example.com': '451 Try again later',
+    }
+    port = free_port()
+    controller = start_server(handler, port)
+    with app.app.app_context():
+        try:
+            bounced = _create_reminders(db, 1, email='dltest-bounce@example.com')[0]
+            busy = _create_reminders(db, 1, email='dltest-busy@example.com')[0]
+            queue_reminders([bounced, busy])
+            db.session.commit()
+
+            now = datetime.now(timezone.utc) + timedelta(seconds=1)
+            session = SMTPSession('127.0.0.1', port, username='garage', password='secret', use_tls=False)
+            try:
+                drain_outbox(session, now=now)
+            finally:
+                session.close()
+
+            bounce_message = OutboxMessage.query.filter_by(reminder_id=bounced.id).one()
+            assert (bounce_message.status, bounce_message.attempts) == ('failed', 1)
+            assert '550' in bounce_message.last_error
+            assert db.session.get(Reminder, bounced.id).status == 'failed'
+
+            busy_message = OutboxMessage.query.filter_by(reminder_id=busy.id).one()
+            assert (busy_message.status, busy_message.attempts) == ('pending', 1)
+            assert busy_message.next_attempt_at.replace(tzinfo=timezone.utc) == now + RETRY_BASE_DELAY
+            assert db.session.get(Reminder, busy.id).status == 'queued'
+
+            # Retried once due, and sent when the server accepts it
+            del handler.responses['dltest-busy@example.com']
+            session = SMTPSession('127.0.0.1', port, username='garage', password='secret', use_tls=False)
+            try:
+                drain_outbox(session, now=now + RETRY_BASE_DELAY)
+            finally:
+                session.close()
+            db.session.expire_all()
+            assert OutboxMessage.query.filter_by(reminder_id=busy.id).one().status == 'sent'
+            assert db.session.get(Reminder, busy.id).status == 'sent'
+        finally:
+            controller.stop()
+            _cleanup(db)
+
+
+def test_drain_outbox_leaves_messages_pending_when_server_unavailable():
+    from database import db
+    from models.outbox import OutboxMessage
+    from services.reminder_delivery import SMTPSession, drain_outbox, queue_reminders
+
+    with app.app.app_context():
+        try:
+            reminders = _create_reminders(db, 2)
+            queue_reminders(reminders)
+            db.session.commit()
+
+            session = SMTPSession('127.0.0.1', free_port(), use_tls=False, timeout=2)
+            results = drain_outbox(session)
+            assert results['error'] and results['sent'] == 0
+
+            messages = OutboxMessage.query.filter(OutboxMessage.reminder_id.in_([r.id for r in reminders])).all()
+            assert {(m.status, m.attempts) for m in messages} == {('pending', 0)}
+        finally:
+            _cleanup(db)
+
+
+if __name__ == "__main__":
+    test_drain_outbox_over_one_smtp_session()
+    test_drain_outbox_retries_and_failures()
+    test_drain_outbox_leaves_messages_pending_when_server_unavailable()
+    print("All reminder delivery tests passed")
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Test per-customer digest delivery of reminders
+"""
+
+import os
+import smtplib
+import sys
+import tempfile
+from datetime import date, timedelta
+
+os.environ.setdefault('DVLA_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('DVLA_CLIENT_SECRET', 'test-client-secret')
+os.environ.setdefault('DVLA_API_KEY', 'test-api-key')
+os.environ.setdefault('DVLA_TENANT_ID', 'test-tenant-id')
+# A throwaway database (the same file for every test module in the run), never the garage's own
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.gettempdir(), f'mot_reminder_test_{os.getpid()}.db'))
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import app
+from fake_sms_gateway import FakeSMSGateway
+
+# Far enough back that no other reminder in the test database is due as of this date
+TODAY = date(1991, 3, 1)
+
+
+class RecordingTransport:
+    """Email transport that keeps messages and refuses the addresses in `refused`"""
+
+    sender = 'garage@example.com'
+    connections_opened = 0
+
+    def __init__(self, refused=()):
+        self.refused = set(refused)
+        self.messages = []
+
+    def send(self, message):
+        if message['To'] in self.refused:
+            raise smtplib.SMTPRecipientsRefused({message['To']: (550, b'No such user')})
+        self.messages.append(message)
+
+    def close(self):
+        pass
+
+
+def _customer_with_reminders(db, name, email, phone, offsets):
+    """A customer with one vehicle and scheduled reminder per offset (days from TODAY)"""
+    from models.customer import Customer
+    from models.reminder import Reminder
+    from models.vehicle import Vehicle
+
+    customer = Customer(name=name, email=email, phone=phone)
+    db.session.add(customer)
+    db.session.flush()
+    reminders = []
+    for index, offset in enumerate(offsets):
+        vehicle = Vehicle(registration=f'{name.split()[0]}{index}', make='Ford', model='Transit',
+                          mot_expiry=TODAY + timedelta(days=offset + 30), customer_id=customer.id)
+        db.session.add(vehicle)
+        db.session.flush()
+        reminders.append(Reminder(vehicle_id=vehicle.id, reminder_date=TODAY + timedelta(days=offset),
+                                  status='scheduled'))
+    db.session.add_all(reminders)
+    db.session.commit()
+    return [reminder.id for reminder in reminders]
+
+
+def test_digest_groups_reminders_per_customer_and_channel():
+    from database import db
+    from models.outbox import OutboxMessage, OutboxMessageReminder
+    from models.reminder import Reminder
+    from services.reminder_delivery import drain_outbox, queue_due_reminders
+    from services.sms_dispatch import SMSGateway, drain_sms_outbox
+
+    fake = FakeSMSGateway().start()
+    fake.rejected_numbers = {'07700900001'}
+    gateway = SMSGateway(fake.url, 'test-key', 'Garage', bulk_size=10, rate_per_second=0)
+    with app.app.app_context():
+        try:
+            fleet = _customer_with_reminders(db, 'DGTESTA Fleet', 'fleet@example.com', '07700900001', [-1, 0, 5])
+            trade = _customer_with_reminders(db, 'DGTESTB Trade', 'trade@example.com', None, [0, 3])
+            later = _customer_with_reminders(db, 'DGTESTC Later', 'later@example.com', None, [3, 4])
+            single = _customer_with_reminders(db, 'DGTESTD Single', 'single@example.com', None, [0])
+            beyond = _customer_with_reminders(db, 'DGTESTE Beyond', 'beyond@example.com', None, [0, 20])
+
+            results = queue_due_reminders(TODAY, digest=True, digest_window_days=7)
+            db.session.commit()
+            assert results['reminders_queued'] == 3 + 2 + 1 + 1
+            assert (results['emails_queued'], results['sms_queued'], results['digests_queued']) == (4, 1, 3)
+
+            statuses = {r.id: r.status for r in Reminder.query.filter(Reminder.id.in_(fleet + trade + later + single + beyond))}
+            assert [statuses[i] for i in later] == ['scheduled', 'scheduled']
+            assert [statuses[i] for i in beyond] == ['queued', 'scheduled']
+            assert all(statuses[i] == 'queued' for i in fleet + trade + single)
+
+            links = {}
+            for link in OutboxMessageReminder.query.filter(OutboxMessageReminder.reminder_id.in_(fleet + trade)):
+                links.setdefault(link.message_id, set()).add(link.reminder_id)
+            digests = {m.id: m for m in OutboxMessage.query.filter(OutboxMessage.id.in_(links))}
+            fleet_email = next(m for m in digests.values() if m.recipient == 'fleet@example.com')
+            assert links[fleet_email.id] == set(fleet)
+            assert fleet_email.subject == 'MOT Reminder for 3 of your vehicles'
+            assert '- Ford Transit (DGTESTA2): MOT expires' in fleet_email.body
+            fleet_sms = next(m for m in digests.values() if m.channel == 'sms')
+            assert fleet_sms.body.startswith('MOT Reminder: 3 of your vehicles') and 'DGTESTA0 (' in fleet_sms.body
+            assert OutboxMessage.query.filter_by(reminder_id=single[0]).one().channel == 'email'
+
+            transport = RecordingTransport(refused={'trade@example.com'})
+            email_results = drain_outbox(transport)
+            assert email_results['sent'] >= 3 and email_results['failed'] >= 1
+            sms_results = drain_sms_outbox(gateway)
+            assert sms_results['failed'] >= 1
+
+            db.session.expire_all()
+            reminders = {r.id: r for r in Reminder.query.filter(Reminder.id.in_(fleet + trade + single))}
+            # The fleet's email digest went out though its SMS digest was rejected
+            assert {(reminders[i].status, reminders[i].email_status, reminders[i].sms_status) for i in fleet} == {
+                ('sent', 'sent', 'failed')
+            }
+            assert {(reminders[i].status, reminders[i].email_status) for i in trade} == {('failed', 'failed')}
+            assert reminders[single[0]].status == 'sent'
+
+            assert app.app.test_client().post('/api/reminders/process', json={'digest_window_days': 'x'}).status_code == 400
+        finally:
+            gateway.close()
+            fake.stop()
+            _cleanup(db)
+
+
+def test_digest_does_not_bring_forward_reminders_without_a_customer():
+    from database import db
+    from models.reminder import Reminder
+    from models.vehicle import Vehicle
+    from services.reminder_delivery import queue_due_reminders
+
+    with app.app.app_context():
+        try:
+            reminders = []
+            for index, offset in enumerate([0, 3]):
+                vehicle = Vehicle(registration=f'DGTESTN{index}', mot_expiry=TODAY + timedelta(days=offset + 30))
+                db.session.add(vehicle)
+                db.session.flush()
+                reminders.append(Reminder(vehicle_id=vehicle.id, reminder_date=TODAY + timedelta(days=offset),
+                                          status='scheduled'))
+            db.session.add_all(reminders)
+            db.session.commit()
+            due_id, later_id = [reminder.id for reminder in reminders]
+
+            queue_due_reminders(TODAY, digest=True, digest_window_days=7)
+            db.session.commit()
+
+            statuses = {r.id: r.status for r in Reminder.query.filter(Reminder.id.in_([due_id, later_id]))}
+            # The due one fails for want of a customer; the other waits for its own date
+            assert statuses == {due_id: 'failed', later_id: 'scheduled'}
+        finally:
+            _cleanup(db)
+
+
+def _cleanup(db):
+    from models.customer import Customer
+    from models.outbox import OutboxMessage, OutboxMessageReminder
+    from models.reminder import Reminder
+    from models.vehicle import Vehicle
+
+    db.session.rollback()
+    ids = [v.id for v in Vehicle.query.filter(Vehicle.registration.like('DGTEST%'))]
+    reminder_ids = [r.id for r in Reminder.query.filter(Reminder.vehicle_id.in_(ids))]
+    digest_ids = [link.message_id for link in OutboxMessageReminder.query.filter(
+        OutboxMessageReminder.reminder_id.in_(reminder_ids))]
+    OutboxMessageReminder.query.filter(OutboxMessageReminder.message_id.in_(digest_ids)).delete(synchronize_session=False)
+    OutboxMessage.query.filter(OutboxMessage.id.in_(digest_ids)).delete(synchronize_session=False)
+    OutboxMessage.query.filter(OutboxMessage.reminder_id.in_(reminder_ids)).delete(synchronize_session=False)
+    Reminder.query.filter(Reminder.vehicle_id.in_(ids)).delete(synchronize_session=False)
+    Vehicle.query.filter(Vehicle.registration.like('DGTEST%')).delete(synchronize_session=False)
+    Customer.query.filter(Customer.name.like('DGTEST%')).delete(synchronize_session=False)
+    db.session.commit()
+
+
+if __name__ == "__main__":
+    test_digest_groups_reminders_per_customer_and_channel()
+    test_digest_does_not_bring_forward_reminders_without_a_customer()
+    print("All reminder digest tests passed")
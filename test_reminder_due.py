@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test that /api/reminders/due and /api/reminders/process load reminders with
+their vehicle, customer and service history in a constant number of queries
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+os.environ.setdefault('DVLA_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('DVLA_CLIENT_SECRET', 'test-client-secret')
+os.environ.setdefault('DVLA_API_KEY', 'test-api-key')
+os.environ.setdefault('DVLA_TENANT_ID', 'test-tenant-id')
+# A throwaway database (the same file for every test module in the run), never the garage's own
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.gettempdir(), f'mot_reminder_test_{os.getpid()}.db'))
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import app
+from test_reminder_generation import count_queries
+
+
+def _selects(statements):
+    return [s for s in statements if s.lstrip().upper().startswith('SELECT')]
+
+
+def test_due_and_process_query_counts():
+    from database import db
+    from models.customer import Customer
+    from models.outbox import OutboxMessage
+    from models.reminder import Reminder
+    from models.service import Service
+    from models.vehicle import Vehicle
+    from services.reminder_templates import CHANNELS, get_template
+
+    today = date.today()
+    with app.app.app_context():
+        try:
+            customer = Customer(name='DUETEST Customer', email='duetest@example.com')
+            db.session.add(customer)
+            db.session.flush()
+            vehicles = [
+                Vehicle(registration=f'DUETEST{i}', mot_expiry=today + timedelta(days=10), customer_id=customer.id)
+                for i in range(6)
+            ]
+            vehicles.append(Vehicle(registration='DUETEST NOC', mot_expiry=today + timedelta(days=10)))
+            db.session.add_all(vehicles)
+            db.session.flush()
+            for vehicle in vehicles[:3]:
+                db.session.add_all([
+                    Service(vehicle_id=vehicle.id, service_date=today - timedelta(days=90), service_type='Service', total_cost=100),
+                    Service(vehicle_id=vehicle.id, service_date=today - timedelta(days=30), service_type='MOT', total_cost=50),
+                ])
+            db.session.add_all([
+                Reminder(vehicle_id=vehicle.id, reminder_date=today - timedelta(days=1), status='scheduled')
+                for vehicle in vehicles
+            ])
+            db.session.commit()
+            db.session.expunge_all()
+
+            client = app.app.test_client()
+            statements, stop = count_queries(db.engine)
+            try:
+                response = client.get('/api/reminders/due')
+            finally:
+                stop()
+            assert response.status_code == 200
+            assert len(_selects(statements)) <= 2, statements
+
+            ours = {row['vehicle']['registration']: row for row in response.get_json()
+                    if row.get('vehicle', {}).get('registration', '').startswith('DUETEST')}
+            assert len(ours) == 7
+            assert ours['DUETEST0']['customer']['name'] == 'DUETEST Customer'
+            assert ours['DUETEST0']['vehicle']['service_history']['total_services'] == 2
+            assert ours['DUETEST0']['vehicle']['service_history']['total_spent'] == 150.0
+            assert ours['DUETEST5']['vehicle']['service_history']['total_services'] == 0
+            assert 'customer' not in ours['DUETEST NOC']
+
+            # Templates are cached once per process; load them outside the count
+            for channel in CHANNELS:
+                get_template(channel)
+            statements, stop = count_queries(db.engine)
+            try:
+                response = client.post('/api/reminders/process')
+            finally:
+                stop()
+            assert response.status_code == 200
+            assert len(_selects(statements)) <= 1, statements
+
+            statuses = {
+                vehicle.registration: reminder.status
+                for reminder, vehicle in db.session.query(Reminder, Vehicle)
+                .join(Vehicle, Vehicle.id == Reminder.vehicle_id)
+                .filter(Vehicle.registration.like('DUETEST%'))
+            }
+            assert statuses['DUETEST NOC'] == 'failed'
+            assert all(status == 'queued' for reg, status in statuses.items() if reg != 'DUETEST NOC')
+        finally:
+            db.session.rollback()
+            ids = [v.id for v in Vehicle.query.filter(Vehicle.registration.like('DUETEST%'))]
+            reminder_ids = [r.id for r in Reminder.query.filter(Reminder.vehicle_id.in_(ids))]
+            OutboxMessage.query.filter(OutboxMessage.reminder_id.in_(reminder_ids)).delete(synchronize_session=False)
+            Reminder.query.filter(Reminder.vehicle_id.in_(ids)).delete(synchronize_session=False)
+            Service.query.filter(Service.vehicle_id.in_(ids)).delete(synchronize_session=False)
+            Vehicle.query.filter(Vehicle.registration.like('DUETEST%')).delete(synchronize_session=False)
+            Customer.query.filter(Customer.name.like('DUETEST%')).delete(synchronize_session=False)
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    test_due_and_process_query_counts()
+    print("All due reminder tests passed")
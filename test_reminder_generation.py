@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test set-based reminder generation used after a vehicle CSV upload
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+os.environ.setdefault('DVLA_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('DVLA_CLIENT_SECRET', 'test-client-secret')
+os.environ.setdefault('DVLA_API_KEY', 'test-api-key')
+os.environ.setdefault('DVLA_TENANT_ID', 'test-tenant-id')
+# A throwaway database (the same file for every test module in the run), never the garage's own
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.gettempdir(), f'mot_reminder_test_{os.getpid()}.db'))
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import app
+from sqlalchemy import event
+
+
+def count_queries(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    return statements, lambda: event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def test_generate_reminders_for_vehicles():
+    from models.vehicle import Vehicle
+    from models.reminder import Reminder
+    from services.reminder_generation import generate_reminders_for_vehicles
+
+    today = date.today()
+    with app.app.app_context():
+        vehicles = [
+            Vehicle(registration='RGTEST01', mot_expiry=today + timedelta(days=45)),
+            Vehicle(registration='RGTEST02', mot_expiry=today - timedelta(days=3)),
+            Vehicle(registration='RGTEST03', mot_expiry=today + timedelta(days=200)),
+            Vehicle(registration='RGTEST04', mot_expiry=None),
+            Vehicle(registration='RGTEST05', mot_expiry=today + timedelta(days=10)),
+        ]
+        app.db.session.add_all(vehicles)
+        app.db.session.flush()
+        app.db.session.add(Reminder(vehicle_id=vehicles[4].id, reminder_date=today, status='scheduled'))
+        app.db.session.commit()
+        vehicle_ids = [v.id for v in vehicles]
+
+        try:
+            statements, stop = count_queries(app.db.engine)
+            try:
+                created = generate_reminders_for_vehicles(vehicle_ids + vehicle_ids, batch_id='rg_test', today=today)
+                app.db.session.commit()
+            finally:
+                stop()
+
+            assert created == 2
+            assert len(statements) <= 3, statements
+
+            reminders = Reminder.query.filter_by(review_batch_id='rg_test').order_by(Reminder.vehicle_id).all()
+            assert [r.vehicle_id for r in reminders] == vehicle_ids[:2]
+            assert reminders[0].reminder_date == today + timedelta(days=15)
+            assert reminders[1].reminder_date == today
+
+            # A second run finds the scheduled reminders and creates nothing
+            assert generate_reminders_for_vehicles(vehicle_ids, batch_id='rg_test', today=today) == 0
+        finally:
+            app.db.session.rollback()
+            Reminder.query.filter(Reminder.vehicle_id.in_(vehicle_ids)).delete(synchronize_session=False)
+            Vehicle.query.filter(Vehicle.id.in_(vehicle_ids)).delete(synchronize_session=False)
+            app.db.session.commit()
+
+
+if __name__ == "__main__":
+    test_generate_reminders_for_vehicles()
+    print("Reminder generation test passed")
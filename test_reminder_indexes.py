@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test the reminder indexes: the hot reminder queries are index searches, and
+the partial unique index keeps one scheduled reminder per vehicle
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+os.environ.setdefault('DVLA_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('DVLA_CLIENT_SECRET', 'test-client-secret')
+os.environ.setdefault('DVLA_API_KEY', 'test-api-key')
+os.environ.setdefault('DVLA_TENANT_ID', 'test-tenant-id')
+# A throwaway database (the same file for every test module in the run), never the garage's own
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.gettempdir(), f'mot_reminder_test_{os.getpid()}.db'))
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import app
+
+
+def query_plan(db, statement):
+    """The EXPLAIN QUERY PLAN details of a statement, one line per step"""
+    compiled = statement.compile(db.engine, compile_kwargs={'literal_binds': True, 'render_postcompile': True})
+    rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}').all()
+    return [row[-1] for row in rows]
+
+
+def test_reminder_queries_use_indexes():
+    from sqlalchemy import select
+    from database import db
+    from models.reminder import Reminder
+    from services.reminder_delivery import due_reminders_query
+    from services.reminder_reconciliation import ACTIVE_STATUSES
+
+    with app.app.app_context():
+        due = query_plan(db, due_reminders_query(date.today()).statement)
+        assert due[0] == 'SEARCH reminders USING INDEX idx_reminders_status_date (status=? AND reminder_date<?)', due
+
+        # What the reminder scheduler loads at startup
+        scheduled = query_plan(db, select(Reminder.id, Reminder.reminder_date)
+                               .where(Reminder.status == 'scheduled').order_by(Reminder.reminder_date))
+        assert scheduled == ['SEARCH reminders USING COVERING INDEX idx_reminders_status_date (status=?)'], scheduled
+
+        active = query_plan(db, select(Reminder.id).where(Reminder.vehicle_id == 1,
+                                                           Reminder.status.in_(ACTIVE_STATUSES)))
+        assert active == [
+            'SEARCH reminders USING COVERING INDEX idx_reminders_vehicle_status (vehicle_id=? AND status=?)'
+        ], active
+
+
+def test_one_scheduled_reminder_per_vehicle():
+    from sqlalchemy.exc import IntegrityError
+    from database import db
+    from models.reminder import Reminder
+    from models.vehicle import Vehicle
+    from services.reminder_generation import generate_reminders_for_vehicles, insert_scheduled_reminders
+
+    today = date.today()
+    client = app.app.test_client()
+    with app.app.app_context():
+        try:
+            vehicle = Vehicle(registration='IXTEST1', mot_expiry=today + timedelta(days=10))
+            db.session.add(vehicle)
+            db.session.commit()
+            vehicle_id = vehicle.id
+
+            assert generate_reminders_for_vehicles([vehicle_id], today=today) == 1
+            db.session.commit()
+            # The conflict is skipped by the insert, not found by a prior check
+            row = {'vehicle_id': vehicle_id, 'reminder_date': today, 'status': 'scheduled'}
+            assert insert_scheduled_reminders([row, row]) == 0
+            assert generate_reminders_for_vehicles([vehicle_id], today=today) == 0
+            db.session.commit()
+
+            # Other statuses are not limited
+            db.session.add_all([Reminder(vehicle_id=vehicle_id, reminder_date=today, status=status)
+                                for status in ('sent', 'archived', 'archived')])
+            db.session.commit()
+
+            db.session.add(Reminder(vehicle_id=vehicle_id, reminder_date=today, status='scheduled'))
+            try:
+                db.session.commit()
+                assert False, "A second scheduled reminder was stored"
+            except IntegrityError:
+                db.session.rollback()
+
+            response = client.post('/api/reminders/', json={'vehicle_id': vehicle_id,
+                                                            'reminder_date': today.isoformat()})
+            assert response.status_code == 409
+            archived = Reminder.query.filter_by(vehicle_id=vehicle_id, status='archived').first()
+            response = client.put(f'/api/reminders/{archived.id}', json={'status': 'scheduled'})
+            assert response.status_code == 409
+
+            assert Reminder.query.filter_by(vehicle_id=vehicle_id, status='scheduled').count() == 1
+        finally:
+            db.session.rollback()
+            ids = [v.id for v in Vehicle.query.filter(Vehicle.registration.like('IXTEST%'))]
+            Reminder.query.filter(Reminder.vehicle_id.in_(ids)).delete(synchronize_session=False)
+            Vehicle.query.filter(Vehicle.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    test_reminder_queries_use_indexes()
+    test_one_scheduled_reminder_per_vehicle()
+    print("All reminder index tests passed")
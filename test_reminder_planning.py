@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Test cache-first reminder planning behind /api/reminders/schedule
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+os.environ.setdefault('DVLA_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('DVLA_CLIENT_SECRET', 'test-client-secret')
+os.environ.setdefault('DVLA_API_KEY', 'test-api-key')
+os.environ.setdefault('DVLA_TENANT_ID', 'test-tenant-id')
+# A throwaway database (the same file for every test module in the run), never the garage's own
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.gettempdir(), f'mot_reminder_test_{os.getpid()}.db'))
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import app
+
+
+def test_plan_reminders_only_verifies_vehicles_near_threshold():
+    from database import db
+    from models.customer import Customer
+    from models.reminder import Reminder
+    from models.vehicle import Vehicle
+    from services.reminder_planning import plan_reminders
+
+    today = date.today()
+    dvla_expiries = {
+        'PLTEST NEAR': today + timedelta(days=360),  # renewed since last import
+        'PLTEST NONE': today + timedelta(days=10),
+    }
+    looked_up = []
+    active = {'now': 0, 'peak': 0}
+    lock = threading.Lock()
+
+    def fake_lookup(registration):
+        with lock:
+            looked_up.append(registration)
+            active['now'] += 1
+            active['peak'] = max(active['peak'], active['now'])
+        time.sleep(0.1)
+        with lock:
+            active['now'] -= 1
+        if registration not in dvla_expiries:
+            return None
+        return {'registrationNumber': registration, 'motExpiryDate': dvla_expiries[registration].isoformat()}
+
+    with app.app.app_context():
+        try:
+            customer = Customer(name='PLTEST Customer')
+            db.session.add(customer)
+            db.session.flush()
+            vehicles = {
+                'far': Vehicle(registration='PLTEST FAR', mot_expiry=today + timedelta(days=300)),
+                'near': Vehicle(registration='PLTEST NEAR', mot_expiry=today + timedelta(days=20)),
+                'none': Vehicle(registration='PLTEST NONE'),
+                'unknown': Vehicle(registration='PLTEST UNKNOWN'),  # DVLA has no MOT expiry for it
+                'fresh': Vehicle(registration='PLTEST FRESH', mot_expiry=today + timedelta(days=5),
+                                 dvla_verified_at=datetime.now(timezone.utc) - timedelta(hours=1)),
+            }
+            for vehicle in vehicles.values():
+                vehicle.customer_id = customer.id
+            db.session.add_all(vehicles.values())
+            db.session.flush()
+            db.session.add(Reminder(vehicle_id=vehicles['near'].id, reminder_date=today, status='scheduled'))
+            db.session.commit()
+
+            results = plan_reminders(fake_lookup, today=today, max_workers=4)
+
+            assert sorted(reg for reg in looked_up if reg.startswith('PLTEST')) == [
+                'PLTEST NEAR', 'PLTEST NONE', 'PLTEST UNKNOWN'
+            ]
+            assert active['peak'] >= 2
+            assert results['dvla_verified'] >= 2
+
+            db.session.expire_all()
+            assert vehicles['near'].mot_expiry == dvla_expiries['PLTEST NEAR']
+            assert vehicles['near'].dvla_verified_at is not None
+            assert vehicles['far'].dvla_verified_at is None
+
+            scheduled = {
+                reminder.vehicle_id for reminder in Reminder.query.filter(
+                    Reminder.vehicle_id.in_([v.id for v in vehicles.values()]), Reminder.status == 'scheduled'
+                )
+            }
+            # The renewed MOT loses its reminder; the two due vehicles gain one
+            assert scheduled == {vehicles['none'].id, vehicles['fresh'].id}
+
+            # Nothing is looked up again while the lookups are fresh, including the one that found nothing
+            looked_up.clear()
+            plan_reminders(fake_lookup, today=today, max_workers=4)
+            assert not [reg for reg in looked_up if reg.startswith('PLTEST')]
+
+            db.session.expire_all()
+            assert vehicles['unknown'].dvla_checked_at is not None and vehicles['unknown'].dvla_verified_at is None
+            vehicles['unknown'].dvla_checked_at = datetime.now(timezone.utc) - timedelta(hours=25)
+            db.session.commit()
+            plan_reminders(fake_lookup, today=today, max_workers=4)
+            assert [reg for reg in looked_up if reg.startswith('PLTEST')] == ['PLTEST UNKNOWN']
+        finally:
+            db.session.rollback()
+            ids = [v.id for v in Vehicle.query.filter(Vehicle.registration.like('PLTEST%'))]
+            Reminder.query.filter(Reminder.vehicle_id.in_(ids)).delete(synchronize_session=False)
+            Vehicle.query.filter(Vehicle.registration.like('PLTEST%')).delete(synchronize_session=False)
+            Customer.query.filter(Customer.name.like('PLTEST%')).delete(synchronize_session=False)
+            db.session.commit()
+
+
+def test_schedule_rejects_unknown_mode():
+    client = app.app.test_client()
+    assert client.post('/api/reminders/schedule', json={'mode': 'everything'}).status_code == 400
+    assert client.post('/api/reminders/schedule', json={'max_workers': 'many'}).status_code == 400
+
+
+if __name__ == "__main__":
+    test_plan_reminders_only_verifies_vehicles_near_threshold()
+    test_schedule_rejects_unknown_mode()
+    print("All reminder planning tests passed")
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Test the set-based reminder reconciliation engine and /api/reminders/reconcile
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+os.environ.setdefault('DVLA_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('DVLA_CLIENT_SECRET', 'test-client-secret')
+os.environ.setdefault('DVLA_API_KEY', 'test-api-key')
+os.environ.setdefault('DVLA_TENANT_ID', 'test-tenant-id')
+# A throwaway database (the same file for every test module in the run), never the garage's own
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.gettempdir(), f'mot_reminder_test_{os.getpid()}.db'))
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import app
+from test_reminder_generation import count_queries
+
+# Far enough back that no other vehicle in the test database is due as of this date
+AS_OF = date(1990, 6, 1)
+
+
+def _ours(rows):
+    return [row['registration'] for row in rows if row['registration'].startswith('RCTEST')]
+
+
+def test_reconcile_dry_run_then_apply():
+    from sqlalchemy import or_
+    from database import db
+    from models.customer import Customer
+    from models.outbox import OutboxMessage, OutboxMessageReminder
+    from models.reminder import Reminder
+    from models.vehicle import Vehicle
+    from services.reminder_reconciliation import reconcile_reminders
+
+    with app.app.app_context():
+        try:
+            customer = Customer(name='RCTEST Customer')
+            db.session.add(customer)
+            db.session.flush()
+            vehicles = {
+                'due': Vehicle(registration='RCTEST DUE', mot_expiry=AS_OF + timedelta(days=20), customer_id=customer.id),
+                'expired': Vehicle(registration='RCTEST EXP', mot_expiry=AS_OF - timedelta(days=3), customer_id=customer.id),
+                'renewed': Vehicle(registration='RCTEST REN', mot_expiry=AS_OF + timedelta(days=200), customer_id=customer.id),
+                'renewed_queued': Vehicle(registration='RCTEST RNQ', mot_expiry=AS_OF + timedelta(days=300),
+                                          customer_id=customer.id),
+                'covered': Vehicle(registration='RCTEST COV', mot_expiry=AS_OF + timedelta(days=5), customer_id=customer.id),
+                'no_customer': Vehicle(registration='RCTEST NOC', mot_expiry=AS_OF + timedelta(days=5)),
+            }
+            # Not reconciled below, so its reminder survives though its MOT is a year away
+            outside = Vehicle(registration='RCTEST OUT', mot_expiry=AS_OF + timedelta(days=365), customer_id=customer.id)
+            db.session.add_all([*vehicles.values(), outside])
+            db.session.flush()
+            covered = Reminder(vehicle_id=vehicles['covered'].id, reminder_date=AS_OF, status='scheduled')
+            queued = Reminder(vehicle_id=vehicles['renewed_queued'].id, reminder_date=AS_OF, status='queued')
+            db.session.add_all([
+                Reminder(vehicle_id=vehicles['renewed'].id, reminder_date=AS_OF, status='sent'), covered, queued,
+                Reminder(vehicle_id=outside.id, reminder_date=AS_OF, status='scheduled')
+            ])
+            db.session.flush()
+            # The queued reminder's pending email, a digest of it alone and a digest shared with another reminder
+            single = OutboxMessage(reminder_id=queued.id, channel='email', recipient='rctest@example.com', body='x')
+            sole_digest = OutboxMessage(channel='email', recipient='rctest@example.com', body='x',
+                                        digest_reminders=[OutboxMessageReminder(reminder_id=queued.id)])
+            shared_digest = OutboxMessage(channel='sms', recipient='07700900111', body='x', digest_reminders=[
+                OutboxMessageReminder(reminder_id=queued.id), OutboxMessageReminder(reminder_id=covered.id)
+            ])
+            db.session.add_all([single, sole_digest, shared_digest])
+            db.session.commit()
+            message_ids = [single.id, sole_digest.id, shared_digest.id]
+
+            # Only this test's vehicles are reconciled, whatever else the database holds
+            ours = [v.id for v in vehicles.values()]
+            diff = reconcile_reminders(today=AS_OF, dry_run=True, vehicle_ids=ours)
+            assert _ours(diff['to_create']) == ['RCTEST EXP', 'RCTEST DUE']
+            assert _ours(diff['to_remove']) == ['RCTEST REN', 'RCTEST RNQ']
+            assert Reminder.query.filter(Reminder.vehicle_id.in_([v.id for v in vehicles.values()])).count() == 3
+
+            statements, stop = count_queries(db.engine)
+            try:
+                results = reconcile_reminders(today=AS_OF, vehicle_ids=ours)
+                db.session.commit()
+            finally:
+                stop()
+            assert len([s for s in statements if not s.startswith(('SAVEPOINT', 'RELEASE'))]) <= 4, statements
+            assert results['reminders_created'] == len(diff['to_create'])
+            assert results['invalid_reminders_removed'] == len(diff['to_remove'])
+
+            active = {
+                reminder.vehicle_id for reminder in Reminder.query.filter(
+                    Reminder.vehicle_id.in_([v.id for v in vehicles.values()]),
+                    Reminder.status.in_(['scheduled', 'sent'])
+                )
+            }
+            assert active == {vehicles['due'].id, vehicles['expired'].id, vehicles['covered'].id}
+            assert Reminder.query.filter_by(vehicle_id=vehicles['due'].id).one().reminder_date == AS_OF
+
+            # The removed queued reminder leaves no outbox rows behind; the shared digest keeps its other reminder
+            assert Reminder.query.filter_by(vehicle_id=vehicles['renewed_queued'].id).count() == 0
+            assert [m.id for m in OutboxMessage.query.filter(OutboxMessage.id.in_(message_ids))] == [shared_digest.id]
+            assert [link.reminder_id for link in OutboxMessageReminder.query.filter(
+                OutboxMessageReminder.message_id.in_(message_ids))] == [covered.id]
+
+            assert Reminder.query.filter_by(vehicle_id=outside.id, status='scheduled').count() == 1
+
+            again = reconcile_reminders(today=AS_OF, vehicle_ids=ours)
+            assert (again['reminders_created'], again['invalid_reminders_removed']) == (0, 0)
+
+            client = app.app.test_client()
+            data = client.post('/api/reminders/reconcile', json={'date': '1990-06-01', 'window_days': 1,
+                                                                 'dry_run': True}).get_json()
+            assert _ours(data['to_remove']) == ['RCTEST COV', 'RCTEST DUE', 'RCTEST OUT']
+            assert client.post('/api/reminders/reconcile', json={'date': 'June'}).status_code == 400
+        finally:
+            db.session.rollback()
+            ids = [v.id for v in Vehicle.query.filter(Vehicle.registration.like('RCTEST%'))]
+            reminder_ids = [r.id for r in Reminder.query.filter(Reminder.vehicle_id.in_(ids))]
+            message_ids = [m.id for m in OutboxMessage.query.filter(OutboxMessage.recipient.in_(
+                ['rctest@example.com', '07700900111']))]
+            OutboxMessageReminder.query.filter(or_(
+                OutboxMessageReminder.reminder_id.in_(reminder_ids), OutboxMessageReminder.message_id.in_(message_ids)
+            )).delete(synchronize_session=False)
+            OutboxMessage.query.filter(OutboxMessage.id.in_(message_ids)).delete(synchronize_session=False)
+            Reminder.query.filter(Reminder.vehicle_id.in_(ids)).delete(synchronize_session=False)
+            Vehicle.query.filter(Vehicle.registration.like('RCTEST%')).delete(synchronize_session=False)
+            Customer.query.filter(Customer.name.like('RCTEST%')).delete(synchronize_session=False)
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    test_reconcile_dry_run_then_apply()
+    print("All reminder reconciliation tests passed")
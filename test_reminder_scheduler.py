@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Test the in-process reminder scheduler
+"""
+
+import os
+import sys
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+
+os.environ.setdefault('DVLA_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('DVLA_CLIENT_SECRET', 'test-client-secret')
+os.environ.setdefault('DVLA_API_KEY', 'test-api-key')
+os.environ.setdefault('DVLA_TENANT_ID', 'test-tenant-id')
+# A throwaway database (the same file for every test module in the run), never the garage's own
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.gettempdir(), f'mot_reminder_test_{os.getpid()}.db'))
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import app
+
+# Far enough back that no other reminder in the test database is due as of this date
+TODAY = date(1992, 1, 10)
+
+
+def _vehicle(db, registration):
+    from models.vehicle import Vehicle
+
+    vehicle = Vehicle(registration=registration, make='Ford', model='Fiesta', mot_expiry=TODAY + timedelta(days=30))
+    db.session.add(vehicle)
+    db.session.flush()
+    return vehicle
+
+
+def test_scheduler_loads_and_follows_committed_changes():
+    from sqlalchemy import insert
+    from database import db
+    from models.reminder import Reminder
+    from services.reminder_scheduler import ReminderScheduler
+
+    fired = []
+    scheduler = ReminderScheduler(app.app, deliver=fired.extend, send_hour=9)
+    with app.app.app_context():
+        try:
+            # One scheduled reminder per vehicle
+            vehicles = [_vehicle(db, f'SCHTEST1{index}') for index in range(6)]
+            overdue = Reminder(vehicle_id=vehicles[0].id, reminder_date=TODAY - timedelta(days=2), status='scheduled')
+            due = Reminder(vehicle_id=vehicles[1].id, reminder_date=TODAY, status='scheduled')
+            later = Reminder(vehicle_id=vehicles[2].id, reminder_date=TODAY + timedelta(days=3), status='scheduled')
+            sent = Reminder(vehicle_id=vehicles[1].id, reminder_date=TODAY, status='sent')
+            db.session.add_all([overdue, due, later, sent])
+            db.session.commit()
+
+            scheduler.load()
+            scheduler.attach()
+            assert scheduler.next_due() == datetime(1992, 1, 8, 9)
+
+            # Committed changes reach the scheduler; rolled back ones don't
+            added = Reminder(vehicle_id=vehicles[3].id, reminder_date=TODAY, status='scheduled')
+            db.session.add(added)
+            db.session.commit()
+            discarded = Reminder(vehicle_id=vehicles[4].id, reminder_date=TODAY, status='scheduled')
+            db.session.add(discarded)
+            db.session.flush()
+            discarded_id = discarded.id
+            db.session.rollback()
+            due.status = 'archived'
+            later.reminder_date = TODAY - timedelta(days=1)
+            db.session.commit()
+
+            # Not yet the send hour
+            assert scheduler.run_pending(datetime(1992, 1, 10, 8, 59)) == [overdue.id, later.id]
+            assert fired == [overdue.id, later.id]
+            assert scheduler.run_pending(datetime(1992, 1, 10, 9)) == [added.id]
+            assert due.id not in fired and discarded_id not in fired and sent.id not in fired
+
+            # Bulk statements carry no per-row events and make the scheduler reload
+            db.session.execute(insert(Reminder).values(vehicle_id=vehicles[5].id, reminder_date=TODAY, status='scheduled'))
+            db.session.commit()
+            assert scheduler._resync_requested
+            scheduler.load()
+            bulk_id = Reminder.query.filter_by(vehicle_id=vehicles[5].id).one().id
+            # The recorder left the fired reminders scheduled, so the reload picks them up again
+            assert sorted(scheduler.run_pending(datetime(1992, 1, 10, 9))) == sorted([overdue.id, later.id, added.id, bulk_id])
+        finally:
+            scheduler.detach()
+            _cleanup(db)
+
+
+def test_scheduler_thread_delivers_reminders_as_they_fall_due():
+    from database import db
+    from models.customer import Customer
+    from models.outbox import OutboxMessage
+    from models.reminder import Reminder
+    from services.reminder_scheduler import ReminderScheduler, deliver_due_reminders
+
+    ours = set()
+    delivered = threading.Event()
+
+    def deliver(reminder_ids):
+        deliver_due_reminders([i for i in reminder_ids if i in ours], today=TODAY)
+        if ours.intersection(reminder_ids):
+            delivered.set()
+
+    # The clock stands at the send hour, so a reminder due TODAY fires as soon as it is committed
+    scheduler = ReminderScheduler(app.app, deliver=deliver, send_hour=9, clock=lambda: datetime(1992, 1, 10, 9))
+    with app.app.app_context():
+        try:
+            scheduler.start()
+            customer = Customer(name='SCHTEST Customer', email='schtest@example.com')
+            db.session.add(customer)
+            vehicle = _vehicle(db, 'SCHTEST2')
+            vehicle.customer = customer
+            db.session.flush()
+            reminder = Reminder(vehicle_id=vehicle.id, reminder_date=TODAY, status='scheduled')
+            db.session.add(reminder)
+            db.session.flush()
+            ours.add(reminder.id)
+            db.session.commit()
+
+            assert delivered.wait(5)
+            db.session.expire_all()
+            assert db.session.get(Reminder, reminder.id).status == 'sent'
+            assert OutboxMessage.query.filter_by(reminder_id=reminder.id).one().status == 'sent'
+        finally:
+            scheduler.stop()
+            _cleanup(db)
+
+
+def _cleanup(db):
+    from models.customer import Customer
+    from models.outbox import OutboxMessage
+    from models.reminder import Reminder
+    from models.vehicle import Vehicle
+
+    db.session.rollback()
+    ids = [v.id for v in Vehicle.query.filter(Vehicle.registration.like('SCHTEST%'))]
+    reminder_ids = [r.id for r in Reminder.query.filter(Reminder.vehicle_id.in_(ids))]
+    OutboxMessage.query.filter(OutboxMessage.reminder_id.in_(reminder_ids)).delete(synchronize_session=False)
+    Reminder.query.filter(Reminder.vehicle_id.in_(ids)).delete(synchronize_session=False)
+    Vehicle.query.filter(Vehicle.registration.like('SCHTEST%')).delete(synchronize_session=False)
+    Customer.query.filter(Customer.name.like('SCHTEST%')).delete(synchronize_session=False)
+    db.session.commit()
+
+
+if __name__ == "__main__":
+    test_scheduler_loads_and_follows_committed_changes()
+    test_scheduler_thread_delivers_reminders_as_they_fall_due()
+    print("All reminder scheduler tests passed")
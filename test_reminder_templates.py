@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Test persisted, precompiled reminder templates and the /templates endpoints
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+os.environ.setdefault('DVLA_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('DVLA_CLIENT_SECRET', 'test-client-secret')
+os.environ.setdefault('DVLA_API_KEY', 'test-api-key')
+os.environ.setdefault('DVLA_TENANT_ID', 'test-tenant-id')
+# A throwaway database (the same file for every test module in the run), never the garage's own
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.gettempdir(), f'mot_reminder_test_{os.getpid()}.db'))
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import app
+
+VALUES = {
+    'customer_name': 'Jo Newton',
+    'vehicle_make': 'Ford',
+    'vehicle_model': 'Fiesta',
+    'vehicle_registration': 'AB12 CDE',
+    'mot_expiry_date': '01/12/2026',
+}
+
+
+def test_compile_template():
+    from services.reminder_service import ReminderService
+    from services.reminder_templates import DEFAULT_EMAIL_TEMPLATE, TemplateError, compile_template
+
+    compiled = compile_template(DEFAULT_EMAIL_TEMPLATE)
+    assert compiled.render(VALUES) == DEFAULT_EMAIL_TEMPLATE.format(**VALUES)
+    assert compile_template(DEFAULT_EMAIL_TEMPLATE) is compiled
+    assert compile_template('{vehicle_registration}').render(VALUES) == 'AB12 CDE'
+    assert compile_template('{{braces}} {customer_name}{vehicle_make}!').render(VALUES) == '{braces} Jo NewtonFord!'
+    assert compile_template('No placeholders').render(VALUES) == 'No placeholders'
+
+    for bad in ('Hello {name}', 'Due {mot_expiry_date:>12}', 'Hi {customer_name!r}', 'Oops }', '{vehicle.make}'):
+        try:
+            compile_template(bad)
+        except TemplateError:
+            continue
+        raise AssertionError(f"{bad!r} compiled")
+
+    message = ReminderService().format_reminder_message(
+        'Dear {customer_name}, {vehicle_registration}', {'registration': 'AB12 CDE'}, {'name': 'Jo'}
+    )
+    assert message == 'Dear Jo, AB12 CDE'
+
+
+def test_saved_templates_are_used_and_cache_invalidated():
+    from database import db
+    from models.customer import Customer
+    from models.outbox import OutboxMessage
+    from models.reminder import Reminder
+    from models.reminder_template import ReminderTemplate
+    from models.vehicle import Vehicle
+    from services.reminder_delivery import queue_reminders
+    from services.reminder_templates import DEFAULT_SMS_TEMPLATE, get_template
+
+    client = app.app.test_client()
+    with app.app.app_context():
+        try:
+            data = client.get('/api/reminders/templates/sms').get_json()
+            assert data == {'template': DEFAULT_SMS_TEMPLATE, 'subject': None, 'is_default': True}
+            assert get_template('sms') is get_template('sms')
+
+            response = client.post('/api/reminders/templates/sms', json={'template': 'MOT due {when}'})
+            assert response.status_code == 400 and '{when}' in response.get_json()['error']
+            assert client.post('/api/reminders/templates/sms', json={'template': ' '}).status_code == 400
+
+            cached = get_template('sms')
+            response = client.post('/api/reminders/templates/sms',
+                                   json={'template': 'TPLTEST {vehicle_registration} due {mot_expiry_date}'})
+            assert response.status_code == 200
+            assert get_template('sms') is not cached
+            assert client.get('/api/reminders/templates/sms').get_json()['is_default'] is False
+
+            response = client.post('/api/reminders/templates/email', json={
+                'template': 'Hello {customer_name}, TPLTEST', 'subject': 'TPLTEST {vehicle_registration}'
+            })
+            assert response.status_code == 200
+            assert client.get('/api/reminders/templates/email').get_json()['subject'] == 'TPLTEST {vehicle_registration}'
+
+            customer = Customer(name='TPLTEST Customer', email='tpltest@example.com', phone='07700900123')
+            db.session.add(customer)
+            db.session.flush()
+            vehicle = Vehicle(registration='TPLTEST1', mot_expiry=date(2026, 12, 1), customer_id=customer.id)
+            db.session.add(vehicle)
+            db.session.flush()
+            reminder = Reminder(vehicle_id=vehicle.id, reminder_date=date.today() - timedelta(days=1))
+            db.session.add(reminder)
+            db.session.flush()
+            queue_reminders([reminder])
+            db.session.commit()
+
+            messages = {m.channel: m for m in OutboxMessage.query.filter_by(reminder_id=reminder.id)}
+            assert messages['sms'].body == 'TPLTEST TPLTEST1 due 01/12/2026'
+            assert messages['email'].subject == 'TPLTEST TPLTEST1'
+            assert messages['email'].body == 'Hello TPLTEST Customer, TPLTEST'
+        finally:
+            db.session.rollback()
+            ids = [v.id for v in Vehicle.query.filter(Vehicle.registration.like('TPLTEST%'))]
+            reminder_ids = [r.id for r in Reminder.query.filter(Reminder.vehicle_id.in_(ids))]
+            OutboxMessage.query.filter(OutboxMessage.reminder_id.in_(reminder_ids)).delete(synchronize_session=False)
+            Reminder.query.filter(Reminder.vehicle_id.in_(ids)).delete(synchronize_session=False)
+            Vehicle.query.filter(Vehicle.registration.like('TPLTEST%')).delete(synchronize_session=False)
+            Customer.query.filter(Customer.name.like('TPLTEST%')).delete(synchronize_session=False)
+            for row in ReminderTemplate.query.all():
+                db.session.delete(row)
+            db.session.commit()
+            assert get_template('sms').saved is False
+
+
+if __name__ == "__main__":
+    test_compile_template()
+    test_saved_templates_are_used_and_cache_invalidated()
+    print("All reminder template tests passed")
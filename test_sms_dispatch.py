@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Test concurrent and bulk SMS dispatch against the fake SMS gateway
+"""
+
+import itertools
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+os.environ.setdefault('DVLA_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('DVLA_CLIENT_SECRET', 'test-client-secret')
+os.environ.setdefault('DVLA_API_KEY', 'test-api-key')
+os.environ.setdefault('DVLA_TENANT_ID', 'test-tenant-id')
+# A throwaway database (the same file for every test module in the run), never the garage's own
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.gettempdir(), f'mot_reminder_test_{os.getpid()}.db'))
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import app
+from fake_sms_gateway import FakeSMSGateway
+
+_registrations = itertools.count()
+
+
+def _queue(db, phones, email=None):
+    """One customer per phone number, each with a due reminder, queued for delivery"""
+    from models.customer import Customer
+    from models.reminder import Reminder
+    from models.vehicle import Vehicle
+    from services.reminder_delivery import queue_reminders
+
+    reminders = []
+    for phone in phones:
+        customer = Customer(name='SMSTEST Customer', phone=phone, email=email)
+        db.session.add(customer)
+        db.session.flush()
+        vehicle = Vehicle(registration=f'SMSTEST{next(_registrations):03d}', make='Vauxhall', model='Corsa',
+                          mot_expiry=date.today() + timedelta(days=14), customer_id=customer.id)
+        db.session.add(vehicle)
+        db.session.flush()
+        reminders.append(Reminder(vehicle_id=vehicle.id, reminder_date=date.today(), status='scheduled'))
+    db.session.add_all(reminders)
+    db.session.flush()
+    queue_reminders(reminders)
+    db.session.commit()
+    return [reminder.id for reminder in reminders]
+
+
+def _statuses(db, reminder_ids):
+    from models.reminder import Reminder
+
+    db.session.expire_all()
+    return {r.id: (r.status, r.sms_status) for r in Reminder.query.filter(Reminder.id.in_(reminder_ids))}
+
+
+def _cleanup(db):
+    from models.customer import Customer
+    from models.outbox import OutboxMessage
+    from models.reminder import Reminder
+    from models.vehicle import Vehicle
+
+    db.session.rollback()
+    ids = [v.id for v in Vehicle.query.filter(Vehicle.registration.like('SMSTEST%'))]
+    reminder_ids = [r.id for r in Reminder.query.filter(Reminder.vehicle_id.in_(ids))]
+    OutboxMessage.query.filter(OutboxMessage.reminder_id.in_(reminder_ids)).delete(synchronize_session=False)
+    Reminder.query.filter(Reminder.vehicle_id.in_(ids)).delete(synchronize_session=False)
+    Vehicle.query.filter(Vehicle.registration.like('SMSTEST%')).delete(synchronize_session=False)
+    Customer.query.filter(Customer.name.like('SMSTEST%')).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def test_concurrent_single_message_dispatch():
+    from database import db
+    from models.outbox import OutboxMessage
+    from services.sms_dispatch import SMSGateway, drain_sms_outbox
+
+    fake = FakeSMSGateway(latency=0.05).start()
+    fake.throttle_requests = 1
+    gateway = SMSGateway(fake.url, 'test-key', 'Garage', pool_size=4, rate_per_second=0)
+    with app.app.app_context():
+        try:
+            reminder_ids = _queue(db, [f'0770090{i:04d}' for i in range(12)])
+            results = drain_sms_outbox(gateway, max_workers=4)
+
+            assert results['sent'] >= 11 and results['failed'] == 0
+            assert results['retrying'] == 1
+            assert fake.peak_concurrency > 1
+            ours = [m for m in fake.messages if m['to'].startswith('0770090')]
+            assert len(ours) == 11
+            assert 'Vauxhall Corsa' in ours[0]['message'] and ours[0]['from'] == 'Garage'
+
+            statuses = _statuses(db, reminder_ids)
+            assert sorted(statuses.values()).count(('sent', 'sent')) == 11
+            assert sorted(statuses.values()).count(('queued', 'queued')) == 1
+            throttled = OutboxMessage.query.filter(
+                OutboxMessage.reminder_id.in_(reminder_ids), OutboxMessage.status == 'pending'
+            ).one()
+            assert throttled.attempts == 1 and '429' in throttled.last_error
+        finally:
+            gateway.close()
+            fake.stop()
+            _cleanup(db)
+
+
+def test_bulk_dispatch_records_per_message_status():
+    from database import db
+    from services.sms_dispatch import SMSGateway, drain_sms_outbox
+
+    fake = FakeSMSGateway().start()
+    fake.rejected_numbers = {'07700800003', '07700899999'}
+    gateway = SMSGateway(fake.url, 'test-key', 'Garage', bulk_size=5, rate_per_second=0)
+    with app.app.app_context():
+        try:
+            reminder_ids = _queue(db, [f'0770080{i:04d}' for i in range(12)])
+            # A customer with an email too keeps the reminder queued when the SMS is rejected
+            both_id = _queue(db, ['07700899999'], email='smstest@example.com')[0]
+
+            results = drain_sms_outbox(gateway)
+            assert (results['sent'], results['failed']) == (11, 2)
+            assert results['requests_made'] == fake.requests == 3
+
+            statuses = _statuses(db, reminder_ids + [both_id])
+            assert statuses[reminder_ids[3]] == ('failed', 'failed')
+            assert statuses[both_id] == ('queued', 'failed')
+            assert all(statuses[rid] == ('sent', 'sent') for i, rid in enumerate(reminder_ids) if i != 3)
+        finally:
+            gateway.close()
+            fake.stop()
+            _cleanup(db)
+
+
+def test_rate_limiter_spaces_requests():
+    from services.sms_dispatch import RateLimiter
+
+    limiter = RateLimiter(rate=20, burst=1)
+    start = time.monotonic()
+    for _ in range(11):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.45
+
+
+if __name__ == "__main__":
+    test_concurrent_single_message_dispatch()
+    test_bulk_dispatch_records_per_message_status()
+    test_rate_limiter_spaces_requests()
+    print("All SMS dispatch tests passed")